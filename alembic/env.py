@@ -5,7 +5,7 @@ from alembic import context
 from sqlalchemy import engine_from_config, pool
 
 from app.database import Base
-from app.models import Request, PhysicalRule, PhysicalRuleSource, PhysicalRuleDestination, Deficiency  # noqa: F401
+from app.models import Request, PhysicalRule, PhysicalRuleSource, PhysicalRuleDestination, Deficiency, EmbeddingCache, EmbeddingJob, EmbeddingOutbox, RuleSync, RuleChange, ReviewRun, SemanticMatch  # noqa: F401
 
 config = context.config
 
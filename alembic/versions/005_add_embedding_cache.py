@@ -0,0 +1,32 @@
+"""Add content-addressed embedding_cache
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Embeddings keyed by sha256(embedding_text) and model, shared by all rows with identical text
+    op.execute("""
+        CREATE TABLE embedding_cache (
+            text_hash VARCHAR(64) NOT NULL,
+            model VARCHAR(255) NOT NULL,
+            embedding vector(1024) NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (text_hash, model)
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS embedding_cache")
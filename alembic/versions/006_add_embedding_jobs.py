@@ -0,0 +1,55 @@
+"""Add embedding_jobs table
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "embedding_jobs",
+        sa.Column("job_id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="queued"),
+        sa.Column("phase", sa.String(20), nullable=False, server_default="requests"),
+        sa.Column("force", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("batch_size", sa.Integer(), nullable=True),
+        sa.Column("commit_every", sa.Integer(), nullable=False),
+        sa.Column("cancel_requested", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("last_request_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_rule_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total_requests", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total_rules", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("requests_generated", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("rules_generated", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("requests_skipped", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("rules_skipped", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("batches", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("batch_latency_ms_total", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("batch_latency_ms_max", sa.Float(), nullable=True),
+        sa.Column("cache_hits", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("cache_misses", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("run_started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("run_processed_offset", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("job_id"),
+    )
+    op.create_index("idx_embedding_jobs_status", "embedding_jobs", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_embedding_jobs_status", table_name="embedding_jobs")
+    op.drop_table("embedding_jobs")
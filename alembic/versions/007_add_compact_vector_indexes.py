@@ -0,0 +1,45 @@
+"""Replace full-precision HNSW indexes with halfvec and binary-quantized expression indexes
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Requires pgvector >= 0.7. The expressions must match app/services/vector_search.py.
+    for table in ("requests", "physical_rules"):
+        op.execute(
+            f"CREATE INDEX idx_{table}_embedding_halfvec ON {table} "
+            f"USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)"
+        )
+        op.execute(
+            f"CREATE INDEX idx_{table}_embedding_bit ON {table} "
+            f"USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)"
+        )
+
+    # Candidates come from the compact indexes and are re-ranked with exact distances,
+    # so the float32 graphs are no longer needed.
+    op.execute("DROP INDEX IF EXISTS idx_requests_embedding")
+    op.execute("DROP INDEX IF EXISTS idx_physical_rules_embedding")
+
+
+def downgrade() -> None:
+    op.execute(
+        "CREATE INDEX idx_requests_embedding ON requests USING hnsw (embedding vector_cosine_ops)"
+    )
+    op.execute(
+        "CREATE INDEX idx_physical_rules_embedding ON physical_rules USING hnsw (embedding vector_cosine_ops)"
+    )
+    for table in ("requests", "physical_rules"):
+        op.execute(f"DROP INDEX IF EXISTS idx_{table}_embedding_bit")
+        op.execute(f"DROP INDEX IF EXISTS idx_{table}_embedding_halfvec")
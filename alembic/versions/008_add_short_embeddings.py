@@ -0,0 +1,39 @@
+"""Add truncated embedding_short columns with HNSW indexes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match EMBEDDING_SHORT_DIMENSIONS
+SHORT_DIMENSIONS = 256
+
+
+def upgrade() -> None:
+    for table in ("requests", "physical_rules"):
+        op.execute(f"ALTER TABLE {table} ADD COLUMN embedding_short vector({SHORT_DIMENSIONS})")
+        # Backfill from the existing vectors: leading dimensions, re-normalized
+        op.execute(
+            f"UPDATE {table} SET embedding_short = "
+            f"l2_normalize(subvector(embedding, 1, {SHORT_DIMENSIONS}))::vector({SHORT_DIMENSIONS}) "
+            f"WHERE embedding IS NOT NULL"
+        )
+        op.execute(
+            f"CREATE INDEX idx_{table}_embedding_short ON {table} "
+            f"USING hnsw (embedding_short vector_cosine_ops)"
+        )
+
+
+def downgrade() -> None:
+    for table in ("requests", "physical_rules"):
+        op.execute(f"DROP INDEX IF EXISTS idx_{table}_embedding_short")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS embedding_short")
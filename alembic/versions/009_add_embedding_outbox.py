@@ -0,0 +1,62 @@
+"""Add embedding_outbox table
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One row per request / rule whose embedding is pending; written in the same
+    # transaction as the row itself and drained by app.embedding_worker.
+    op.execute("""
+        CREATE TABLE embedding_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            entity_type VARCHAR(20) NOT NULL,
+            entity_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            CONSTRAINT uq_embedding_outbox_entity UNIQUE (entity_type, entity_id)
+        )
+    """)
+    op.execute("CREATE INDEX idx_embedding_outbox_available ON embedding_outbox (available_at, id)")
+
+    # Wake idle workers once per inserting statement; NOTIFY is delivered on commit.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_embedding_outbox() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('embedding_outbox', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_embedding_outbox_notify
+        AFTER INSERT ON embedding_outbox
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_embedding_outbox()
+    """)
+
+    # Rows without an embedding at upgrade time are queued as well
+    op.execute("""
+        INSERT INTO embedding_outbox (entity_type, entity_id)
+        SELECT 'request', request_id FROM requests WHERE embedding IS NULL
+        UNION ALL
+        SELECT 'rule', rule_id FROM physical_rules WHERE embedding IS NULL
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_embedding_outbox_notify ON embedding_outbox")
+    op.execute("DROP FUNCTION IF EXISTS notify_embedding_outbox()")
+    op.execute("DROP TABLE IF EXISTS embedding_outbox")
@@ -0,0 +1,60 @@
+"""Add rule sync tables and content hashes
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # content_hash covers action, sources, destinations and ports; it is filled in
+    # on insert and lazily by the first sync of a device for older rows.
+    op.execute("ALTER TABLE physical_rules ADD COLUMN content_hash VARCHAR(64)")
+    op.execute("ALTER TABLE physical_rules ADD COLUMN updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()")
+    op.execute("CREATE INDEX idx_physical_rules_device_name ON physical_rules (firewall_device, rule_name)")
+
+    op.execute("""
+        CREATE TABLE rule_syncs (
+            sync_id SERIAL PRIMARY KEY,
+            firewall_devices TEXT[] NOT NULL,
+            rows_received INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            unchanged INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+
+    # One row per rule touched by a sync; rule_id is kept for deleted rules too
+    op.execute("""
+        CREATE TABLE rule_changes (
+            change_id BIGSERIAL PRIMARY KEY,
+            sync_id INTEGER NOT NULL REFERENCES rule_syncs(sync_id) ON DELETE CASCADE,
+            rule_id INTEGER NOT NULL,
+            firewall_device VARCHAR(255) NOT NULL,
+            rule_name VARCHAR(255) NOT NULL,
+            change_type VARCHAR(10) NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("CREATE INDEX idx_rule_changes_sync ON rule_changes (sync_id)")
+    op.execute("CREATE INDEX idx_rule_changes_rule ON rule_changes (rule_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS rule_changes")
+    op.execute("DROP TABLE IF EXISTS rule_syncs")
+    op.execute("DROP INDEX IF EXISTS idx_physical_rules_device_name")
+    op.execute("ALTER TABLE physical_rules DROP COLUMN IF EXISTS updated_at")
+    op.execute("ALTER TABLE physical_rules DROP COLUMN IF EXISTS content_hash")
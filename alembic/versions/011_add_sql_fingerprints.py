@@ -0,0 +1,191 @@
+"""Add SQL address canonicalization and fingerprints
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQL counterparts of app/services/address_canon.py; both must accept the same notations.
+    # Nested CASEs keep the casts behind the pattern checks (AND does not short-circuit).
+    op.execute(r"""
+        CREATE FUNCTION ipv4_to_bigint(ip TEXT) RETURNS BIGINT
+        LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+            SELECT CASE WHEN ip ~ '^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$' THEN
+                CASE WHEN split_part(ip, '.', 1)::int <= 255 AND split_part(ip, '.', 2)::int <= 255
+                      AND split_part(ip, '.', 3)::int <= 255 AND split_part(ip, '.', 4)::int <= 255 THEN
+                    split_part(ip, '.', 1)::bigint * 16777216 + split_part(ip, '.', 2)::bigint * 65536
+                    + split_part(ip, '.', 3)::bigint * 256 + split_part(ip, '.', 4)::bigint
+                END
+            END
+        $$
+    """)
+    op.execute(r"""
+        CREATE FUNCTION addr_range(address TEXT) RETURNS INT8RANGE
+        LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+        DECLARE
+            a TEXT := lower(btrim(address, E' \t\r\n'));
+            rest TEXT;
+            lo BIGINT;
+            hi BIGINT;
+            size BIGINT;
+        BEGIN
+            IF a IN ('any', '*', 'all') THEN
+                RETURN int8range(0, 4294967295, '[]');
+            END IF;
+            IF strpos(a, '/') > 0 THEN
+                rest := substr(a, strpos(a, '/') + 1);
+                lo := ipv4_to_bigint(split_part(a, '/', 1));
+                IF lo IS NULL OR rest !~ '^0*\d{1,2}$' THEN
+                    RETURN NULL;
+                END IF;
+                IF rest::int > 32 THEN
+                    RETURN NULL;
+                END IF;
+                size := 1::bigint << (32 - rest::int);
+                lo := lo - lo % size;
+                RETURN int8range(lo, lo + size - 1, '[]');
+            END IF;
+            IF strpos(a, '-') > 0 THEN
+                lo := ipv4_to_bigint(btrim(split_part(a, '-', 1)));
+                hi := ipv4_to_bigint(btrim(substr(a, strpos(a, '-') + 1)));
+                IF lo IS NULL OR hi IS NULL OR lo > hi THEN
+                    RETURN NULL;
+                END IF;
+                RETURN int8range(lo, hi, '[]');
+            END IF;
+            lo := ipv4_to_bigint(a);
+            RETURN CASE WHEN lo IS NULL THEN NULL ELSE int8range(lo, lo, '[]') END;
+        END
+        $$
+    """)
+    # op.execute() runs the SQL as text(): "\:" keeps ":tcp" from being read as a bind parameter
+    op.execute(r"""
+        CREATE FUNCTION port_range(port TEXT) RETURNS INT4RANGE
+        LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+        DECLARE
+            p TEXT := lower(btrim(port, E' \t\r\n'));
+            m TEXT[];
+            lo INT;
+            hi INT;
+        BEGIN
+            IF p IN ('any', '*', 'all') THEN
+                RETURN int4range(0, 65535, '[]');
+            END IF;
+            m := regexp_match(p, '^(?:(?\:tcp|udp)/)?(\d{1,5})(?:\s*-\s*(\d{1,5}))?$');
+            IF m IS NULL THEN
+                RETURN NULL;
+            END IF;
+            lo := m[1]::int;
+            hi := coalesce(m[2]::int, lo);
+            IF lo > hi OR hi > 65535 THEN
+                RETURN NULL;
+            END IF;
+            RETURN int4range(lo, hi, '[]');
+        END
+        $$
+    """)
+
+    # Canonical text of a list: merged multirange (range_agg merges overlapping and
+    # adjacent ranges) plus the sorted distinct tokens that did not parse.
+    op.execute(r"""
+        CREATE FUNCTION address_set_canon(addresses TEXT[]) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT coalesce(range_agg(r)::text, '{}') || '|'
+                || coalesce(string_agg(DISTINCT t, ',' ORDER BY t) FILTER (WHERE r IS NULL), '')
+            FROM (
+                SELECT addr_range(a) AS r, lower(btrim(a, E' \t\r\n')) COLLATE "C" AS t
+                FROM unnest(addresses) AS a
+            ) parsed
+        $$
+    """)
+    op.execute(r"""
+        CREATE FUNCTION port_set_canon(ports TEXT[]) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT coalesce(range_agg(r)::text, '{}') || '|'
+                || coalesce(string_agg(DISTINCT t, ',' ORDER BY t) FILTER (WHERE r IS NULL), '')
+            FROM (
+                SELECT port_range(p) AS r, lower(btrim(p, E' \t\r\n')) COLLATE "C" AS t
+                FROM unnest(ports) AS p
+            ) parsed
+        $$
+    """)
+    op.execute(r"""
+        CREATE FUNCTION access_fingerprint(sources TEXT[], destinations TEXT[], ports TEXT[]) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT md5(address_set_canon(sources) || '/' || address_set_canon(destinations) || '/' || port_set_canon(ports))
+        $$
+    """)
+    op.execute(r"""
+        CREATE FUNCTION request_fingerprint(request_json JSONB) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT access_fingerprint(
+                ARRAY(SELECT jsonb_array_elements_text(request_json -> 'sources')),
+                ARRAY(SELECT jsonb_array_elements_text(request_json -> 'destinations')),
+                ARRAY(SELECT jsonb_array_elements_text(request_json -> 'ports'))
+            )
+        $$
+    """)
+
+    # Aggregate sources and destinations in LATERAL subqueries instead of joining both,
+    # which multiplied every rule into sources x destinations rows before grouping.
+    op.execute("DROP VIEW physical_rules_view")
+    op.execute("""
+        CREATE VIEW physical_rules_view AS
+        SELECT
+            pr.rule_id,
+            pr.rule_name,
+            pr.firewall_device,
+            pr.ports,
+            pr.action,
+            pr.created_at,
+            s.sources,
+            d.destinations,
+            access_fingerprint(s.sources, d.destinations, pr.ports) AS fingerprint
+        FROM physical_rules pr
+        CROSS JOIN LATERAL (
+            SELECT array_agg(DISTINCT prs.address ORDER BY prs.address) AS sources
+            FROM physical_rule_sources prs WHERE prs.rule_id = pr.rule_id
+        ) s
+        CROSS JOIN LATERAL (
+            SELECT array_agg(DISTINCT prd.address ORDER BY prd.address) AS destinations
+            FROM physical_rule_destinations prd WHERE prd.rule_id = pr.rule_id
+        ) d
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW IF EXISTS physical_rules_view")
+    op.execute("""
+        CREATE VIEW physical_rules_view AS
+        SELECT
+            pr.rule_id,
+            pr.rule_name,
+            pr.firewall_device,
+            pr.ports,
+            pr.action,
+            pr.created_at,
+            array_agg(DISTINCT prs.address ORDER BY prs.address) AS sources,
+            array_agg(DISTINCT prd.address ORDER BY prd.address) AS destinations
+        FROM physical_rules pr
+        LEFT JOIN physical_rule_sources prs ON pr.rule_id = prs.rule_id
+        LEFT JOIN physical_rule_destinations prd ON pr.rule_id = prd.rule_id
+        GROUP BY pr.rule_id, pr.rule_name, pr.firewall_device, pr.ports, pr.action, pr.created_at
+    """)
+    op.execute("DROP FUNCTION IF EXISTS request_fingerprint(JSONB)")
+    op.execute("DROP FUNCTION IF EXISTS access_fingerprint(TEXT[], TEXT[], TEXT[])")
+    op.execute("DROP FUNCTION IF EXISTS port_set_canon(TEXT[])")
+    op.execute("DROP FUNCTION IF EXISTS address_set_canon(TEXT[])")
+    op.execute("DROP FUNCTION IF EXISTS port_range(TEXT)")
+    op.execute("DROP FUNCTION IF EXISTS addr_range(TEXT)")
+    op.execute("DROP FUNCTION IF EXISTS ipv4_to_bigint(TEXT)")
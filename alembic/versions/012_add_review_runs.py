@@ -0,0 +1,88 @@
+"""Add review runs, semantic matches and review fingerprints
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "012"
+down_revision: Union[str, None] = "011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One row per review; the watermark of the latest run of a type is where the next incremental run starts
+    op.execute("""
+        CREATE TABLE review_runs (
+            run_id SERIAL PRIMARY KEY,
+            review_type VARCHAR(20) NOT NULL,
+            mode VARCHAR(20) NOT NULL,
+            since TIMESTAMPTZ,
+            watermark TIMESTAMPTZ NOT NULL,
+            threshold_used DOUBLE PRECISION,
+            rules_evaluated INTEGER NOT NULL DEFAULT 0,
+            requests_evaluated INTEGER NOT NULL DEFAULT 0,
+            deficiencies_added INTEGER NOT NULL DEFAULT 0,
+            deficiencies_updated INTEGER NOT NULL DEFAULT 0,
+            deficiencies_retired INTEGER NOT NULL DEFAULT 0,
+            deficiency_count INTEGER NOT NULL DEFAULT 0,
+            elapsed_ms DOUBLE PRECISION,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("CREATE INDEX idx_review_runs_type ON review_runs (review_type, run_id DESC)")
+
+    # Matched side of the semantic review, so an incremental run knows each rule's previous best match
+    op.execute("""
+        CREATE TABLE semantic_matches (
+            rule_id INTEGER PRIMARY KEY,
+            request_id INTEGER NOT NULL,
+            similarity_score DOUBLE PRECISION NOT NULL,
+            match_type VARCHAR(20) NOT NULL,
+            threshold_used DOUBLE PRECISION NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("CREATE INDEX idx_semantic_matches_request ON semantic_matches (request_id)")
+    op.execute("CREATE INDEX idx_semantic_deficiencies_rule ON semantic_deficiencies (rule_id)")
+    op.execute("CREATE INDEX idx_semantic_deficiencies_request ON semantic_deficiencies (request_id)")
+    op.execute("CREATE INDEX idx_deficiencies_rule ON deficiencies (rule_id)")
+    op.execute("CREATE INDEX idx_deficiencies_request ON deficiencies (request_id)")
+
+    # Requests are never edited in place, so their fingerprint can simply be generated
+    op.execute("""
+        ALTER TABLE requests
+        ADD COLUMN fingerprint VARCHAR(32) GENERATED ALWAYS AS (request_fingerprint(request_json)) STORED
+    """)
+    op.execute("CREATE INDEX idx_requests_fingerprint ON requests (fingerprint)")
+    op.execute("CREATE INDEX idx_requests_updated_at ON requests (updated_at)")
+
+    # A rule's fingerprint depends on its child rows; the exact review stores the one it
+    # last evaluated, which is also the old value an incremental run needs after a change.
+    op.execute("ALTER TABLE physical_rules ADD COLUMN reviewed_fingerprint VARCHAR(32)")
+    op.execute("CREATE INDEX idx_physical_rules_reviewed_fingerprint ON physical_rules (reviewed_fingerprint)")
+    op.execute("CREATE INDEX idx_physical_rules_updated_at ON physical_rules (updated_at)")
+    op.execute("ALTER TABLE rule_changes ADD COLUMN reviewed_fingerprint VARCHAR(32)")
+    op.execute("CREATE INDEX idx_rule_changes_created_at ON rule_changes (created_at)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_rule_changes_created_at")
+    op.execute("ALTER TABLE rule_changes DROP COLUMN IF EXISTS reviewed_fingerprint")
+    op.execute("DROP INDEX IF EXISTS idx_physical_rules_updated_at")
+    op.execute("DROP INDEX IF EXISTS idx_physical_rules_reviewed_fingerprint")
+    op.execute("ALTER TABLE physical_rules DROP COLUMN IF EXISTS reviewed_fingerprint")
+    op.execute("DROP INDEX IF EXISTS idx_requests_updated_at")
+    op.execute("DROP INDEX IF EXISTS idx_requests_fingerprint")
+    op.execute("ALTER TABLE requests DROP COLUMN IF EXISTS fingerprint")
+    op.execute("DROP INDEX IF EXISTS idx_deficiencies_request")
+    op.execute("DROP INDEX IF EXISTS idx_deficiencies_rule")
+    op.execute("DROP INDEX IF EXISTS idx_semantic_deficiencies_request")
+    op.execute("DROP INDEX IF EXISTS idx_semantic_deficiencies_rule")
+    op.execute("DROP TABLE IF EXISTS semantic_matches")
+    op.execute("DROP TABLE IF EXISTS review_runs")
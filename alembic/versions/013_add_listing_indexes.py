@@ -0,0 +1,35 @@
+"""Add composite indexes for the keyset-paginated listings
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "013"
+down_revision: Union[str, None] = "012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index, table, columns): each filter column followed by the listing's keyset column, so a
+# filtered page is one index range scan that stops after `limit` rows
+_INDEXES = (
+    ("idx_physical_rules_device_id", "physical_rules", "firewall_device, rule_id"),
+    ("idx_physical_rules_action_id", "physical_rules", "action, rule_id"),
+    ("idx_requests_status_id", "requests", "status, request_id"),
+    ("idx_deficiencies_type_id", "deficiencies", "type, deficiency_id"),
+    ("idx_semantic_deficiencies_type_id", "semantic_deficiencies", "type, id"),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in _INDEXES:
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    for name, _, _ in reversed(_INDEXES):
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,47 @@
+"""Stamp embedding writes with a version for the vectorized review cache
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "014"
+down_revision: Union[str, None] = "013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_TABLES = ("requests", "physical_rules")
+
+
+def upgrade() -> None:
+    # Embedding writes do not touch updated_at; a version from one shared sequence does.
+    # count / max / sum of the versions then change with every insert, update or delete
+    # of an embedding, which is what the memory-mapped matrix cache is keyed on.
+    op.execute("CREATE SEQUENCE embedding_version_seq")
+    op.execute("""
+        CREATE FUNCTION stamp_embedding_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.embedding_version := nextval('embedding_version_seq');
+            RETURN NEW;
+        END
+        $$
+    """)
+    for table in _TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN embedding_version BIGINT")
+        op.execute(f"""
+            CREATE TRIGGER {table}_embedding_version
+            BEFORE INSERT OR UPDATE OF embedding ON {table}
+            FOR EACH ROW EXECUTE FUNCTION stamp_embedding_version()
+        """)
+
+
+def downgrade() -> None:
+    for table in reversed(_TABLES):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_embedding_version ON {table}")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS embedding_version")
+    op.execute("DROP FUNCTION IF EXISTS stamp_embedding_version()")
+    op.execute("DROP SEQUENCE IF EXISTS embedding_version_seq")
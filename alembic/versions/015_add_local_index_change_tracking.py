@@ -0,0 +1,87 @@
+"""Track embedding changes for the local ANN index refresh
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "015"
+down_revision: Union[str, None] = "014"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_TABLES = ("requests", "physical_rules")
+
+
+def upgrade() -> None:
+    # A refresh of the local ANN index asks for what committed since its last
+    # pg_snapshot. embedding_version cannot answer that: sequence values are
+    # drawn before commit, so a lower version can become visible after a higher
+    # one was read. The writing transaction's id can, with pg_visible_in_snapshot.
+    op.execute("""
+        CREATE FUNCTION stamp_embedding_xid() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.embedding_xid := pg_current_xact_id();
+            RETURN NEW;
+        END
+        $$
+    """)
+    # Deleted and cleared embeddings leave no row to stamp; they leave a tombstone
+    op.execute("""
+        CREATE TABLE embedding_tombstones (
+            table_name TEXT NOT NULL,
+            row_id INT NOT NULL,
+            xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+        )
+    """)
+    op.execute("CREATE INDEX idx_embedding_tombstones_xid ON embedding_tombstones (table_name, xid)")
+    # PL/pgSQL resolves OLD.<column> only in the branch that runs
+    op.execute("""
+        CREATE FUNCTION log_embedding_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'requests' THEN
+                INSERT INTO embedding_tombstones (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.request_id);
+            ELSE
+                INSERT INTO embedding_tombstones (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.rule_id);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    for table in _TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN embedding_xid XID8")
+        op.execute(f"""
+            CREATE TRIGGER {table}_embedding_xid
+            BEFORE INSERT OR UPDATE OF embedding ON {table}
+            FOR EACH ROW EXECUTE FUNCTION stamp_embedding_xid()
+        """)
+        op.execute(
+            f"CREATE INDEX idx_{table}_embedding_xid ON {table} (embedding_xid) WHERE embedding IS NOT NULL"
+        )
+        op.execute(f"""
+            CREATE TRIGGER {table}_embedding_deleted
+            AFTER DELETE ON {table}
+            FOR EACH ROW WHEN (OLD.embedding IS NOT NULL)
+            EXECUTE FUNCTION log_embedding_tombstone()
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_embedding_cleared
+            AFTER UPDATE OF embedding ON {table}
+            FOR EACH ROW WHEN (OLD.embedding IS NOT NULL AND NEW.embedding IS NULL)
+            EXECUTE FUNCTION log_embedding_tombstone()
+        """)
+
+
+def downgrade() -> None:
+    for table in reversed(_TABLES):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_embedding_cleared ON {table}")
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_embedding_deleted ON {table}")
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_embedding_xid ON {table}")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS embedding_xid")
+    op.execute("DROP FUNCTION IF EXISTS log_embedding_tombstone()")
+    op.execute("DROP TABLE IF EXISTS embedding_tombstones")
+    op.execute("DROP FUNCTION IF EXISTS stamp_embedding_xid()")
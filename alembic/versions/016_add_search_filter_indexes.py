@@ -0,0 +1,60 @@
+"""Add port ranges and a partial HNSW index for filtered vector search
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "016"
+down_revision: Union[str, None] = "015"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Canonical ports as a multirange (port_range from migration 011, unparsed tokens dropped), so
+    # the port filter is range containment: 443 is in 'any', '1-1024' and 'tcp/443'
+    op.execute(r"""
+        CREATE FUNCTION port_set_ranges(ports TEXT[]) RETURNS INT4MULTIRANGE
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT coalesce(range_agg(port_range(p)), '{}') FROM unnest(ports) AS p
+        $$
+    """)
+    op.execute(r"""
+        CREATE FUNCTION request_port_ranges(request_json JSONB) RETURNS INT4MULTIRANGE
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT port_set_ranges(ARRAY(SELECT jsonb_array_elements_text(request_json -> 'ports')))
+        $$
+    """)
+    op.execute("""
+        ALTER TABLE physical_rules
+        ADD COLUMN port_ranges INT4MULTIRANGE GENERATED ALWAYS AS (port_set_ranges(ports)) STORED
+    """)
+    op.execute("""
+        ALTER TABLE requests
+        ADD COLUMN port_ranges INT4MULTIRANGE GENERATED ALWAYS AS (request_port_ranges(request_json)) STORED
+    """)
+    op.execute("CREATE INDEX idx_physical_rules_port_ranges ON physical_rules USING gist (port_ranges)")
+    op.execute("CREATE INDEX idx_requests_port_ranges ON requests USING gist (port_ranges)")
+
+    # Filters on a small share of the rows get their own graph; a filtered scan of the
+    # full index would have to walk past most rows. Same expression as migration 007.
+    # Request status gets none: every request is 'pending' until something sets a status.
+    op.execute(
+        "CREATE INDEX idx_physical_rules_embedding_halfvec_deny ON physical_rules "
+        "USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops) WHERE action = 'deny'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_physical_rules_embedding_halfvec_deny")
+    op.execute("DROP INDEX IF EXISTS idx_requests_port_ranges")
+    op.execute("DROP INDEX IF EXISTS idx_physical_rules_port_ranges")
+    op.execute("ALTER TABLE requests DROP COLUMN IF EXISTS port_ranges")
+    op.execute("ALTER TABLE physical_rules DROP COLUMN IF EXISTS port_ranges")
+    op.execute("DROP FUNCTION IF EXISTS request_port_ranges(JSONB)")
+    op.execute("DROP FUNCTION IF EXISTS port_set_ranges(TEXT[])")
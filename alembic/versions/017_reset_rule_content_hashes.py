@@ -0,0 +1,27 @@
+"""Reset rule content hashes for the canonical hash
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "017"
+down_revision: Union[str, None] = "016"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # rule_content_hash now hashes canonical intervals instead of the raw strings. Stored
+    # hashes would all differ, so every rule would count as updated and lose its embedding
+    # on the next sync; NULL hashes are recomputed by that sync instead (_backfill_content_hashes).
+    op.execute("UPDATE physical_rules SET content_hash = NULL WHERE content_hash IS NOT NULL")
+
+
+def downgrade() -> None:
+    # The raw-string hashes are likewise recomputed by the next sync
+    op.execute("UPDATE physical_rules SET content_hash = NULL WHERE content_hash IS NOT NULL")
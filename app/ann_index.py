@@ -0,0 +1,65 @@
+"""Build or rebuild the local ANN index snapshots.
+
+    python -m app.ann_index                          # rules and requests, once
+    python -m app.ann_index --table rules
+    python -m app.ann_index --every 3600             # rebuild hourly until SIGINT / SIGTERM
+
+Each build writes a new generation into LOCAL_ANN_DIR and folds in the rows
+the workers were keeping in their delta; see app/services/local_ann_index.py.
+Prints one JSON line per table built.
+"""
+import argparse
+import json
+import signal
+import time
+
+from app.database import SessionLocal
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import local_ann_index
+
+TABLES = {"rules": PhysicalRule, "requests": Request}
+
+# Granularity of the wait between rebuilds, so a stop signal is honoured promptly
+_WAIT_SLICE_SECONDS = 1.0
+
+
+class _Stop:
+    requested = False
+
+    def __call__(self, signum, frame) -> None:
+        self.requested = True
+
+
+def _build(tables: list[str]) -> None:
+    for name in tables:
+        db = SessionLocal()
+        try:
+            print(json.dumps(local_ann_index.build(db, TABLES[name])), flush=True)
+        finally:
+            db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the local ANN index snapshots.")
+    parser.add_argument("--table", choices=tuple(TABLES), action="append", help="Table to build (default: both)")
+    parser.add_argument("--every", type=float, default=None, help="Rebuild every N seconds until stopped")
+    args = parser.parse_args()
+    tables = args.table or list(TABLES)
+
+    if args.every is None:
+        _build(tables)
+        return
+
+    stop = _Stop()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stop.requested:
+        _build(tables)
+        deadline = time.monotonic() + args.every
+        while not stop.requested and time.monotonic() < deadline:
+            time.sleep(_WAIT_SLICE_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Embedding outbox worker.
+
+Drains embedding_outbox in batches and then sleeps on LISTEN embedding_outbox
+until new rows are queued. Any number of workers can run side by side; entries
+are claimed with FOR UPDATE SKIP LOCKED.
+
+    python -m app.embedding_worker            # run until SIGINT / SIGTERM
+    python -m app.embedding_worker --once     # drain the outbox and exit
+"""
+import argparse
+import logging
+import select
+import signal
+import time
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services import embedding_outbox_service
+
+logger = logging.getLogger("app.embedding_worker")
+
+# Granularity of the idle wait, so a stop signal is honoured promptly
+_WAIT_SLICE_SECONDS = 1.0
+
+
+class _Stop:
+    requested = False
+
+    def __call__(self, signum, frame) -> None:
+        self.requested = True
+
+
+def _drain(batch_size: int | None) -> None:
+    db = SessionLocal()
+    try:
+        totals = embedding_outbox_service.drain(db, batch_size)
+    finally:
+        db.close()
+    if totals["claimed"]:
+        logger.info(
+            "embedded %d, missing %d, failed %d",
+            totals["embedded"], totals["missing"], totals["failed"],
+        )
+
+
+def run(batch_size: int | None = None, once: bool = False) -> None:
+    stop = _Stop()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    listener = engine.raw_connection()
+    # Keep the autocommit LISTEN connection out of the pool
+    listener.detach()
+    try:
+        conn = listener.dbapi_connection
+        conn.autocommit = True
+        # LISTEN before the first drain so no notification between the two is lost
+        conn.cursor().execute(f"LISTEN {embedding_outbox_service.OUTBOX_CHANNEL}")
+
+        while not stop.requested:
+            _drain(batch_size)
+            if once:
+                return
+            # Sleep until notified; wake up every EMBEDDING_OUTBOX_POLL_SECONDS anyway
+            # to pick up entries whose retry backoff has elapsed.
+            deadline = time.monotonic() + settings.EMBEDDING_OUTBOX_POLL_SECONDS
+            while not stop.requested and time.monotonic() < deadline:
+                readable, _, _ = select.select([conn], [], [], _WAIT_SLICE_SECONDS)
+                if readable:
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        break
+    finally:
+        listener.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drain the embedding outbox.")
+    parser.add_argument("--batch-size", type=int, default=None, help="Entries per batch (default EMBEDDING_OUTBOX_BATCH_SIZE)")
+    parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    run(args.batch_size, args.once)
+
+
+if __name__ == "__main__":
+    main()
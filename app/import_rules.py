@@ -0,0 +1,73 @@
+"""Stream-import physical rules from firewall configuration exports.
+
+    python -m app.import_rules rules.csv --firewall-device FW-CORE-01
+    python -m app.import_rules export.jsonl.gz --defer-embedding
+    python -m app.import_rules fw-core-01.csv --firewall-device FW-CORE-01 --sync
+
+CSV and JSON-lines files (optionally gzip-compressed) are read with constant
+memory and written in COPY batches; see app/services/rule_import_service.py.
+"""
+import argparse
+import gzip
+import json
+import sys
+
+from app.database import SessionLocal
+from app.services import rule_import_service
+
+
+def _open(path: str):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _print_progress(counters: dict) -> None:
+    print(
+        f"\r{counters['rows_imported']:>10} imported  {counters['rows_rejected']:>7} rejected  "
+        f"{counters['rows_per_second'] or 0:>10.0f} rows/s",
+        end="",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import physical rules from a CSV or JSON-lines export.")
+    parser.add_argument("path", help="Export file (.csv, .jsonl, .ndjson, optionally .gz) or - for stdin")
+    parser.add_argument("--format", choices=rule_import_service.FORMATS, help="Defaults to the file extension")
+    parser.add_argument("--firewall-device", help="Device name for exports without a firewall_device column")
+    parser.add_argument("--defer-embedding", action="store_true", help="Leave embeddings to an embedding job")
+    parser.add_argument("--batch-size", type=int, default=None, help="Rules per COPY batch (default BULK_INGEST_CHUNK_SIZE)")
+    parser.add_argument("--sync", action="store_true", help="Treat the file as the complete rule set of its devices and apply only the differences")
+    parser.add_argument("--strict", action="store_true", help="Abort on the first invalid row")
+    args = parser.parse_args()
+
+    fmt = args.format or rule_import_service.detect_format(args.path)
+    db = SessionLocal()
+    try:
+        with _open(args.path) as stream:
+            result = rule_import_service.import_rules(
+                db,
+                stream,
+                fmt,
+                firewall_device=args.firewall_device,
+                defer_embedding=args.defer_embedding,
+                batch_size=args.batch_size,
+                strict=args.strict,
+                sync=args.sync,
+                progress=_print_progress,
+            )
+    except rule_import_service.RuleImportError as exc:
+        print(f"\nImport aborted: {exc}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        db.close()
+    print(file=sys.stderr)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.routers import requests, physical_rules, review, deficiencies, semantic_search, embeddings, semantic_deficiencies
+from app.routers import requests, physical_rules, review, deficiencies, semantic_search, embeddings, semantic_deficiencies, rule_syncs
 from app.seed import seed_data
+from app.services.embedding_client import shutdown_client
+from app.services.embedding_job_service import resume_jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pick up embedding jobs interrupted by a restart; they continue from their checkpoint.
+    resume_jobs()
+    yield
+    await shutdown_client()
+
 
-app = FastAPI(title="Rules Review Portal", version="0.1.0")
+app = FastAPI(title="Rules Review Portal", version="0.1.0", lifespan=lifespan)
 
 app.include_router(requests.router)
 app.include_router(physical_rules.router)
@@ -14,6 +27,7 @@ app.include_router(deficiencies.router)
 app.include_router(semantic_search.router)
 app.include_router(embeddings.router)
 app.include_router(semantic_deficiencies.router)
+app.include_router(rule_syncs.router)
 
 
 @app.get("/health")
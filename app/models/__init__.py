@@ -3,5 +3,11 @@ from app.models.physical_rule import PhysicalRule
 from app.models.physical_rule_source import PhysicalRuleSource
 from app.models.physical_rule_destination import PhysicalRuleDestination
 from app.models.deficiency import Deficiency
+from app.models.embedding_cache import EmbeddingCache
+from app.models.embedding_job import EmbeddingJob
+from app.models.embedding_outbox import EmbeddingOutbox
+from app.models.rule_sync import RuleSync, RuleChange
+from app.models.review_run import ReviewRun
+from app.models.semantic_match import SemanticMatch
 
-__all__ = ["Request", "PhysicalRule", "PhysicalRuleSource", "PhysicalRuleDestination", "Deficiency"]
+__all__ = ["Request", "PhysicalRule", "PhysicalRuleSource", "PhysicalRuleDestination", "Deficiency", "EmbeddingCache", "EmbeddingJob", "EmbeddingOutbox", "RuleSync", "RuleChange", "ReviewRun", "SemanticMatch"]
@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, Integer, Float, String, DateTime, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class EmbeddingJob(Base):
+    __tablename__ = "embedding_jobs"
+
+    job_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued")
+    phase: Mapped[str] = mapped_column(String(20), nullable=False, default="requests")
+    force: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    batch_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    commit_every: Mapped[int] = mapped_column(Integer, nullable=False)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    # Checkpoint: highest ID whose embedding has been committed, per phase
+    last_request_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_rule_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    total_requests: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_rules: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    requests_generated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rules_generated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    requests_skipped: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rules_skipped: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    batches: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    batch_latency_ms_total: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    batch_latency_ms_max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    cache_hits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    cache_misses: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # Rate and ETA are measured from the most recent (re)start of the job
+    run_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    run_processed_offset: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
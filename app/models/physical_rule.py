@@ -2,8 +2,8 @@ from datetime import datetime
 from typing import Optional
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Integer, String, DateTime, Text, func
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import BigInteger, Computed, Integer, String, DateTime, Text, func
+from sqlalchemy.dialects.postgresql import ARRAY, INT4MULTIRANGE
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -16,10 +16,22 @@ class PhysicalRule(Base):
     rule_name: Mapped[str] = mapped_column(String(255), nullable=False)
     firewall_device: Mapped[str] = mapped_column(String(255), nullable=False)
     ports: Mapped[list[str]] = mapped_column(ARRAY(String), nullable=False)
+    # Canonical port intervals for the search filter, generated by the database (migration 016)
+    port_ranges: Mapped[Optional[list]] = mapped_column(
+        INT4MULTIRANGE, Computed("port_set_ranges(ports)", persisted=True), nullable=True, deferred=True
+    )
     action: Mapped[str] = mapped_column(String(20), nullable=False, default="allow")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # sha256 of action and canonical sources, destinations and ports; see bulk_ingest_service.rule_content_hash
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # access_fingerprint as of the last exact review; see review_state
+    reviewed_fingerprint: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
     embedding_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     embedding: Mapped[Optional[list]] = mapped_column(Vector(1024), nullable=True)
+    embedding_short: Mapped[Optional[list]] = mapped_column(Vector(256), nullable=True)
+    # Stamped by a trigger on every embedding write (migration 014)
+    embedding_version: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
 
     sources = relationship("PhysicalRuleSource", back_populates="rule", cascade="all, delete-orphan")
     destinations = relationship("PhysicalRuleDestination", back_populates="rule", cascade="all, delete-orphan")
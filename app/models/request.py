@@ -2,8 +2,8 @@ from datetime import datetime
 from typing import Optional
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Integer, String, DateTime, Text, func
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import BigInteger, Computed, Integer, String, DateTime, Text, func
+from sqlalchemy.dialects.postgresql import INT4MULTIRANGE, JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
@@ -18,5 +18,16 @@ class Request(Base):
     request_json: Mapped[dict] = mapped_column(JSONB, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Canonical exact-match fingerprint, generated by the database (migration 012)
+    fingerprint: Mapped[Optional[str]] = mapped_column(
+        String(32), Computed("request_fingerprint(request_json)", persisted=True), nullable=True
+    )
+    # Canonical port intervals for the search filter, generated by the database (migration 016)
+    port_ranges: Mapped[Optional[list]] = mapped_column(
+        INT4MULTIRANGE, Computed("request_port_ranges(request_json)", persisted=True), nullable=True, deferred=True
+    )
     embedding_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     embedding: Mapped[Optional[list]] = mapped_column(Vector(1024), nullable=True)
+    embedding_short: Mapped[Optional[list]] = mapped_column(Vector(256), nullable=True)
+    # Stamped by a trigger on every embedding write (migration 014)
+    embedding_version: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Integer, String, Float, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class ReviewRun(Base):
+    __tablename__ = "review_runs"
+
+    run_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    review_type: Mapped[str] = mapped_column(String(20), nullable=False)  # "exact" or "semantic"
+    mode: Mapped[str] = mapped_column(String(20), nullable=False)  # "full" or "incremental"
+    since: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    threshold_used: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    rules_evaluated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    requests_evaluated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deficiencies_added: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deficiencies_updated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deficiencies_retired: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deficiency_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    elapsed_ms: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
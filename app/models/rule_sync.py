@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, Integer, String, DateTime, ForeignKey, func
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class RuleSync(Base):
+    __tablename__ = "rule_syncs"
+
+    sync_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    firewall_devices: Mapped[list[str]] = mapped_column(ARRAY(String), nullable=False)
+    rows_received: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    duplicates: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    inserted: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deleted: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    unchanged: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class RuleChange(Base):
+    __tablename__ = "rule_changes"
+
+    change_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    sync_id: Mapped[int] = mapped_column(Integer, ForeignKey("rule_syncs.sync_id", ondelete="CASCADE"), nullable=False)
+    # Not a foreign key: deleted rules keep their change rows
+    rule_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    firewall_device: Mapped[str] = mapped_column(String(255), nullable=False)
+    rule_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    change_type: Mapped[str] = mapped_column(String(10), nullable=False)  # "insert", "update" or "delete"
+    # Deleted rule's reviewed_fingerprint, for the incremental exact review
+    reviewed_fingerprint: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from sqlalchemy import Integer, String, Float, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class SemanticMatch(Base):
+    __tablename__ = "semantic_matches"
+
+    rule_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    request_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    similarity_score: Mapped[float] = mapped_column(Float, nullable=False)
+    match_type: Mapped[str] = mapped_column(String(20), nullable=False)  # "exact" or "semantic"
+    threshold_used: Mapped[float] = mapped_column(Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,41 @@
+"""Run a full review sharded across worker processes.
+
+    python -m app.review                                  # exact review, one worker per core
+    python -m app.review --type semantic --workers 8
+    python -m app.review --shard-by id --shards 64        # split large devices by rule_id range
+
+Rules are partitioned by firewall_device (or rule_id range) and evaluated in
+parallel; see app/services/sharded_review_service.py. Prints the summary and
+per-shard timings as JSON.
+"""
+import argparse
+import json
+
+from app.services import review_state, sharded_review_service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a full exact or semantic review on a process pool.")
+    parser.add_argument(
+        "--type",
+        choices=(review_state.REVIEW_EXACT, review_state.REVIEW_SEMANTIC),
+        default=review_state.REVIEW_EXACT,
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--shards", type=int, default=None, help="Rule shards (default: 4 per worker)")
+    parser.add_argument("--shard-by", choices=sharded_review_service.SHARD_BY, default=sharded_review_service.SHARD_BY_DEVICE)
+    parser.add_argument("--threshold", type=float, default=None, help="Semantic review threshold (default SIMILARITY_THRESHOLD)")
+    args = parser.parse_args()
+
+    result = sharded_review_service.run_sharded_review(
+        args.type,
+        workers=args.workers,
+        shards=args.shards,
+        shard_by=args.shard_by,
+        threshold=args.threshold,
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.deficiency import Deficiency
 from app.schemas.deficiency import DeficiencyResponse
+from app.services import pagination
 
 router = APIRouter(prefix="/api/deficiencies", tags=["deficiencies"])
 
 
 @router.get("", response_model=list[DeficiencyResponse])
-def list_deficiencies(type: str | None = None, db: Session = Depends(get_db)):
+def list_deficiencies(
+    response: Response,
+    type: str | None = None,
+    since_deficiency_id: int = 0,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Deficiencies in deficiency_id order, a page at a time.
+
+    Page through with since_deficiency_id set to the last deficiency_id of the
+    previous page, which is also sent as the X-Next-Cursor header while more
+    pages follow.
+    """
     query = db.query(Deficiency)
     if type:
         query = query.filter(Deficiency.type == type)
-    return query.all()
+    return pagination.keyset_page(query, Deficiency.deficiency_id, since_deficiency_id, limit, response)
 
 
 @router.get("/{deficiency_id}", response_model=DeficiencyResponse)
@@ -1,18 +1,31 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.models.embedding_job import EmbeddingJob
 from app.models.physical_rule import PhysicalRule
 from app.models.request import Request
-from app.schemas.semantic_search import EmbeddingGenerateResult, EmbeddingStatus
-from app.services import embedding_service
+from app.schemas.semantic_search import (
+    EmbeddingClientStats,
+    EmbeddingGenerateResult,
+    EmbeddingJobResponse,
+    EmbeddingStatus,
+    OutboxRetryResult,
+)
+from app.services import embedding_job_service, embedding_outbox_service, embedding_service
 
 router = APIRouter(prefix="/api/embeddings", tags=["embeddings"])
 
 
+@router.get("/client", response_model=EmbeddingClientStats)
+def get_embedding_client_stats():
+    """Return live statistics of the shared embedding client."""
+    return EmbeddingClientStats(**embedding_service.get_client().stats())
+
+
 @router.get("/status", response_model=EmbeddingStatus)
 def get_embedding_status(db: Session = Depends(get_db)):
-    """Return embedding coverage statistics."""
+    """Return embedding coverage statistics and the depth of the embedding outbox."""
     total_requests = db.query(Request).count()
     requests_with_embeddings = db.query(Request).filter(Request.embedding.isnot(None)).count()
     total_rules = db.query(PhysicalRule).count()
@@ -23,59 +36,104 @@ def get_embedding_status(db: Session = Depends(get_db)):
         requests_with_embeddings=requests_with_embeddings,
         total_rules=total_rules,
         rules_with_embeddings=rules_with_embeddings,
+        **embedding_outbox_service.queue_depth(db),
     )
 
 
+@router.post("/outbox/retry", response_model=OutboxRetryResult)
+def retry_failed_outbox_entries(db: Session = Depends(get_db)):
+    """Requeue outbox entries that exhausted their attempts (e.g. after an Ollama outage)."""
+    return OutboxRetryResult(requeued=embedding_outbox_service.retry_failed(db))
+
+
 @router.post("/generate", response_model=EmbeddingGenerateResult)
-def generate_embeddings(force: bool = False, db: Session = Depends(get_db)):
-    """Batch generate embeddings for all requests and physical rules.
+def generate_embeddings(
+    force: bool = False,
+    batch_size: int | None = None,
+    commit_every: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """Batch generate embeddings for all requests and physical rules, waiting for completion.
+
+    Runs the same job as POST /api/embeddings/jobs inline: rows are streamed and
+    committed every `commit_every` rows, so an interrupted run can be resumed
+    through the jobs endpoints. Texts already present in the embedding cache for
+    the current model are not sent to Ollama again.
 
     Args:
         force: If True, regenerate embeddings even for records that already have them.
+        batch_size: Texts per Ollama call. Defaults to the client's adaptive batch size.
+        commit_every: Rows per commit. Defaults to EMBEDDING_JOB_COMMIT_EVERY.
     """
-    requests_generated = 0
-    requests_skipped = 0
-    rules_generated = 0
-    rules_skipped = 0
-
-    # Generate embeddings for all requests
-    requests = db.query(Request).all()
-    for req in requests:
-        if req.embedding is not None and not force:
-            requests_skipped += 1
-            continue
-        data = req.request_json
-        text = embedding_service.build_request_text(
-            req.name, data["sources"], data["destinations"], data["ports"]
-        )
-        req.embedding_text = text
-        req.embedding = embedding_service.embed(text)
-        requests_generated += 1
-
-    # Generate embeddings for all physical rules
-    rules = (
-        db.query(PhysicalRule)
-        .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
-        .all()
-    )
-    for rule in rules:
-        if rule.embedding is not None and not force:
-            rules_skipped += 1
-            continue
-        sources = [s.address for s in rule.sources]
-        destinations = [d.address for d in rule.destinations]
-        text = embedding_service.build_rule_text(
-            rule.rule_name, rule.action, sources, destinations, rule.ports
-        )
-        rule.embedding_text = text
-        rule.embedding = embedding_service.embed(text)
-        rules_generated += 1
-
-    db.commit()
+    job = embedding_job_service.submit_job(db, force, batch_size, commit_every)
+    job = embedding_job_service.run_job(job.job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=502, detail=f"Embedding job {job.job_id} failed: {job.error}")
 
     return EmbeddingGenerateResult(
-        requests_generated=requests_generated,
-        rules_generated=rules_generated,
-        requests_skipped=requests_skipped,
-        rules_skipped=rules_skipped,
+        requests_generated=job.requests_generated,
+        rules_generated=job.rules_generated,
+        requests_skipped=job.requests_skipped,
+        rules_skipped=job.rules_skipped,
+        batches=job.batches,
+        batch_latency_ms_avg=round(job.batch_latency_ms_total / job.batches, 1) if job.batches else None,
+        batch_latency_ms_max=round(job.batch_latency_ms_max, 1) if job.batch_latency_ms_max is not None else None,
+        cache_hits=job.cache_hits,
+        cache_misses=job.cache_misses,
     )
+
+
+@router.post("/jobs", response_model=EmbeddingJobResponse)
+def submit_embedding_job(
+    force: bool = False,
+    batch_size: int | None = None,
+    commit_every: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """Submit a background embedding backfill and return its job record immediately."""
+    job = embedding_job_service.submit_job(db, force, batch_size, commit_every)
+    embedding_job_service.start_job(job.job_id)
+    return job
+
+
+@router.get("/jobs", response_model=list[EmbeddingJobResponse])
+def list_embedding_jobs(status: str | None = None, db: Session = Depends(get_db)):
+    query = db.query(EmbeddingJob)
+    if status:
+        query = query.filter(EmbeddingJob.status == status)
+    return query.order_by(EmbeddingJob.job_id.desc()).all()
+
+
+@router.get("/jobs/{job_id}", response_model=EmbeddingJobResponse)
+def get_embedding_job(job_id: int, db: Session = Depends(get_db)):
+    """Return progress, rate and ETA of an embedding job."""
+    job = db.query(EmbeddingJob).filter(EmbeddingJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Embedding job not found")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=EmbeddingJobResponse)
+def cancel_embedding_job(job_id: int, db: Session = Depends(get_db)):
+    """Stop an embedding job after its current chunk is committed."""
+    job = db.query(EmbeddingJob).filter(EmbeddingJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Embedding job not found")
+    return embedding_job_service.cancel_job(db, job)
+
+
+@router.post("/jobs/{job_id}/resume", response_model=EmbeddingJobResponse)
+def resume_embedding_job(job_id: int, db: Session = Depends(get_db)):
+    """Restart a failed or interrupted job from its last checkpoint."""
+    job = db.query(EmbeddingJob).filter(EmbeddingJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Embedding job not found")
+    if job.status in ("completed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Embedding job is {job.status}")
+    if job.status == "failed":
+        job.status = "running"
+        job.finished_at = None
+        db.commit()
+        db.refresh(job)
+    embedding_job_service.start_job(job.job_id)
+    return job
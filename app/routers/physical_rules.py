@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import Request as HttpRequest
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from app.database import get_db
 from app.models.physical_rule import PhysicalRule
 from app.models.physical_rule_source import PhysicalRuleSource
 from app.models.physical_rule_destination import PhysicalRuleDestination
+from app.schemas.bulk_ingest import BulkIngestResult, RuleImportResult
 from app.schemas.physical_rule import PhysicalRuleCreate, PhysicalRuleResponse
-from app.services import embedding_service
+from app.services import bulk_ingest_service, embedding_outbox_service, pagination, rule_import_service
 
 router = APIRouter(prefix="/api/physical-rules", tags=["physical-rules"])
 
@@ -18,31 +20,103 @@ def create_physical_rule(payload: PhysicalRuleCreate, db: Session = Depends(get_
         firewall_device=payload.firewall_device,
         ports=payload.ports,
         action=payload.action,
+        content_hash=bulk_ingest_service.rule_content_hash(
+            payload.action, payload.sources, payload.destinations, payload.ports
+        ),
     )
     for addr in payload.sources:
         rule.sources.append(PhysicalRuleSource(address=addr))
     for addr in payload.destinations:
         rule.destinations.append(PhysicalRuleDestination(address=addr))
 
-    text = embedding_service.build_rule_text(
-        payload.rule_name, payload.action, payload.sources, payload.destinations, payload.ports
-    )
-    rule.embedding_text = text
-    rule.embedding = embedding_service.embed(text)
-
     db.add(rule)
+    db.flush()
+    # Embedded asynchronously by app.embedding_worker once this transaction commits
+    embedding_outbox_service.enqueue(db, embedding_outbox_service.ENTITY_RULE, [rule.rule_id])
     db.commit()
     db.refresh(rule)
     return rule
 
 
+@router.post("/bulk", response_model=BulkIngestResult)
+async def bulk_create_physical_rules(
+    http_request: HttpRequest,
+    defer_embedding: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Load many physical rules in one transaction with COPY.
+
+    Accepts a JSON array of the same objects as the single-row endpoint, or an
+    NDJSON body (Content-Type: application/x-ndjson) that is streamed in chunks.
+    Rows are queued for the embedding worker unless defer_embedding is set, in
+    which case they are left for POST /api/embeddings/jobs.
+    """
+    try:
+        return await bulk_ingest_service.ingest(http_request, db, bulk_ingest_service.KIND_RULES, defer_embedding)
+    except bulk_ingest_service.BulkIngestError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@router.post("/import", response_model=RuleImportResult)
+async def import_physical_rules(
+    http_request: HttpRequest,
+    format: str | None = None,
+    firewall_device: str | None = None,
+    defer_embedding: bool = False,
+    strict: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Import a firewall configuration export (CSV or JSON lines) sent as the raw request body.
+
+    The same streaming importer as `python -m app.import_rules`: rows are mapped
+    and validated one at a time and written in COPY batches. Invalid rows are
+    skipped and reported unless strict is set.
+
+    Args:
+        format: "csv" or "jsonl". Defaults to the Content-Type (text/csv or application/x-ndjson).
+        firewall_device: Device name for exports without a firewall_device column.
+    """
+    fmt = format or rule_import_service.format_for_content_type(http_request.headers.get("content-type", ""))
+    if fmt not in rule_import_service.FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(rule_import_service.FORMATS)}")
+    try:
+        return await rule_import_service.import_body(
+            http_request,
+            db,
+            fmt,
+            firewall_device=firewall_device,
+            defer_embedding=defer_embedding,
+            strict=strict,
+        )
+    except (rule_import_service.RuleImportError, bulk_ingest_service.BulkIngestError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
 @router.get("", response_model=list[PhysicalRuleResponse])
-def list_physical_rules(db: Session = Depends(get_db)):
-    return (
-        db.query(PhysicalRule)
-        .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
-        .all()
+def list_physical_rules(
+    response: Response,
+    firewall_device: str | None = None,
+    action: str | None = None,
+    since_rule_id: int = 0,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Physical rules in rule_id order, a page at a time.
+
+    Page through with since_rule_id set to the last rule_id of the previous
+    page, which is also sent as the X-Next-Cursor header while more pages
+    follow. Sources and destinations are loaded with one IN query each per page
+    (selectinload) rather than joined, which would multiply every rule into
+    sources x destinations rows.
+    """
+    query = db.query(PhysicalRule).options(
+        selectinload(PhysicalRule.sources), selectinload(PhysicalRule.destinations)
     )
+    if firewall_device:
+        query = query.filter(PhysicalRule.firewall_device == firewall_device)
+    if action:
+        query = query.filter(PhysicalRule.action == action)
+    return pagination.keyset_page(query, PhysicalRule.rule_id, since_rule_id, limit, response)
 
 
 @router.get("/{rule_id}", response_model=PhysicalRuleResponse)
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import Request as HttpRequest
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.request import Request
+from app.schemas.bulk_ingest import BulkIngestResult
 from app.schemas.request import RequestCreate, RequestResponse
-from app.services import embedding_service
+from app.services import bulk_ingest_service, embedding_outbox_service, pagination
 
 router = APIRouter(prefix="/api/requests", tags=["requests"])
 
@@ -13,23 +15,52 @@ router = APIRouter(prefix="/api/requests", tags=["requests"])
 def create_request(payload: RequestCreate, db: Session = Depends(get_db)):
     data = payload.request_json.model_dump()
     req = Request(name=payload.name, request_json=data)
-    text = embedding_service.build_request_text(
-        payload.name, data["sources"], data["destinations"], data["ports"]
-    )
-    req.embedding_text = text
-    req.embedding = embedding_service.embed(text)
     db.add(req)
+    db.flush()
+    # Embedded asynchronously by app.embedding_worker once this transaction commits
+    embedding_outbox_service.enqueue(db, embedding_outbox_service.ENTITY_REQUEST, [req.request_id])
     db.commit()
     db.refresh(req)
     return req
 
 
+@router.post("/bulk", response_model=BulkIngestResult)
+async def bulk_create_requests(
+    http_request: HttpRequest,
+    defer_embedding: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Load many requests in one transaction with COPY.
+
+    Accepts a JSON array of the same objects as the single-row endpoint, or an
+    NDJSON body (Content-Type: application/x-ndjson) that is streamed in chunks.
+    Rows are queued for the embedding worker unless defer_embedding is set, in
+    which case they are left for POST /api/embeddings/jobs.
+    """
+    try:
+        return await bulk_ingest_service.ingest(http_request, db, bulk_ingest_service.KIND_REQUESTS, defer_embedding)
+    except bulk_ingest_service.BulkIngestError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
 @router.get("", response_model=list[RequestResponse])
-def list_requests(status: str | None = None, db: Session = Depends(get_db)):
+def list_requests(
+    response: Response,
+    status: str | None = None,
+    since_request_id: int = 0,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Requests in request_id order, a page at a time.
+
+    Page through with since_request_id set to the last request_id of the
+    previous page, which is also sent as the X-Next-Cursor header while more
+    pages follow.
+    """
     query = db.query(Request)
     if status:
         query = query.filter(Request.status == status)
-    return query.all()
+    return pagination.keyset_page(query, Request.request_id, since_request_id, limit, response)
 
 
 @router.get("/{request_id}", response_model=RequestResponse)
@@ -1,22 +1,112 @@
-from fastapi import APIRouter, Depends
+import json
+from typing import Callable, Iterator
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.schemas.review import ReviewResult
+from app.database import SessionLocal, get_db
+from app.models.review_run import ReviewRun
+from app.schemas.review import CoverageReviewResult, ReviewResult, ReviewRunResponse, SqlReviewResult
 from app.schemas.semantic_search import SemanticReviewResult
-from app.services.review_service import run_review
-from app.services.semantic_review_service import run_semantic_review
+from app.services import similarity_engine
+from app.services.coverage_review_service import iter_coverage_review, run_coverage_review
+from app.services.incremental_review_service import run_incremental_review, run_incremental_semantic_review
+from app.services.review_service import ReviewRecord, iter_review, run_review, run_review_sql
+from app.services.semantic_review_service import iter_semantic_review, run_semantic_review
 
 router = APIRouter(prefix="/api/review", tags=["review"])
 
+FORMATS = ("json", "ndjson")
+# Records per written chunk, so the body is not sent one small line at a time
+_NDJSON_CHUNK_RECORDS = 500
+
+
+def _check_format(format: str) -> None:
+    if format not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(FORMATS)}")
+
+
+def _ndjson_response(review: Callable[[Session], Iterator[ReviewRecord]]) -> StreamingResponse:
+    """Stream a review as NDJSON: one {"record": kind, ...item} line per item, the summary last.
+
+    The review runs on its own session, because the request-scoped one is
+    closed before a streamed body is sent.
+    """
+    def lines() -> Iterator[str]:
+        db = SessionLocal()
+        try:
+            chunk: list[str] = []
+            for kind, item in review(db):
+                chunk.append(json.dumps({"record": kind, **item.model_dump(mode="json")}) + "\n")
+                if len(chunk) >= _NDJSON_CHUNK_RECORDS:
+                    yield "".join(chunk)
+                    chunk.clear()
+            yield "".join(chunk)
+        finally:
+            db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 
 @router.post("/run", response_model=ReviewResult)
-def trigger_review(db: Session = Depends(get_db)):
+def trigger_review(format: str = "json", db: Session = Depends(get_db)):
+    """Run the exact-match review.
+
+    Args:
+        format: "json" for one ReviewResult document, or "ndjson" to stream
+                matched and unmatched items as they are produced, summary last.
+    """
+    _check_format(format)
+    if format == "ndjson":
+        return _ndjson_response(iter_review)
     return run_review(db)
 
 
+@router.post("/run-sql", response_model=SqlReviewResult)
+def trigger_sql_review(db: Session = Depends(get_db)):
+    """Run the exact-match review inside PostgreSQL and return only the counts.
+
+    Same matching as /run; the deficiencies it records are listed by /api/deficiencies.
+    """
+    return run_review_sql(db)
+
+
+@router.post("/run-incremental", response_model=ReviewRunResponse)
+def trigger_incremental_review(db: Session = Depends(get_db)):
+    """Re-evaluate only the rules and requests affected by changes since the last exact review.
+
+    Adds and retires rows in the same deficiencies table as /run and /run-sql.
+    Runs a full SQL review when no exact review has run yet.
+    """
+    return run_incremental_review(db)
+
+
+@router.post("/run-coverage", response_model=CoverageReviewResult)
+def trigger_coverage_review(include_covered: bool = False, format: str = "json", db: Session = Depends(get_db)):
+    """Run a containment-based coverage review.
+
+    Reports requests that the physical rules cover only partially (with the
+    uncovered remainder) or not at all, and allow rules that grant more than
+    the requests asked for (with the excess) or overlap no request.
+
+    Args:
+        include_covered: Also list fully covered requests and justified rules.
+        format: "json" or "ndjson" (requests, then rules, summary last).
+    """
+    _check_format(format)
+    if format == "ndjson":
+        return _ndjson_response(lambda session: iter_coverage_review(session, include_covered))
+    return run_coverage_review(db, include_covered)
+
+
 @router.post("/run-semantic", response_model=SemanticReviewResult)
-def trigger_semantic_review(threshold: float | None = None, db: Session = Depends(get_db)):
+def trigger_semantic_review(
+    threshold: float | None = None,
+    format: str = "json",
+    engine: str | None = None,
+    db: Session = Depends(get_db),
+):
     """Run a semantic similarity-based review.
 
     Uses vector embeddings (qwen3-embedding via Ollama) to match physical rules
@@ -25,5 +115,31 @@ def trigger_semantic_review(threshold: float | None = None, db: Session = Depend
     Args:
         threshold: Minimum cosine similarity score (0.0-1.0) to consider a match.
                    Defaults to the configured SIMILARITY_THRESHOLD (0.7).
+        format: "json" or "ndjson" (items as they are produced, summary last).
+        engine: "pgvector" (batched HNSW KNN) or "numpy" (exact all-pairs in
+                memory). Defaults to the configured SEMANTIC_REVIEW_ENGINE.
+    """
+    _check_format(format)
+    if engine is not None and engine not in similarity_engine.ENGINES:
+        raise HTTPException(status_code=422, detail=f"engine must be one of {', '.join(similarity_engine.ENGINES)}")
+    if format == "ndjson":
+        return _ndjson_response(lambda session: iter_semantic_review(session, threshold, engine=engine))
+    return run_semantic_review(db, threshold, engine)
+
+
+@router.post("/run-semantic-incremental", response_model=ReviewRunResponse)
+def trigger_incremental_semantic_review(threshold: float | None = None, db: Session = Depends(get_db)):
+    """Re-evaluate only the rules and requests affected by changes since the last semantic review.
+
+    Runs a full semantic review when none has run yet or the threshold differs
+    from the last run's.
     """
-    return run_semantic_review(db, threshold)
+    return run_incremental_semantic_review(db, threshold)
+
+
+@router.get("/runs", response_model=list[ReviewRunResponse])
+def list_review_runs(review_type: str | None = None, limit: int = 50, db: Session = Depends(get_db)):
+    query = db.query(ReviewRun)
+    if review_type:
+        query = query.filter(ReviewRun.review_type == review_type)
+    return query.order_by(ReviewRun.run_id.desc()).limit(limit).all()
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi import Request as HttpRequest
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models.rule_sync import RuleChange, RuleSync
+from app.schemas.rule_sync import RuleChangeResponse, RuleSyncResponse, RuleSyncResult
+from app.services import bulk_ingest_service, rule_import_service
+
+router = APIRouter(prefix="/api/rule-syncs", tags=["rule-syncs"])
+
+
+@router.post("", response_model=RuleSyncResult)
+async def sync_physical_rules(
+    http_request: HttpRequest,
+    format: str | None = None,
+    firewall_device: str | None = None,
+    defer_embedding: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Sync the stored rules of one or more devices with a complete export (CSV or JSON lines).
+
+    Rules are keyed on (firewall_device, rule_name) and compared by content hash:
+    new rules are inserted, changed rules updated, rules missing from the export
+    deleted, and unchanged rules (with their embeddings) left alone. Any invalid
+    row aborts the sync, since a skipped row would otherwise delete its rule.
+
+    Args:
+        format: "csv" or "jsonl". Defaults to the Content-Type (text/csv or application/x-ndjson).
+        firewall_device: Device whose rule set the export replaces; required for
+            exports without a firewall_device column, and deletes all of the device's
+            rules if the export is empty.
+    """
+    fmt = format or rule_import_service.format_for_content_type(http_request.headers.get("content-type", ""))
+    if fmt not in rule_import_service.FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(rule_import_service.FORMATS)}")
+    try:
+        return await rule_import_service.import_body(
+            http_request,
+            db,
+            fmt,
+            firewall_device=firewall_device,
+            defer_embedding=defer_embedding,
+            sync=True,
+        )
+    except (rule_import_service.RuleImportError, bulk_ingest_service.BulkIngestError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@router.get("", response_model=list[RuleSyncResponse])
+def list_rule_syncs(firewall_device: str | None = None, limit: int = 50, db: Session = Depends(get_db)):
+    query = db.query(RuleSync)
+    if firewall_device:
+        query = query.filter(RuleSync.firewall_devices.any(firewall_device))
+    return query.order_by(RuleSync.sync_id.desc()).limit(limit).all()
+
+
+@router.get("/changes", response_model=list[RuleChangeResponse])
+def list_rule_changes(
+    since_change_id: int = 0,
+    sync_id: int | None = None,
+    change_type: str | None = None,
+    limit: int = 1000,
+    db: Session = Depends(get_db),
+):
+    """Rules touched by syncs, oldest first.
+
+    Incremental consumers page through with since_change_id set to the last
+    change_id they have processed.
+    """
+    query = db.query(RuleChange).filter(RuleChange.change_id > since_change_id)
+    if sync_id is not None:
+        query = query.filter(RuleChange.sync_id == sync_id)
+    if change_type:
+        query = query.filter(RuleChange.change_type == change_type)
+    return query.order_by(RuleChange.change_id).limit(limit).all()
+
+
+@router.get("/{sync_id}", response_model=RuleSyncResponse)
+def get_rule_sync(sync_id: int, db: Session = Depends(get_db)):
+    sync = db.query(RuleSync).filter(RuleSync.sync_id == sync_id).first()
+    if not sync:
+        raise HTTPException(status_code=404, detail="Rule sync not found")
+    return sync
@@ -1,20 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.semantic_deficiency import SemanticDeficiency
 from app.schemas.semantic_search import SemanticDeficiencyResponse
+from app.services import pagination
 
 router = APIRouter(prefix="/api/semantic-deficiencies", tags=["semantic-deficiencies"])
 
 
 @router.get("", response_model=list[SemanticDeficiencyResponse])
-def list_semantic_deficiencies(type: str | None = None, db: Session = Depends(get_db)):
-    """List all semantic deficiencies, optionally filtered by type."""
+def list_semantic_deficiencies(
+    response: Response,
+    type: str | None = None,
+    min_score: float | None = None,
+    max_score: float | None = None,
+    order: str = "desc",
+    since_id: int | None = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """List semantic deficiencies a page at a time, newest first by default.
+
+    Ids are assigned in creation order, so order="desc" (id descending) is the
+    created_at-descending order this endpoint always had; order="asc" is
+    oldest first. Page through with since_id set to the last id of the
+    previous page, which is also sent as the X-Next-Cursor header while more
+    pages follow. min_score / max_score bound the best similarity found
+    (inclusive); deficiencies without a score (no embedding, no candidate)
+    are excluded when either is set.
+    """
+    if order not in ("desc", "asc"):
+        raise HTTPException(status_code=422, detail="order must be one of desc, asc")
     query = db.query(SemanticDeficiency)
     if type:
         query = query.filter(SemanticDeficiency.type == type)
-    return query.order_by(SemanticDeficiency.created_at.desc()).all()
+    if min_score is not None:
+        query = query.filter(SemanticDeficiency.similarity_score >= min_score)
+    if max_score is not None:
+        query = query.filter(SemanticDeficiency.similarity_score <= max_score)
+    return pagination.keyset_page(query, SemanticDeficiency.id, since_id, limit, response, descending=order == "desc")
 
 
 @router.get("/{deficiency_id}", response_model=SemanticDeficiencyResponse)
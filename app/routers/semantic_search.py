@@ -1,29 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session, joinedload
 
+from app.config import settings
 from app.database import get_db
 from app.models.physical_rule import PhysicalRule
 from app.models.request import Request
 from app.schemas.semantic_search import (
+    LocalIndexStats,
+    QueryCacheStats,
+    SearchBenchmarkResult,
     SemanticMatch,
     SemanticSearchResult,
     TextSearchMatch,
     TextSearchRequest,
     TextSearchResult,
 )
-from app.services import embedding_service
+from app.services import address_canon, embedding_service, local_ann_index, vector_search
+from app.services.query_cache import embed_query, query_cache
 
 router = APIRouter(prefix="/api/semantic-search", tags=["semantic-search"])
 
 
+def _check_mode(mode: str | None) -> None:
+    if mode is not None and mode not in vector_search.SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"mode must be one of {', '.join(vector_search.SEARCH_MODES)}",
+        )
+
+
+def _check_port(port: str | None) -> None:
+    if port is not None and address_canon.parse_port(port) is None:
+        raise HTTPException(status_code=400, detail="port must be a port (443, tcp/443), a range (8000-8080) or any")
+
+
 @router.post("/by-request/{request_id}", response_model=SemanticSearchResult)
 def search_by_request(
     request_id: int,
     threshold: float = 0.7,
     limit: int = 10,
+    mode: str | None = None,
+    firewall_device: str | None = None,
+    action: str | None = None,
+    port: str | None = None,
     db: Session = Depends(get_db),
 ):
-    """Find physical rules semantically similar to the given request."""
+    """Find physical rules semantically similar to the given request.
+
+    `mode` overrides VECTOR_SEARCH_MODE ("exact", "halfvec", "binary", "matryoshka" or "local") for this query.
+    `firewall_device`, `action` and `port` restrict the rules searched; `port`
+    keeps rules whose ports cover it (443 is covered by 'any' and '1-1024').
+    """
+    _check_mode(mode)
+    _check_port(port)
     req = db.query(Request).filter(Request.request_id == request_id).first()
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
@@ -34,44 +63,36 @@ def search_by_request(
         text = embedding_service.build_request_text(
             req.name, data["sources"], data["destinations"], data["ports"]
         )
-        req.embedding_text = text
-        req.embedding = embedding_service.embed(text)
+        embedding_service.set_embedding(req, text, embedding_service.embed(text, db))
         db.commit()
 
     query_embedding = list(req.embedding)
     query_text = req.embedding_text or ""
 
-    # KNN query: ORDER BY embedding <=> query_vector activates the HNSW index.
-    # Over-fetch by 4x to account for threshold post-filtering.
-    distance_expr = PhysicalRule.embedding.cosine_distance(query_embedding).label("distance")
-    rows = (
-        db.query(PhysicalRule, distance_expr)
-        .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
-        .filter(PhysicalRule.embedding.isnot(None))
-        .order_by(distance_expr)
-        .limit(limit * 4)
-        .all()
+    # KNN query against the compact HNSW index, re-ranked by exact cosine distance.
+    # The threshold is applied inside the (iterative) index scan, so up to `limit` rows all qualify.
+    rows = vector_search.nearest(
+        db, PhysicalRule, query_embedding, limit, mode,
+        options=(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations)),
+        threshold=threshold,
+        filters=vector_search.rule_filters(firewall_device, action, port),
     )
 
     # Results are already ordered by similarity descending (distance ascending).
     matches = []
     for rule, distance in rows:
-        score = round(1.0 - distance, 4)
-        if score >= threshold:
-            sources = [s.address for s in rule.sources]
-            destinations = [d.address for d in rule.destinations]
-            matches.append(
-                SemanticMatch(
-                    rule_id=rule.rule_id,
-                    name=rule.rule_name,
-                    sources=sources,
-                    destinations=destinations,
-                    ports=rule.ports,
-                    similarity_score=score,
-                )
+        sources = [s.address for s in rule.sources]
+        destinations = [d.address for d in rule.destinations]
+        matches.append(
+            SemanticMatch(
+                rule_id=rule.rule_id,
+                name=rule.rule_name,
+                sources=sources,
+                destinations=destinations,
+                ports=rule.ports,
+                similarity_score=round(1.0 - distance, 4),
             )
-
-    matches = matches[:limit]
+        )
 
     return SemanticSearchResult(
         query_id=request_id,
@@ -88,9 +109,18 @@ def search_by_rule(
     rule_id: int,
     threshold: float = 0.7,
     limit: int = 10,
+    mode: str | None = None,
+    status: str | None = None,
+    port: str | None = None,
     db: Session = Depends(get_db),
 ):
-    """Find user requests semantically similar to the given physical rule."""
+    """Find user requests semantically similar to the given physical rule.
+
+    `status` and `port` restrict the requests searched; `port` keeps requests
+    whose ports cover it.
+    """
+    _check_mode(mode)
+    _check_port(port)
     rule = (
         db.query(PhysicalRule)
         .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
@@ -107,39 +137,31 @@ def search_by_rule(
         text = embedding_service.build_rule_text(
             rule.rule_name, rule.action, sources, destinations, rule.ports
         )
-        rule.embedding_text = text
-        rule.embedding = embedding_service.embed(text)
+        embedding_service.set_embedding(rule, text, embedding_service.embed(text, db))
         db.commit()
 
     query_embedding = list(rule.embedding)
     query_text = rule.embedding_text or ""
 
-    distance_expr = Request.embedding.cosine_distance(query_embedding).label("distance")
-    rows = (
-        db.query(Request, distance_expr)
-        .filter(Request.embedding.isnot(None))
-        .order_by(distance_expr)
-        .limit(limit * 4)
-        .all()
+    rows = vector_search.nearest(
+        db, Request, query_embedding, limit, mode,
+        threshold=threshold,
+        filters=vector_search.request_filters(status, port),
     )
 
     matches = []
     for req, distance in rows:
-        score = round(1.0 - distance, 4)
-        if score >= threshold:
-            data = req.request_json
-            matches.append(
-                SemanticMatch(
-                    request_id=req.request_id,
-                    name=req.name,
-                    sources=data["sources"],
-                    destinations=data["destinations"],
-                    ports=data["ports"],
-                    similarity_score=score,
-                )
+        data = req.request_json
+        matches.append(
+            SemanticMatch(
+                request_id=req.request_id,
+                name=req.name,
+                sources=data["sources"],
+                destinations=data["destinations"],
+                ports=data["ports"],
+                similarity_score=round(1.0 - distance, 4),
             )
-
-    matches = matches[:limit]
+        )
 
     return SemanticSearchResult(
         query_id=rule_id,
@@ -154,60 +176,52 @@ def search_by_rule(
 @router.post("/by-text", response_model=TextSearchResult)
 def search_by_text(payload: TextSearchRequest, db: Session = Depends(get_db)):
     """Free-form text search against rules and/or requests."""
-    query_embedding = embedding_service.embed(payload.query)
+    _check_mode(payload.mode)
+    _check_port(payload.port)
+    query_embedding = embed_query(payload.query, db)
     matches = []
 
     if payload.search_in in ("rules", "both"):
-        distance_expr = PhysicalRule.embedding.cosine_distance(query_embedding).label("distance")
-        rows = (
-            db.query(PhysicalRule, distance_expr)
-            .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
-            .filter(PhysicalRule.embedding.isnot(None))
-            .order_by(distance_expr)
-            .limit(payload.limit * 4)
-            .all()
+        rows = vector_search.nearest(
+            db, PhysicalRule, query_embedding, payload.limit, payload.mode,
+            options=(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations)),
+            threshold=payload.threshold,
+            filters=vector_search.rule_filters(payload.firewall_device, payload.action, payload.port),
         )
         for rule, distance in rows:
-            score = round(1.0 - distance, 4)
-            if score >= payload.threshold:
-                sources = [s.address for s in rule.sources]
-                destinations = [d.address for d in rule.destinations]
-                matches.append(
-                    TextSearchMatch(
-                        entity_type="rule",
-                        rule_id=rule.rule_id,
-                        name=rule.rule_name,
-                        sources=sources,
-                        destinations=destinations,
-                        ports=rule.ports,
-                        similarity_score=score,
-                    )
+            sources = [s.address for s in rule.sources]
+            destinations = [d.address for d in rule.destinations]
+            matches.append(
+                TextSearchMatch(
+                    entity_type="rule",
+                    rule_id=rule.rule_id,
+                    name=rule.rule_name,
+                    sources=sources,
+                    destinations=destinations,
+                    ports=rule.ports,
+                    similarity_score=round(1.0 - distance, 4),
                 )
+            )
 
     if payload.search_in in ("requests", "both"):
-        distance_expr = Request.embedding.cosine_distance(query_embedding).label("distance")
-        rows = (
-            db.query(Request, distance_expr)
-            .filter(Request.embedding.isnot(None))
-            .order_by(distance_expr)
-            .limit(payload.limit * 4)
-            .all()
+        rows = vector_search.nearest(
+            db, Request, query_embedding, payload.limit, payload.mode,
+            threshold=payload.threshold,
+            filters=vector_search.request_filters(payload.status, payload.port),
         )
         for req, distance in rows:
-            score = round(1.0 - distance, 4)
-            if score >= payload.threshold:
-                data = req.request_json
-                matches.append(
-                    TextSearchMatch(
-                        entity_type="request",
-                        request_id=req.request_id,
-                        name=req.name,
-                        sources=data["sources"],
-                        destinations=data["destinations"],
-                        ports=data["ports"],
-                        similarity_score=score,
-                    )
+            data = req.request_json
+            matches.append(
+                TextSearchMatch(
+                    entity_type="request",
+                    request_id=req.request_id,
+                    name=req.name,
+                    sources=data["sources"],
+                    destinations=data["destinations"],
+                    ports=data["ports"],
+                    similarity_score=round(1.0 - distance, 4),
                 )
+            )
 
     matches.sort(key=lambda m: m.similarity_score, reverse=True)
     matches = matches[: payload.limit]
@@ -218,3 +232,46 @@ def search_by_text(payload: TextSearchRequest, db: Session = Depends(get_db)):
         total_matches=len(matches),
         threshold_used=payload.threshold,
     )
+
+
+@router.get("/query-cache", response_model=QueryCacheStats)
+def get_query_cache_stats():
+    """Return hit rate and memory use of this worker's query embedding cache."""
+    return QueryCacheStats(**query_cache.stats())
+
+
+@router.get("/local-index", response_model=list[LocalIndexStats])
+def get_local_index_stats():
+    """Return this worker's local ANN index state per table: snapshot generation, live rows and delta size.
+
+    Brings the index up to date first.
+    """
+    if not settings.LOCAL_ANN_DIR:
+        raise HTTPException(status_code=404, detail="Local index is not enabled (LOCAL_ANN_DIR)")
+    stats = []
+    for model in (PhysicalRule, Request):
+        index = local_ann_index.get(model)
+        index.refresh()
+        stats.append(LocalIndexStats(**index.stats()))
+    return stats
+
+
+@router.get("/benchmark", response_model=SearchBenchmarkResult)
+def benchmark_search_modes(
+    target: str = "rules",
+    sample_size: int = 20,
+    limit: int = 10,
+    db: Session = Depends(get_db),
+):
+    """Compare recall@limit and latency of every search mode against brute-force "exact" search.
+
+    Query vectors are sampled from requests when searching rules, and from rules
+    when searching requests.
+    """
+    if target == "rules":
+        report = vector_search.compare_modes(db, PhysicalRule, Request, sample_size, limit)
+    elif target == "requests":
+        report = vector_search.compare_modes(db, Request, PhysicalRule, sample_size, limit)
+    else:
+        raise HTTPException(status_code=400, detail="target must be 'rules' or 'requests'")
+    return SearchBenchmarkResult(target=target, sample_size=sample_size, limit=limit, modes=report)
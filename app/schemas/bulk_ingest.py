@@ -0,0 +1,20 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class BulkIngestResult(BaseModel):
+    rows_inserted: int
+    sources_inserted: int = 0
+    destinations_inserted: int = 0
+    embeddings_queued: int
+    embedding_deferred: bool
+    elapsed_ms: float
+    rows_per_second: Optional[float] = None
+
+
+class RuleImportResult(BulkIngestResult):
+    rows_read: int
+    rows_imported: int
+    rows_rejected: int
+    errors: list[str] = []
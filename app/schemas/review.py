@@ -1,3 +1,6 @@
+from datetime import datetime
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -42,3 +45,77 @@ class ReviewResult(BaseModel):
     unmatched_physical_rules: list[UnmatchedRule]
     unmatched_requests: list[UnmatchedRequest]
     summary: ReviewSummary
+
+
+class SqlReviewResult(BaseModel):
+    """Counts of an exact review run inside PostgreSQL; deficiencies are read from /api/deficiencies."""
+    summary: ReviewSummary
+    elapsed_ms: float
+
+
+class CoverageBox(BaseModel):
+    """One box of address x address x port space, in canonical notation."""
+    sources: str
+    destinations: str
+    ports: str
+
+
+class RequestCoverage(BaseModel):
+    request_id: int
+    name: str
+    status: str  # covered | partial | uncovered | unparsable
+    covered_fraction: float
+    covering_rule_ids: list[int]
+    uncovered: list[CoverageBox] = []
+    uncovered_truncated: bool = False
+
+
+class RuleCoverage(BaseModel):
+    rule_id: int
+    rule_name: str
+    firewall_device: str
+    status: str  # justified | over_permissive | unrequested | unparsable
+    requested_fraction: float
+    request_ids: list[int]
+    excess: list[CoverageBox] = []
+    excess_truncated: bool = False
+
+
+class CoverageReviewSummary(BaseModel):
+    total_physical_rules: int
+    evaluated_physical_rules: int
+    total_requests: int
+    covered_requests_count: int
+    partial_requests_count: int
+    uncovered_requests_count: int
+    unparsable_requests_count: int
+    justified_rules_count: int
+    over_permissive_rules_count: int
+    unrequested_rules_count: int
+    unparsable_rules_count: int
+    elapsed_ms: float
+
+
+class CoverageReviewResult(BaseModel):
+    requests: list[RequestCoverage]
+    physical_rules: list[RuleCoverage]
+    summary: CoverageReviewSummary
+
+
+class ReviewRunResponse(BaseModel):
+    run_id: int
+    review_type: str  # exact | semantic
+    mode: str  # full | incremental
+    since: Optional[datetime] = None
+    watermark: datetime
+    threshold_used: Optional[float] = None
+    rules_evaluated: int
+    requests_evaluated: int
+    deficiencies_added: int
+    deficiencies_updated: int
+    deficiencies_retired: int
+    deficiency_count: int
+    elapsed_ms: Optional[float] = None
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class RuleSyncResult(BaseModel):
+    sync_id: int
+    firewall_devices: list[str]
+    rows_read: int
+    rows_rejected: int
+    rows_received: int
+    duplicates: int
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+    embedding_deferred: bool
+    elapsed_ms: float
+    rows_per_second: Optional[float] = None
+    errors: list[str] = []
+
+
+class RuleSyncResponse(BaseModel):
+    sync_id: int
+    firewall_devices: list[str]
+    rows_received: int
+    duplicates: int
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class RuleChangeResponse(BaseModel):
+    change_id: int
+    sync_id: int
+    rule_id: int
+    firewall_device: str
+    rule_name: str
+    change_type: str
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
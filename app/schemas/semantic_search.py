@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel, computed_field
@@ -32,6 +33,12 @@ class TextSearchRequest(BaseModel):
     search_in: str = "both"  # "rules", "requests", "both"
     threshold: float = 0.7
     limit: int = 10
+    mode: Optional[str] = None  # "exact", "halfvec", "binary", "matryoshka", "local"; defaults to VECTOR_SEARCH_MODE
+    # Filters; firewall_device / action apply to rules, status to requests, port to both
+    firewall_device: Optional[str] = None
+    action: Optional[str] = None
+    status: Optional[str] = None
+    port: Optional[str] = None
 
 
 class TextSearchMatch(BaseModel):
@@ -57,11 +64,64 @@ class TextSearchResult(BaseModel):
     threshold_used: float
 
 
+class SearchModeReport(BaseModel):
+    mode: str
+    recall: Optional[float] = None
+    latency_ms_avg: Optional[float] = None
+    latency_ms_p95: Optional[float] = None
+
+
+class SearchBenchmarkResult(BaseModel):
+    target: str  # "rules" or "requests"
+    sample_size: int
+    limit: int
+    modes: list[SearchModeReport]
+
+
+class QueryCacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    hit_rate: Optional[float] = None
+    evictions: int
+    expirations: int
+    memory_bytes: int
+    shared: bool
+
+
+class LocalIndexStats(BaseModel):
+    table: str
+    generation: Optional[int] = None
+    rows: int
+    alive: int
+    delta: int
+
+
 class EmbeddingStatus(BaseModel):
     total_requests: int
     requests_with_embeddings: int
     total_rules: int
     rules_with_embeddings: int
+    outbox_pending: int = 0
+    outbox_failed: int = 0
+    outbox_oldest_pending_seconds: Optional[float] = None
+
+
+class OutboxRetryResult(BaseModel):
+    requeued: int
+
+
+class EmbeddingClientStats(BaseModel):
+    model: str
+    batch_size: int
+    max_concurrency: int
+    in_flight: int
+    calls: int
+    retries: int
+    failures: int
+    last_latency_ms: Optional[float] = None
 
 
 class EmbeddingGenerateResult(BaseModel):
@@ -69,6 +129,73 @@ class EmbeddingGenerateResult(BaseModel):
     rules_generated: int
     requests_skipped: int
     rules_skipped: int
+    batches: int = 0
+    batch_latency_ms_avg: Optional[float] = None
+    batch_latency_ms_max: Optional[float] = None
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+class EmbeddingJobResponse(BaseModel):
+    job_id: int
+    status: str
+    phase: str
+    force: bool
+    batch_size: Optional[int] = None
+    commit_every: int
+    cancel_requested: bool
+    last_request_id: int
+    last_rule_id: int
+    total_requests: int
+    total_rules: int
+    requests_generated: int
+    rules_generated: int
+    requests_skipped: int
+    rules_skipped: int
+    batches: int
+    batch_latency_ms_total: float
+    batch_latency_ms_max: Optional[float] = None
+    cache_hits: int
+    cache_misses: int
+    run_started_at: Optional[datetime] = None
+    run_processed_offset: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+    @computed_field
+    @property
+    def processed(self) -> int:
+        return self.requests_generated + self.rules_generated
+
+    @computed_field
+    @property
+    def total(self) -> int:
+        return self.total_requests + self.total_rules
+
+    @computed_field
+    @property
+    def progress_percent(self) -> float:
+        return round(100.0 * self.processed / self.total, 1) if self.total else 100.0
+
+    @computed_field
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.run_started_at is None:
+            return None
+        elapsed = (self.updated_at - self.run_started_at).total_seconds()
+        done = self.processed - self.run_processed_offset
+        return round(done / elapsed, 1) if elapsed > 0 and done > 0 else None
+
+    @computed_field
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != "running" or not self.rows_per_second:
+            return None
+        return round((self.total - self.processed) / self.rows_per_second, 1)
 
 
 class SemanticMatchedPair(BaseModel):
@@ -80,6 +207,7 @@ class SemanticMatchedPair(BaseModel):
     destinations: list[str]
     ports: list[str]
     similarity_score: float
+    match_type: str = "semantic"  # "exact" when the canonical fingerprints are equal
 
     @computed_field
     @property
@@ -120,6 +248,7 @@ class SemanticReviewSummary(BaseModel):
     unmatched_rules_count: int
     unmatched_requests_count: int
     threshold_used: float
+    exact_matched_count: int = 0
 
 
 class SemanticReviewResult(BaseModel):
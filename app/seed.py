@@ -168,8 +168,7 @@ def seed_data(db: Session) -> dict:
         text = embedding_service.build_request_text(
             req.name, data["sources"], data["destinations"], data["ports"]
         )
-        req.embedding_text = text
-        req.embedding = embedding_service.embed(text)
+        embedding_service.set_embedding(req, text, embedding_service.embed(text, db))
 
     # Generate embeddings for all seeded physical rules
     all_rules = (
@@ -183,8 +182,7 @@ def seed_data(db: Session) -> dict:
         text = embedding_service.build_rule_text(
             rule.rule_name, rule.action, sources, destinations, rule.ports
         )
-        rule.embedding_text = text
-        rule.embedding = embedding_service.embed(text)
+        embedding_service.set_embedding(rule, text, embedding_service.embed(text, db))
 
     db.commit()
 
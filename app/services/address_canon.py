@@ -0,0 +1,134 @@
+import re
+from functools import lru_cache
+from typing import Iterable
+
+MAX_IPV4 = 0xFFFFFFFF
+MAX_PORT = 65535
+
+_IPV4_RE = re.compile(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
+_PORT_RE = re.compile(r"^(?:(?:tcp|udp)/)?(\d{1,5})(?:\s*-\s*(\d{1,5}))?$")
+_ANY = {"any", "*", "all"}
+
+# Canonical form: (merged integer intervals, sorted tokens that could not be parsed)
+Canonical = tuple[tuple[tuple[int, int], ...], tuple[str, ...]]
+
+
+def ip_to_int(ip: str) -> int | None:
+    """Dotted-quad IPv4 to integer; None unless it is exactly four decimal octets <= 255."""
+    if not _IPV4_RE.match(ip):
+        return None
+    a, b, c, d = (int(octet) for octet in ip.split("."))
+    if a > 255 or b > 255 or c > 255 or d > 255:
+        return None
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def int_to_ip(value: int) -> str:
+    return f"{value >> 24 & 255}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def format_address_interval(lo: int, hi: int) -> str:
+    """Inverse of parse_address: 'any', a host, a CIDR when the interval is aligned, else a range."""
+    if lo == 0 and hi == MAX_IPV4:
+        return "any"
+    if lo == hi:
+        return int_to_ip(lo)
+    size = hi - lo + 1
+    if size & (size - 1) == 0 and lo % size == 0:
+        return f"{int_to_ip(lo)}/{32 - size.bit_length() + 1}"
+    return f"{int_to_ip(lo)}-{int_to_ip(hi)}"
+
+
+def format_port_interval(lo: int, hi: int) -> str:
+    if lo == 0 and hi == MAX_PORT:
+        return "any"
+    return str(lo) if lo == hi else f"{lo}-{hi}"
+
+
+@lru_cache(maxsize=65536)
+def parse_address(address: str) -> tuple[int, int] | None:
+    """Parse a host, CIDR or range into an inclusive integer interval.
+
+    Accepts the notations normalize_address understands ('10.0.0.1', '10.0.0.0/24',
+    '10.0.0.1-10.0.0.50'), plus 'any'. CIDRs with host bits set are masked, like
+    ipaddress.IPv4Network(strict=False). Returns None for anything else.
+    """
+    address = address.strip().lower()
+    if address in _ANY:
+        return 0, MAX_IPV4
+    if "/" in address:
+        network, _, prefix = address.partition("/")
+        start = ip_to_int(network)
+        if start is None or not prefix.isdigit() or int(prefix) > 32:
+            return None
+        size = 1 << (32 - int(prefix))
+        start &= ~(size - 1) & MAX_IPV4
+        return start, start + size - 1
+    if "-" in address:
+        first, _, last = address.partition("-")
+        start, end = ip_to_int(first.strip()), ip_to_int(last.strip())
+        if start is None or end is None or start > end:
+            return None
+        return start, end
+    host = ip_to_int(address)
+    return None if host is None else (host, host)
+
+
+@lru_cache(maxsize=4096)
+def parse_port(port: str) -> tuple[int, int] | None:
+    """Parse '443', '8080-8090', 'tcp/443' or 'any' into an inclusive port interval."""
+    port = port.strip().lower()
+    if port in _ANY:
+        return 0, MAX_PORT
+    match = _PORT_RE.match(port)
+    if not match:
+        return None
+    lo = int(match.group(1))
+    hi = int(match.group(2)) if match.group(2) else lo
+    if lo > hi or hi > MAX_PORT:
+        return None
+    return lo, hi
+
+
+def merge_intervals(intervals: Iterable[tuple[int, int]]) -> tuple[tuple[int, int], ...]:
+    """Sort and merge overlapping or adjacent inclusive intervals."""
+    merged: list[list[int]] = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1][1] = hi
+        else:
+            merged.append([lo, hi])
+    return tuple((lo, hi) for lo, hi in merged)
+
+
+def _canonicalize(values: Iterable[str], parse) -> Canonical:
+    intervals = []
+    unparsed = set()
+    for value in values:
+        interval = parse(value)
+        if interval is None:
+            unparsed.add(value.strip().lower())
+        else:
+            intervals.append(interval)
+    return merge_intervals(intervals), tuple(sorted(unparsed))
+
+
+def canonical_addresses(addresses: Iterable[str]) -> Canonical:
+    """Address list as merged intervals, so every notation of the same address space is equal.
+
+    ['10.0.10.0/24'], ['10.0.10.0-10.0.10.255'] and ['10.0.10.0/25', '10.0.10.128/25']
+    all canonicalize to (((168823296, 168823551),), ()). Unparsable entries are
+    kept verbatim (lower-cased) and only ever equal themselves.
+    """
+    return _canonicalize(addresses, parse_address)
+
+
+def canonical_ports(ports: Iterable[str]) -> Canonical:
+    """Port list as merged intervals: ['80', '81', '82'] equals ['80-82']."""
+    return _canonicalize(ports, parse_port)
+
+
+def fingerprint(sources: Iterable[str], destinations: Iterable[str], ports: Iterable[str]) -> tuple:
+    """Hashable, notation-independent fingerprint of what a rule or request allows."""
+    return canonical_addresses(sources), canonical_addresses(destinations), canonical_ports(ports)
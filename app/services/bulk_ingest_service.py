@@ -0,0 +1,265 @@
+import hashlib
+import io
+import json
+import tempfile
+import time
+from typing import AsyncIterator, Iterable
+
+import psycopg2
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.schemas.physical_rule import PhysicalRuleCreate
+from app.schemas.request import RequestCreate
+from app.services import address_canon, embedding_outbox_service
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+KIND_RULES = "rules"
+KIND_REQUESTS = "requests"
+
+
+class BulkIngestError(ValueError):
+    """A bulk payload row could not be parsed or validated."""
+
+    def __init__(self, message: str, row: int | None = None):
+        super().__init__(message)
+        self.row = row
+
+
+def rule_content_hash(action: str, sources: list[str], destinations: list[str], ports: list[str]) -> str:
+    """Hash of everything a rule matches on; equal hashes mean an unchanged rule.
+
+    Addresses and ports are hashed in their canonical form (address_canon.fingerprint),
+    so reordering, splitting a CIDR or rewriting it as a range does not count as a change.
+    """
+    canonical = json.dumps([action.lower(), address_canon.fingerprint(sources, destinations, ports)])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _copy_escape(value: str) -> str:
+    """Escape a value for the COPY text format."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def array_literal(values: list[str]) -> str:
+    """Postgres text[] literal, e.g. {"443","8080"}."""
+    quoted = ('"' + v.replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values)
+    return "{" + ",".join(quoted) + "}"
+
+
+def copy_line(row: tuple) -> str:
+    """One row in the COPY text format; None is written as NULL."""
+    return "\t".join("\\N" if v is None else _copy_escape(str(v)) for v in row) + "\n"
+
+
+def copy_rows(cursor, table: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+    if not rows:
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(copy_line(row))
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def reserve_ids(db: Session, table: str, pk: str, count: int) -> list[int]:
+    """Take `count` values from the serial sequence of table.pk, so rows can be written with known IDs."""
+    return list(db.execute(
+        text(f"SELECT nextval(pg_get_serial_sequence('{table}', '{pk}')) FROM generate_series(1, :n)"),
+        {"n": count},
+    ).scalars())
+
+
+class CopySpool:
+    """Rows spooled to a temporary file in the COPY text format, to be loaded later.
+
+    Lets a long transaction hand rows to a later, short one without holding
+    them all in memory: the file stays in memory up to 8 MB, then moves to disk.
+    """
+
+    def __init__(self, columns: tuple[str, ...]):
+        self.columns = columns
+        self.rows = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode="w+")
+
+    def write(self, rows: Iterable[tuple]) -> None:
+        for row in rows:
+            self._file.write(copy_line(row))
+            self.rows += 1
+
+    def load(self, db: Session, table: str) -> None:
+        """COPY the spooled rows into `table`, in the session's current transaction."""
+        self._file.seek(0)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(f"COPY {table} ({', '.join(self.columns)}) FROM STDIN", self._file)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BulkIngester:
+    """Load validated rules or requests with COPY, one chunk at a time, in a single transaction.
+
+    IDs are reserved from the table's sequence up front so child rows
+    (sources / destinations) and outbox entries can be written with COPY as well.
+    Unless embedding is deferred, every row is queued in embedding_outbox; with
+    defer_embedding the rows are left for POST /api/embeddings/jobs.
+    Nothing is visible to other sessions until finish() commits.
+    """
+
+    def __init__(self, db: Session, kind: str, defer_embedding: bool = False):
+        if kind not in (KIND_RULES, KIND_REQUESTS):
+            raise ValueError(f"Unknown bulk ingest kind: {kind!r}")
+        self.db = db
+        self.kind = kind
+        self.defer_embedding = defer_embedding
+        self.rows_inserted = 0
+        self.sources_inserted = 0
+        self.destinations_inserted = 0
+        self.embeddings_queued = 0
+        self.started = time.perf_counter()
+
+    @property
+    def schema(self) -> type[BaseModel]:
+        return PhysicalRuleCreate if self.kind == KIND_RULES else RequestCreate
+
+    def add(self, items: list) -> None:
+        """COPY one chunk of PhysicalRuleCreate / RequestCreate items."""
+        if not items:
+            return
+        cursor = self.db.connection().connection.cursor()
+        try:
+            if self.kind == KIND_RULES:
+                ids = reserve_ids(self.db, "physical_rules", "rule_id", len(items))
+                copy_rows(
+                    cursor,
+                    "physical_rules",
+                    ("rule_id", "rule_name", "firewall_device", "ports", "action", "content_hash"),
+                    [
+                        (
+                            rule_id, item.rule_name, item.firewall_device, array_literal(item.ports), item.action,
+                            rule_content_hash(item.action, item.sources, item.destinations, item.ports),
+                        )
+                        for rule_id, item in zip(ids, items)
+                    ],
+                )
+                sources = [(rule_id, a) for rule_id, item in zip(ids, items) for a in item.sources]
+                destinations = [(rule_id, a) for rule_id, item in zip(ids, items) for a in item.destinations]
+                copy_rows(cursor, "physical_rule_sources", ("rule_id", "address"), sources)
+                copy_rows(cursor, "physical_rule_destinations", ("rule_id", "address"), destinations)
+                self.sources_inserted += len(sources)
+                self.destinations_inserted += len(destinations)
+                entity_type = embedding_outbox_service.ENTITY_RULE
+            else:
+                ids = reserve_ids(self.db, "requests", "request_id", len(items))
+                copy_rows(
+                    cursor, "requests", ("request_id", "name", "request_json"),
+                    [
+                        (request_id, item.name, json.dumps(item.request_json.model_dump()))
+                        for request_id, item in zip(ids, items)
+                    ],
+                )
+                entity_type = embedding_outbox_service.ENTITY_REQUEST
+
+            if not self.defer_embedding:
+                # New IDs cannot be queued yet, so a plain COPY is safe here
+                copy_rows(cursor, "embedding_outbox", ("entity_type", "entity_id"), [(entity_type, i) for i in ids])
+                self.embeddings_queued += len(ids)
+        except psycopg2.DataError as exc:
+            # e.g. a value longer than its varchar column
+            first = self.rows_inserted + 1
+            raise BulkIngestError(f"Rows {first}-{first + len(items) - 1}: {str(exc).strip()}", first) from exc
+        finally:
+            cursor.close()
+        self.rows_inserted += len(items)
+
+    def finish(self) -> dict:
+        self.db.commit()
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows_inserted": self.rows_inserted,
+            "sources_inserted": self.sources_inserted,
+            "destinations_inserted": self.destinations_inserted,
+            "embeddings_queued": self.embeddings_queued,
+            "embedding_deferred": self.defer_embedding,
+            "elapsed_ms": round(elapsed * 1000.0, 1),
+            "rows_per_second": round(self.rows_inserted / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def abort(self) -> None:
+        self.db.rollback()
+
+
+def _validate(schema: type[BaseModel], obj, row: int):
+    try:
+        return schema.model_validate(obj)
+    except ValidationError as exc:
+        raise BulkIngestError(f"Row {row}: {exc.errors(include_url=False)}", row) from exc
+
+
+async def read_chunks(http_request, schema: type[BaseModel], chunk_size: int | None = None) -> AsyncIterator[list]:
+    """Yield validated items from a JSON array or NDJSON request body in chunks of chunk_size.
+
+    NDJSON bodies are parsed while they stream in, so memory stays bounded by
+    one chunk; JSON arrays are parsed whole.
+    """
+    chunk_size = chunk_size or settings.BULK_INGEST_CHUNK_SIZE
+    content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type not in NDJSON_CONTENT_TYPES:
+        try:
+            payload = json.loads(await http_request.body())
+        except ValueError as exc:
+            raise BulkIngestError(f"Invalid JSON: {exc}") from exc
+        if not isinstance(payload, list):
+            raise BulkIngestError("Expected a JSON array (or an NDJSON body with Content-Type application/x-ndjson)")
+        for start in range(0, len(payload), chunk_size):
+            yield [_validate(schema, obj, start + i + 1) for i, obj in enumerate(payload[start:start + chunk_size])]
+        return
+
+    chunk: list = []
+    pending = b""
+    row = 0
+    async for data in http_request.stream():
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            row += 1
+            if line.strip():
+                chunk.append(_parse_line(schema, line, row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if pending.strip():
+        chunk.append(_parse_line(schema, pending, row + 1))
+    if chunk:
+        yield chunk
+
+
+def _parse_line(schema: type[BaseModel], line: bytes, row: int):
+    try:
+        obj = json.loads(line)
+    except ValueError as exc:
+        raise BulkIngestError(f"Row {row}: invalid JSON: {exc}", row) from exc
+    return _validate(schema, obj, row)
+
+
+async def ingest(http_request, db: Session, kind: str, defer_embedding: bool = False) -> dict:
+    """Stream a bulk payload into the database chunk by chunk; all-or-nothing."""
+    ingester = BulkIngester(db, kind, defer_embedding)
+    try:
+        async for items in read_chunks(http_request, ingester.schema):
+            await run_in_threadpool(ingester.add, items)
+        return await run_in_threadpool(ingester.finish)
+    except BaseException:
+        await run_in_threadpool(ingester.abort)
+        raise
@@ -0,0 +1,267 @@
+import itertools
+import math
+from typing import Iterator
+
+import numpy as np
+
+from app.services import address_canon
+
+# Column layout of a box: inclusive source, destination and port intervals
+SRC_LO, SRC_HI, DST_LO, DST_HI, PORT_LO, PORT_HI = range(6)
+
+Box = tuple[int, int, int, int, int, int]
+
+# Query boxes expanded into candidate pairs at once; bounds the size of the pair arrays
+_QUERY_CHUNK = 8192
+
+
+def boxes_for(sources: list[str], destinations: list[str], ports: list[str]) -> list[Box] | None:
+    """Cross product of the merged source, destination and port intervals.
+
+    Returns None when any value cannot be parsed (or a list is empty), since the
+    space such an entity describes is unknown.
+    """
+    src, src_unparsed = address_canon.canonical_addresses(sources)
+    dst, dst_unparsed = address_canon.canonical_addresses(destinations)
+    prt, prt_unparsed = address_canon.canonical_ports(ports)
+    if src_unparsed or dst_unparsed or prt_unparsed or not (src and dst and prt):
+        return None
+    return [(s[0], s[1], d[0], d[1], p[0], p[1]) for s, d, p in itertools.product(src, dst, prt)]
+
+
+def volume(box: Box) -> int:
+    return (box[1] - box[0] + 1) * (box[3] - box[2] + 1) * (box[5] - box[4] + 1)
+
+
+def _slabs(boxes: list[Box], axis: int, lo: int, hi: int) -> Iterator[tuple[int, int, list[Box]]]:
+    """Split [lo, hi] on `axis` at every box boundary: (slab_lo, slab_hi, boxes spanning the slab).
+
+    The boxes must lie within [lo, hi] on `axis`. A sweep over the sorted
+    starts and ends keeps the set of boxes spanning the current slab.
+    """
+    lo_i, hi_i = 2 * axis, 2 * axis + 1
+    cuts = sorted({lo, hi + 1}.union(b[lo_i] for b in boxes).union(b[hi_i] + 1 for b in boxes))
+    starts = sorted(range(len(boxes)), key=lambda k: boxes[k][lo_i])
+    ends = sorted(range(len(boxes)), key=lambda k: boxes[k][hi_i])
+    active: dict[int, Box] = {}
+    s = e = 0
+    for start, end in zip(cuts, cuts[1:]):
+        while s < len(starts) and boxes[starts[s]][lo_i] <= start:
+            active[starts[s]] = boxes[starts[s]]
+            s += 1
+        while e < len(ends) and boxes[ends[e]][hi_i] < start:
+            del active[ends[e]]
+            e += 1
+        yield start, end - 1, list(active.values())
+
+
+def _clusters(boxes: list[Box], axis: int) -> Iterator[list[Box]]:
+    """Groups of boxes whose intervals on `axis` chain into one overlapping run."""
+    lo_i, hi_i = 2 * axis, 2 * axis + 1
+    cluster: list[Box] = []
+    reach = 0
+    for box in sorted(boxes, key=lambda b: b[lo_i]):
+        if cluster and box[lo_i] <= reach:
+            cluster.append(box)
+            reach = max(reach, box[hi_i])
+            continue
+        if cluster:
+            yield cluster
+        cluster, reach = [box], box[hi_i]
+    if cluster:
+        yield cluster
+
+
+def union_volume(boxes: list[Box], axis: int = 0) -> int:
+    """Volume of the union of `boxes` on the axes from `axis` on, by nested sweeps.
+
+    Boxes that overlap nothing on `axis` (hosts inside a broad rule, say)
+    add their own volume; only overlapping runs are swept slab by slab.
+    """
+    if axis == 2:
+        return sum(hi - lo + 1 for lo, hi in address_canon.merge_intervals((b[PORT_LO], b[PORT_HI]) for b in boxes))
+    lo_i, hi_i = 2 * axis, 2 * axis + 1
+    total = 0
+    for cluster in _clusters(boxes, axis):
+        if len(cluster) == 1:
+            total += math.prod(cluster[0][2 * a + 1] - cluster[0][2 * a] + 1 for a in range(axis, 3))
+            continue
+        lo, hi = cluster[0][lo_i], max(b[hi_i] for b in cluster)
+        total += sum(
+            (end - start + 1) * union_volume(active, axis + 1)
+            for start, end, active in _slabs(cluster, axis, lo, hi)
+            if active
+        )
+    return total
+
+
+def uncovered_boxes(box: Box, cutters: list[Box], axis: int = 0) -> Iterator[Box]:
+    """Disjoint boxes covering the part of `box` outside every cutter, generated lazily.
+
+    The cutters must lie within `box` (clip them first). Slabs no cutter
+    spans are yielded whole; the others are split on the next axis.
+    """
+    for start, end, active in _slabs(cutters, axis, box[2 * axis], box[2 * axis + 1]):
+        if active and axis == 2:
+            continue
+        slab = list(box)
+        slab[2 * axis], slab[2 * axis + 1] = start, end
+        if active:
+            yield from uncovered_boxes(tuple(slab), active, axis + 1)
+        else:
+            yield tuple(slab)
+
+
+class BoxIndex:
+    """Static index of 3-D boxes for bulk intersection and containment queries.
+
+    Boxes are bucketed by the length class (floor(log2(length))) of their
+    destination interval and sorted by destination start within each bucket.
+    A box in class c is shorter than 2**(c + 1), so every box that can overlap
+    a query destination [lo, hi] starts inside [lo - 2**(c + 1) + 1, hi]: two
+    searchsorted calls per bucket bound the candidates, and the exact
+    destination, source and port checks run vectorized over that slice.
+    With at most 33 buckets this works for host routes and 0.0.0.0/0 alike.
+    """
+
+    def __init__(self, boxes: np.ndarray, owners: np.ndarray):
+        self.size = len(boxes)
+        self.buckets: list[tuple[int, np.ndarray, np.ndarray, np.ndarray]] = []
+        if not self.size:
+            return
+        lengths = boxes[:, DST_HI] - boxes[:, DST_LO] + 1
+        classes = np.floor(np.log2(lengths.astype(np.float64))).astype(np.int64)
+        for cls in np.unique(classes):
+            members = np.flatnonzero(classes == cls)
+            members = members[np.argsort(boxes[members, DST_LO], kind="stable")]
+            max_length = 1 << (int(cls) + 1)
+            self.buckets.append((max_length, boxes[members, DST_LO].copy(), boxes[members], owners[members]))
+
+    @classmethod
+    def build(cls, entities: dict[int, list[Box]]) -> "BoxIndex":
+        """Index the boxes of {owner_id: boxes}."""
+        rows = [box for boxes in entities.values() for box in boxes]
+        owners = [owner for owner, boxes in entities.items() for _ in boxes]
+        return cls(np.array(rows, dtype=np.int64).reshape(-1, 6), np.array(owners, dtype=np.int64))
+
+    def intersecting(self, queries: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """All (query row, indexed box, owner) triples whose boxes overlap."""
+        query_rows, hit_boxes, hit_owners = [], [], []
+        for start in range(0, len(queries), _QUERY_CHUNK):
+            chunk = queries[start:start + _QUERY_CHUNK]
+            for max_length, dst_lo, boxes, owners in self.buckets:
+                first = np.searchsorted(dst_lo, chunk[:, DST_LO] - max_length + 1, side="left")
+                last = np.searchsorted(dst_lo, chunk[:, DST_HI], side="right")
+                counts = np.maximum(last - first, 0)
+                total = int(counts.sum())
+                if not total:
+                    continue
+                q = np.repeat(np.arange(len(chunk)), counts)
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                b = np.repeat(first, counts) + offsets
+                qb, bb = chunk[q], boxes[b]
+                overlap = (
+                    (bb[:, DST_HI] >= qb[:, DST_LO])
+                    & (bb[:, SRC_LO] <= qb[:, SRC_HI]) & (bb[:, SRC_HI] >= qb[:, SRC_LO])
+                    & (bb[:, PORT_LO] <= qb[:, PORT_HI]) & (bb[:, PORT_HI] >= qb[:, PORT_LO])
+                )
+                query_rows.append(q[overlap] + start)
+                hit_boxes.append(bb[overlap])
+                hit_owners.append(owners[b[overlap]])
+        if not query_rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, 6), dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(query_rows), np.concatenate(hit_boxes), np.concatenate(hit_owners)
+
+
+class Coverage:
+    """Coverage of each query entity by the indexed entities, as returned by evaluate().
+
+    Entities are addressed by position in `entity_ids`. `covered_fraction` is
+    the covered share of the entity's address x port space; owners(i) lists
+    the indexed entities overlapping entity i and `remainder[i]` up to
+    max_remainder uncovered boxes (i in `truncated` when there were more).
+    """
+
+    def __init__(self, entity_ids, covered_fraction, owner_bounds, owner_ids, remainder, truncated):
+        self.entity_ids = entity_ids
+        self.covered_fraction = covered_fraction
+        self._owner_bounds = owner_bounds
+        self._owner_ids = owner_ids
+        self.remainder: dict[int, list[Box]] = remainder
+        self.truncated: set[int] = truncated
+
+    def owners(self, i: int) -> list[int]:
+        return self._owner_ids[self._owner_bounds[i]:self._owner_bounds[i + 1]]
+
+
+def evaluate(queries: dict[int, list[Box]], index: BoxIndex, max_remainder: int) -> Coverage:
+    """Measure how much of each query entity's space the indexed boxes cover.
+
+    Volumes, owner sets and query boxes that lie inside a single indexed box
+    are settled in NumPy. For boxes that are overlapped but not contained, the
+    overlapping boxes are clipped to the query box and the covered volume is
+    their union_volume. Remainder boxes are generated only for entities with
+    uncovered space, and only up to max_remainder of them.
+    """
+    entity_ids = list(queries)
+    rows = [box for boxes in queries.values() for box in boxes]
+    row_entity = np.repeat(np.arange(len(entity_ids)), [len(boxes) for boxes in queries.values()])
+    query_array = np.array(rows, dtype=np.int64).reshape(-1, 6)
+    q, hits, owners = index.intersecting(query_array)
+
+    # Volumes overflow int64 (up to 2**80), and only their ratio is reported
+    row_volume = np.prod((query_array[:, 1::2] - query_array[:, 0::2] + 1).astype(np.float64), axis=1)
+    total = np.bincount(row_entity, weights=row_volume, minlength=len(entity_ids))
+
+    contained = np.zeros(len(rows), dtype=bool)
+    if len(q):
+        qb = query_array[q]
+        inside = (
+            (hits[:, SRC_LO] <= qb[:, SRC_LO]) & (hits[:, SRC_HI] >= qb[:, SRC_HI])
+            & (hits[:, DST_LO] <= qb[:, DST_LO]) & (hits[:, DST_HI] >= qb[:, DST_HI])
+            & (hits[:, PORT_LO] <= qb[:, PORT_LO]) & (hits[:, PORT_HI] >= qb[:, PORT_HI])
+        )
+        contained[q[inside]] = True
+
+    # Group hits by query row (q is not sorted across buckets)
+    order = np.argsort(q, kind="stable")
+    q, hits, owners = q[order], hits[order], owners[order]
+    bounds = np.searchsorted(q, np.arange(len(rows) + 1))
+    hit_count = np.diff(bounds)
+
+    uncovered_volume = np.where(hit_count == 0, row_volume, 0.0)
+    remainders: dict[int, list[Box]] = {}
+    truncated: set[int] = set()
+    open_rows = np.flatnonzero(~contained).tolist()
+    bounds_list = bounds.tolist()
+    for row in open_rows:
+        lo, hi = bounds_list[row], bounds_list[row + 1]
+        box = rows[row]
+        cutters: list[Box] = []
+        if lo < hi:
+            clipped = hits[lo:hi].copy()
+            clipped[:, 0::2] = np.maximum(clipped[:, 0::2], query_array[row, 0::2])
+            clipped[:, 1::2] = np.minimum(clipped[:, 1::2], query_array[row, 1::2])
+            # Requests often repeat the same box inside a broad rule
+            cutters = list(dict.fromkeys(map(tuple, clipped.tolist())))
+            left = volume(box) - union_volume(cutters)
+            if not left:
+                continue
+            uncovered_volume[row] = float(left)
+        entity = int(row_entity[row])
+        kept = remainders.setdefault(entity, [])
+        if entity in truncated:
+            continue
+        room = max_remainder - len(kept)
+        fragments = list(itertools.islice(uncovered_boxes(box, cutters), room + 1)) if cutters else [box]
+        kept.extend(fragments[:room])
+        if len(fragments) > room:
+            truncated.add(entity)
+
+    uncovered = np.bincount(row_entity, weights=uncovered_volume, minlength=len(entity_ids))
+    covered_fraction = np.where(total > 0, 1.0 - uncovered / np.where(total > 0, total, 1.0), 0.0)
+
+    # Distinct (entity, owner) pairs, grouped by entity
+    pairs = np.unique(np.stack([row_entity[q], owners], axis=1), axis=0) if len(q) else np.empty((0, 2), dtype=np.int64)
+    owner_bounds = np.searchsorted(pairs[:, 0], np.arange(len(entity_ids) + 1)).tolist()
+    return Coverage(entity_ids, covered_fraction, owner_bounds, pairs[:, 1].tolist(), remainders, truncated)
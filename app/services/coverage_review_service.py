@@ -0,0 +1,193 @@
+import time
+from typing import Iterator
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.schemas.review import (
+    CoverageBox,
+    CoverageReviewResult,
+    CoverageReviewSummary,
+    RequestCoverage,
+    RuleCoverage,
+)
+from app.services import address_canon, coverage_index
+from app.services.review_service import RECORD_SUMMARY, ReviewRecord, begin_snapshot, collect_records, stream_rows
+
+# Uncovered / excess boxes reported per request or rule; the rest are only flagged
+MAX_REMAINDER_BOXES = 20
+
+REQUEST_COVERED = "covered"
+REQUEST_PARTIAL = "partial"
+REQUEST_UNCOVERED = "uncovered"
+RULE_JUSTIFIED = "justified"
+RULE_OVER_PERMISSIVE = "over_permissive"
+RULE_UNREQUESTED = "unrequested"
+UNPARSABLE = "unparsable"
+
+RECORD_REQUEST = "request"
+RECORD_RULE = "rule"
+
+
+def _box(box: coverage_index.Box) -> CoverageBox:
+    return CoverageBox(
+        sources=address_canon.format_address_interval(box[0], box[1]),
+        destinations=address_canon.format_address_interval(box[2], box[3]),
+        ports=address_canon.format_port_interval(box[4], box[5]),
+    )
+
+
+def _status(coverage: coverage_index.Coverage, i: int, full: str, partial: str, none: str) -> str:
+    if i not in coverage.remainder:
+        return full
+    # By overlap rather than fraction: a /32 inside an 'any' rule rounds to 0.0
+    return partial if coverage.owners(i) else none
+
+
+def iter_coverage_review(
+    db: Session, include_covered: bool = False, batch_size: int | None = None
+) -> Iterator[ReviewRecord]:
+    """Containment-based review: which requests the rules cover, and which rules exceed the requests.
+
+    Every request and allow rule is expanded into boxes of source interval x
+    destination interval x port interval (address_canon). A request is covered
+    when the union of the rule boxes contains all of its boxes, partial when
+    some of it is left over, uncovered when nothing is. Symmetrically, a rule
+    is justified when the union of the request boxes contains it, over
+    permissive when it grants more than was requested, unrequested when it
+    overlaps no request at all. Both directions run against a BoxIndex of
+    the other side. Rules with another action than allow are not evaluated;
+    rules carry no order, so deny rules cannot shadow anything here.
+
+    Rules and requests are streamed from server-side cursors inside one
+    snapshot; only their boxes and names are kept. Results are not
+    persisted. Covered requests and justified rules are only
+    counted unless `include_covered` is set. Yields (RECORD_REQUEST,
+    RequestCoverage) items once the requests are evaluated, then
+    (RECORD_RULE, RuleCoverage) items, and (RECORD_SUMMARY,
+    CoverageReviewSummary) last.
+    """
+    batch_size = batch_size or settings.REVIEW_STREAM_BATCH_SIZE
+    begin_snapshot(db)
+    started = time.perf_counter()
+    rule_rows = stream_rows(db, """
+        SELECT p.rule_id, p.rule_name, p.firewall_device, p.action, p.ports,
+               ARRAY(SELECT s.address FROM physical_rule_sources s WHERE s.rule_id = p.rule_id) AS sources,
+               ARRAY(SELECT d.address FROM physical_rule_destinations d WHERE d.rule_id = p.rule_id) AS destinations
+        FROM physical_rules p
+        ORDER BY p.rule_id
+    """, batch_size)
+
+    rule_boxes: dict[int, list[coverage_index.Box]] = {}
+    rule_details: dict[int, tuple[str, str]] = {}
+    unparsable_rules: list[int] = []
+    total_rules = 0
+    for row in rule_rows:
+        total_rules += 1
+        if row.action.lower() != "allow":
+            continue
+        rule_details[row.rule_id] = (row.rule_name, row.firewall_device)
+        boxes = coverage_index.boxes_for(list(row.sources), list(row.destinations), list(row.ports))
+        if boxes is None:
+            unparsable_rules.append(row.rule_id)
+        else:
+            rule_boxes[row.rule_id] = boxes
+
+    request_boxes: dict[int, list[coverage_index.Box]] = {}
+    request_names: dict[int, str] = {}
+    unparsable_requests: list[int] = []
+    total_requests = 0
+    for row in stream_rows(db, "SELECT request_id, name, request_json FROM requests ORDER BY request_id", batch_size):
+        total_requests += 1
+        data = row.request_json
+        request_names[row.request_id] = row.name
+        boxes = coverage_index.boxes_for(data["sources"], data["destinations"], data["ports"])
+        if boxes is None:
+            unparsable_requests.append(row.request_id)
+        else:
+            request_boxes[row.request_id] = boxes
+    # Both sides are in memory as boxes; the evaluation needs no snapshot
+    db.rollback()
+
+    request_coverage = coverage_index.evaluate(
+        request_boxes, coverage_index.BoxIndex.build(rule_boxes), MAX_REMAINDER_BOXES
+    )
+
+    request_counts = {REQUEST_COVERED: 0, REQUEST_PARTIAL: 0, REQUEST_UNCOVERED: 0}
+    for i, request_id in enumerate(request_coverage.entity_ids):
+        status = _status(request_coverage, i, REQUEST_COVERED, REQUEST_PARTIAL, REQUEST_UNCOVERED)
+        request_counts[status] += 1
+        if status == REQUEST_COVERED and not include_covered:
+            continue
+        yield RECORD_REQUEST, RequestCoverage(
+            request_id=request_id,
+            name=request_names[request_id],
+            status=status,
+            covered_fraction=round(float(request_coverage.covered_fraction[i]), 6),
+            covering_rule_ids=request_coverage.owners(i),
+            uncovered=[_box(b) for b in request_coverage.remainder.get(i, [])],
+            uncovered_truncated=i in request_coverage.truncated,
+        )
+    for request_id in unparsable_requests:
+        yield RECORD_REQUEST, RequestCoverage(
+            request_id=request_id,
+            name=request_names[request_id],
+            status=UNPARSABLE,
+            covered_fraction=0.0,
+            covering_rule_ids=[],
+        )
+
+    rule_coverage = coverage_index.evaluate(
+        rule_boxes, coverage_index.BoxIndex.build(request_boxes), MAX_REMAINDER_BOXES
+    )
+    rule_counts = {RULE_JUSTIFIED: 0, RULE_OVER_PERMISSIVE: 0, RULE_UNREQUESTED: 0}
+    for i, rule_id in enumerate(rule_coverage.entity_ids):
+        status = _status(rule_coverage, i, RULE_JUSTIFIED, RULE_OVER_PERMISSIVE, RULE_UNREQUESTED)
+        rule_counts[status] += 1
+        if status == RULE_JUSTIFIED and not include_covered:
+            continue
+        rule_name, firewall_device = rule_details[rule_id]
+        yield RECORD_RULE, RuleCoverage(
+            rule_id=rule_id,
+            rule_name=rule_name,
+            firewall_device=firewall_device,
+            status=status,
+            requested_fraction=round(float(rule_coverage.covered_fraction[i]), 6),
+            request_ids=rule_coverage.owners(i),
+            excess=[_box(b) for b in rule_coverage.remainder.get(i, [])],
+            excess_truncated=i in rule_coverage.truncated,
+        )
+    for rule_id in unparsable_rules:
+        rule_name, firewall_device = rule_details[rule_id]
+        yield RECORD_RULE, RuleCoverage(
+            rule_id=rule_id,
+            rule_name=rule_name,
+            firewall_device=firewall_device,
+            status=UNPARSABLE,
+            requested_fraction=0.0,
+            request_ids=[],
+        )
+
+    yield RECORD_SUMMARY, CoverageReviewSummary(
+        total_physical_rules=total_rules,
+        evaluated_physical_rules=len(rule_details),
+        total_requests=total_requests,
+        covered_requests_count=request_counts[REQUEST_COVERED],
+        partial_requests_count=request_counts[REQUEST_PARTIAL],
+        uncovered_requests_count=request_counts[REQUEST_UNCOVERED],
+        unparsable_requests_count=len(unparsable_requests),
+        justified_rules_count=rule_counts[RULE_JUSTIFIED],
+        over_permissive_rules_count=rule_counts[RULE_OVER_PERMISSIVE],
+        unrequested_rules_count=rule_counts[RULE_UNREQUESTED],
+        unparsable_rules_count=len(unparsable_rules),
+        elapsed_ms=round((time.perf_counter() - started) * 1000.0, 1),
+    )
+
+
+def run_coverage_review(db: Session, include_covered: bool = False) -> CoverageReviewResult:
+    records = collect_records(iter_coverage_review(db, include_covered))
+    return CoverageReviewResult(
+        requests=records[RECORD_REQUEST],
+        physical_rules=records[RECORD_RULE],
+        summary=records[RECORD_SUMMARY],
+    )
@@ -0,0 +1,235 @@
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.structural_encoder import StructuralEncoder
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class EmbeddingClient:
+    """Long-lived Ollama embedding client with sync and async faces.
+
+    Both faces share a keep-alive connection pool per transport, a bound on the
+    number of calls in flight, jittered retries on timeouts and 5xx responses, and
+    an adaptive batch size that shrinks when batches run slower than the target
+    latency and grows again when they run comfortably faster.
+    """
+
+    cacheable = True
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        model: str | None = None,
+        max_concurrency: int | None = None,
+        max_connections: int | None = None,
+        max_retries: int | None = None,
+        request_timeout: float | None = None,
+        timeout_budget: float | None = None,
+        batch_size: int | None = None,
+        min_batch_size: int | None = None,
+        max_batch_size: int | None = None,
+        target_batch_latency_ms: float | None = None,
+    ):
+        self.base_url = base_url or settings.OLLAMA_BASE_URL
+        self.model = model or settings.EMBEDDING_MODEL
+        self.max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+        self.max_connections = max_connections or settings.EMBEDDING_MAX_CONNECTIONS
+        self.max_retries = settings.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.request_timeout = request_timeout or settings.EMBEDDING_REQUEST_TIMEOUT
+        self.timeout_budget = timeout_budget or settings.EMBEDDING_TIMEOUT_BUDGET
+        self.min_batch_size = min_batch_size or settings.EMBEDDING_MIN_BATCH_SIZE
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+        self.target_batch_latency_ms = target_batch_latency_ms or settings.EMBEDDING_TARGET_BATCH_LATENCY_MS
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_semaphore: asyncio.Semaphore | None = None
+        self._client: httpx.Client | None = None
+        self._async_client: httpx.AsyncClient | None = None
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.last_latency_ms: float | None = None
+
+    # -- transport -------------------------------------------------------
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+
+    def _sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(base_url=self.base_url, limits=self._limits())
+            return self._client
+
+    def _aclient(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, limits=self._limits())
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_semaphore = None
+
+    # -- retry and batch sizing ------------------------------------------
+
+    def _payload(self, texts: list[str]) -> dict:
+        return {"model": self.model, "input": texts}
+
+    def _timeout(self, deadline: float) -> httpx.Timeout:
+        remaining = max(deadline - time.monotonic(), 0.1)
+        return httpx.Timeout(min(self.request_timeout, remaining), connect=min(5.0, remaining))
+
+    def _should_retry(self, exc: Exception, attempt: int, deadline: float) -> bool:
+        if attempt >= self.max_retries or time.monotonic() >= deadline:
+            return False
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
+
+    def _backoff(self, attempt: int, deadline: float) -> float:
+        # Full jitter: sleep a random amount up to an exponentially growing cap.
+        cap = min(30.0, 0.5 * (2 ** attempt))
+        return min(random.uniform(0, cap), max(deadline - time.monotonic(), 0.0))
+
+    def _record(self, batch_len: int, latency_ms: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.last_latency_ms = latency_ms
+            if latency_ms > self.target_batch_latency_ms * 1.5:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif latency_ms < self.target_batch_latency_ms * 0.5 and batch_len >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _note_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def _note_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    # -- public API ------------------------------------------------------
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts in a single Ollama call, retrying transient failures."""
+        client = self._sync_client()
+        deadline = time.monotonic() + self.timeout_budget
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with self._semaphore:
+                    self._enter()
+                    try:
+                        resp = client.post(
+                            "/api/embed", json=self._payload(texts), timeout=self._timeout(deadline)
+                        )
+                        resp.raise_for_status()
+                    finally:
+                        self._exit()
+                self._record(len(texts), (time.perf_counter() - started) * 1000.0)
+                return resp.json()["embeddings"]
+            except (httpx.HTTPStatusError, httpx.TransportError) as exc:
+                if not self._should_retry(exc, attempt, deadline):
+                    self._note_failure()
+                    raise
+                self._note_retry()
+                time.sleep(self._backoff(attempt, deadline))
+                attempt += 1
+
+    async def aembed_batch(self, texts: list[str]) -> list[list[float]]:
+        """Async face of embed_batch for use from event-loop code."""
+        client = self._aclient()
+        deadline = time.monotonic() + self.timeout_budget
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                async with self._async_semaphore:
+                    self._enter()
+                    try:
+                        resp = await client.post(
+                            "/api/embed", json=self._payload(texts), timeout=self._timeout(deadline)
+                        )
+                        resp.raise_for_status()
+                    finally:
+                        self._exit()
+                self._record(len(texts), (time.perf_counter() - started) * 1000.0)
+                return resp.json()["embeddings"]
+            except (httpx.HTTPStatusError, httpx.TransportError) as exc:
+                if not self._should_retry(exc, attempt, deadline):
+                    self._note_failure()
+                    raise
+                self._note_retry()
+                await asyncio.sleep(self._backoff(attempt, deadline))
+                attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "batch_size": self.batch_size,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "last_latency_ms": round(self.last_latency_ms, 1) if self.last_latency_ms is not None else None,
+            }
+
+
+_client: "EmbeddingClient | StructuralEncoder | None" = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "EmbeddingClient | StructuralEncoder":
+    """Return the process-wide embedding backend selected by EMBEDDING_BACKEND, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if settings.EMBEDDING_BACKEND == "structural":
+                _client = StructuralEncoder()
+            elif settings.EMBEDDING_BACKEND == "ollama":
+                _client = EmbeddingClient()
+            else:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND: {settings.EMBEDDING_BACKEND!r}")
+        return _client
+
+
+async def shutdown_client() -> None:
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+        await client.aclose()
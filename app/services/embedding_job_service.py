@@ -0,0 +1,256 @@
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator
+
+from sqlalchemy import text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models.embedding_job import EmbeddingJob
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import embedding_service
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# First key of the two-key advisory lock that guarantees one runner per job across processes
+_JOB_LOCK_NAMESPACE = 7301
+
+_threads: dict[int, threading.Thread] = {}
+_threads_lock = threading.Lock()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def submit_job(db: Session, force: bool = False, batch_size: int | None = None, commit_every: int | None = None) -> EmbeddingJob:
+    """Record a new backfill job. The caller decides whether to run it inline or in the background."""
+    job = EmbeddingJob(
+        force=force,
+        batch_size=batch_size,
+        commit_every=commit_every or settings.EMBEDDING_JOB_COMMIT_EVERY,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def start_job(job_id: int) -> None:
+    """Run a job on a background thread unless this process is already running it."""
+    with _threads_lock:
+        thread = _threads.get(job_id)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=run_job, args=(job_id,), name=f"embedding-job-{job_id}", daemon=True)
+        _threads[job_id] = thread
+    thread.start()
+
+
+def resume_jobs() -> None:
+    """Restart every unfinished job; the advisory lock keeps other workers from running it twice."""
+    db = SessionLocal()
+    try:
+        job_ids = [
+            job_id for (job_id,) in
+            db.query(EmbeddingJob.job_id).filter(EmbeddingJob.status.in_(ACTIVE_STATUSES)).all()
+        ]
+    except SQLAlchemyError:
+        # Database not reachable (or not migrated) yet; jobs can be resumed through the API later.
+        return
+    finally:
+        db.close()
+    for job_id in job_ids:
+        start_job(job_id)
+
+
+def cancel_job(db: Session, job: EmbeddingJob) -> EmbeddingJob:
+    """Ask a job to stop after its current chunk. Queued jobs are cancelled immediately."""
+    if job.status in FINISHED_STATUSES:
+        return job
+    job.cancel_requested = True
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = _now()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def run_job(job_id: int) -> EmbeddingJob | None:
+    """Run (or resume) a job to completion, committing every `commit_every` rows.
+
+    Rows are streamed from a separate read session through a server-side cursor,
+    while embeddings, counters and the checkpoint are committed together by the
+    write session, so a restart resumes right after the last committed row.
+    """
+    lock_conn = engine.connect()
+    db = SessionLocal()
+    reader = SessionLocal()
+    try:
+        locked = lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(:ns, :job_id)"),
+            {"ns": _JOB_LOCK_NAMESPACE, "job_id": job_id},
+        ).scalar()
+        lock_conn.commit()
+        if not locked:
+            return db.get(EmbeddingJob, job_id)
+
+        job = db.get(EmbeddingJob, job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+        if job.cancel_requested:
+            return _finish(db, job, "cancelled")
+
+        _begin_run(db, job)
+        try:
+            if job.phase == "requests":
+                if not _embed_requests(db, reader, job):
+                    return _finish(db, job, "cancelled")
+                job.phase = "rules"
+                db.commit()
+            if job.phase == "rules":
+                if not _embed_rules(db, reader, job):
+                    return _finish(db, job, "cancelled")
+                job.phase = "done"
+            return _finish(db, job, "completed")
+        except Exception as exc:
+            db.rollback()
+            job = db.get(EmbeddingJob, job_id)
+            job.error = str(exc)
+            return _finish(db, job, "failed")
+    finally:
+        reader.close()
+        db.close()
+        lock_conn.execute(
+            text("SELECT pg_advisory_unlock(:ns, :job_id)"),
+            {"ns": _JOB_LOCK_NAMESPACE, "job_id": job_id},
+        )
+        lock_conn.commit()
+        lock_conn.close()
+        with _threads_lock:
+            if _threads.get(job_id) is threading.current_thread():
+                del _threads[job_id]
+
+
+def _begin_run(db: Session, job: EmbeddingJob) -> None:
+    if job.status == "queued":
+        request_query = db.query(Request)
+        rule_query = db.query(PhysicalRule)
+        if job.force:
+            job.total_requests = request_query.count()
+            job.total_rules = rule_query.count()
+        else:
+            job.total_requests = request_query.filter(Request.embedding.is_(None)).count()
+            job.total_rules = rule_query.filter(PhysicalRule.embedding.is_(None)).count()
+            job.requests_skipped = request_query.filter(Request.embedding.isnot(None)).count()
+            job.rules_skipped = rule_query.filter(PhysicalRule.embedding.isnot(None)).count()
+    job.status = "running"
+    job.error = None
+    job.run_started_at = _now()
+    job.run_processed_offset = job.requests_generated + job.rules_generated
+    db.commit()
+
+
+def _finish(db: Session, job: EmbeddingJob, status: str) -> EmbeddingJob:
+    job.status = status
+    job.finished_at = _now()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _write_chunk(db: Session, job: EmbeddingJob, model, pk: str, ids: list[int], texts: list[str]) -> bool:
+    """Embed one chunk, write it back with its checkpoint in one commit, and report whether to continue."""
+    stats: dict = {}
+    vectors, latencies = embedding_service.embed_in_batches(texts, job.batch_size, db=db, stats=stats)
+    db.execute(
+        update(model),
+        [
+            {
+                pk: row_id,
+                "embedding_text": t,
+                "embedding": v,
+                "embedding_short": embedding_service.truncate_embedding(v),
+            }
+            for row_id, t, v in zip(ids, texts, vectors)
+        ],
+    )
+
+    if model is Request:
+        job.requests_generated += len(ids)
+        job.last_request_id = ids[-1]
+    else:
+        job.rules_generated += len(ids)
+        job.last_rule_id = ids[-1]
+    job.batches += len(latencies)
+    job.batch_latency_ms_total += sum(latencies)
+    if latencies:
+        job.batch_latency_ms_max = max(job.batch_latency_ms_max or 0.0, max(latencies))
+    job.cache_hits += stats.get("cache_hits", 0)
+    job.cache_misses += stats.get("cache_misses", 0)
+    db.commit()
+
+    # Pick up a cancel request made through another session
+    db.refresh(job)
+    return not job.cancel_requested
+
+
+def _embed_requests(db: Session, reader: Session, job: EmbeddingJob) -> bool:
+    query = (
+        reader.query(Request.request_id, Request.name, Request.request_json)
+        .filter(Request.request_id > job.last_request_id)
+    )
+    if not job.force:
+        query = query.filter(Request.embedding.is_(None))
+    rows = query.order_by(Request.request_id).yield_per(job.commit_every)
+
+    for chunk in _chunks(rows, job.commit_every):
+        ids = [row.request_id for row in chunk]
+        texts = [
+            embedding_service.build_request_text(
+                row.name, row.request_json["sources"], row.request_json["destinations"], row.request_json["ports"]
+            )
+            for row in chunk
+        ]
+        if not _write_chunk(db, job, Request, "request_id", ids, texts):
+            return False
+    return True
+
+
+def _embed_rules(db: Session, reader: Session, job: EmbeddingJob) -> bool:
+    query = (
+        reader.query(PhysicalRule)
+        .options(selectinload(PhysicalRule.sources), selectinload(PhysicalRule.destinations))
+        .filter(PhysicalRule.rule_id > job.last_rule_id)
+    )
+    if not job.force:
+        query = query.filter(PhysicalRule.embedding.is_(None))
+    rules = query.order_by(PhysicalRule.rule_id).yield_per(job.commit_every)
+
+    for chunk in _chunks(rules, job.commit_every):
+        ids = [rule.rule_id for rule in chunk]
+        texts = [
+            embedding_service.build_rule_text(
+                rule.rule_name,
+                rule.action,
+                [s.address for s in rule.sources],
+                [d.address for d in rule.destinations],
+                rule.ports,
+            )
+            for rule in chunk
+        ]
+        if not _write_chunk(db, job, PhysicalRule, "rule_id", ids, texts):
+            return False
+    return True
@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, selectinload
+
+from app.config import settings
+from app.models.embedding_outbox import EmbeddingOutbox
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import embedding_service
+
+# Channel notified by the trigger on embedding_outbox (migration 009)
+OUTBOX_CHANNEL = "embedding_outbox"
+
+ENTITY_REQUEST = "request"
+ENTITY_RULE = "rule"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue(db: Session, entity_type: str, entity_ids: list[int]) -> None:
+    """Queue rows for embedding in the caller's transaction; nothing is sent until it commits.
+
+    Rows already queued are reset so they are picked up again right away.
+    """
+    if not entity_ids:
+        return
+    stmt = pg_insert(EmbeddingOutbox).values([
+        {"entity_type": entity_type, "entity_id": entity_id} for entity_id in entity_ids
+    ])
+    db.execute(
+        stmt.on_conflict_do_update(
+            constraint="uq_embedding_outbox_entity",
+            set_={"attempts": 0, "last_error": None, "available_at": func.now()},
+        )
+    )
+
+
+def queue_depth(db: Session) -> dict:
+    """Pending and dead-lettered outbox entries, plus the age of the oldest pending one."""
+    max_attempts = settings.EMBEDDING_OUTBOX_MAX_ATTEMPTS
+    pending, failed, oldest = db.query(
+        func.count().filter(EmbeddingOutbox.attempts < max_attempts),
+        func.count().filter(EmbeddingOutbox.attempts >= max_attempts),
+        func.min(EmbeddingOutbox.created_at).filter(EmbeddingOutbox.attempts < max_attempts),
+    ).one()
+    return {
+        "outbox_pending": pending,
+        "outbox_failed": failed,
+        "outbox_oldest_pending_seconds": round((_now() - oldest).total_seconds(), 1) if oldest else None,
+    }
+
+
+def retry_failed(db: Session) -> int:
+    """Give entries that exhausted EMBEDDING_OUTBOX_MAX_ATTEMPTS a fresh set of attempts."""
+    result = db.execute(
+        update(EmbeddingOutbox)
+        .where(EmbeddingOutbox.attempts >= settings.EMBEDDING_OUTBOX_MAX_ATTEMPTS)
+        .values(attempts=0, last_error=None, available_at=func.now())
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _load_texts(db: Session, entity_type: str, ids: list[int]) -> dict[int, str]:
+    """Build the current embedding text of each row that still exists."""
+    if not ids:
+        return {}
+    if entity_type == ENTITY_REQUEST:
+        rows = (
+            db.query(Request.request_id, Request.name, Request.request_json)
+            .filter(Request.request_id.in_(ids))
+            .all()
+        )
+        return {
+            row.request_id: embedding_service.build_request_text(
+                row.name, row.request_json["sources"], row.request_json["destinations"], row.request_json["ports"]
+            )
+            for row in rows
+        }
+    rules = (
+        db.query(PhysicalRule)
+        .options(selectinload(PhysicalRule.sources), selectinload(PhysicalRule.destinations))
+        .filter(PhysicalRule.rule_id.in_(ids))
+        .all()
+    )
+    return {
+        rule.rule_id: embedding_service.build_rule_text(
+            rule.rule_name,
+            rule.action,
+            [s.address for s in rule.sources],
+            [d.address for d in rule.destinations],
+            rule.ports,
+        )
+        for rule in rules
+    }
+
+
+def process_batch(db: Session, limit: int | None = None) -> dict:
+    """Claim, embed and clear up to `limit` outbox entries in one transaction.
+
+    Entries are claimed with FOR UPDATE SKIP LOCKED, so any number of workers can
+    drain the outbox concurrently without waiting on or duplicating each other.
+    Embeddings are written and their entries deleted in the same commit. If the
+    embedding backend fails, the entries stay queued with an exponential backoff
+    until EMBEDDING_OUTBOX_MAX_ATTEMPTS is reached.
+    """
+    limit = limit or settings.EMBEDDING_OUTBOX_BATCH_SIZE
+    entries = (
+        db.query(EmbeddingOutbox)
+        .filter(
+            EmbeddingOutbox.available_at <= func.now(),
+            EmbeddingOutbox.attempts < settings.EMBEDDING_OUTBOX_MAX_ATTEMPTS,
+        )
+        .order_by(EmbeddingOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    result = {"claimed": len(entries), "embedded": 0, "missing": 0, "failed": 0}
+    if not entries:
+        db.commit()
+        return result
+
+    texts_by_type = {
+        entity_type: _load_texts(db, entity_type, [e.entity_id for e in entries if e.entity_type == entity_type])
+        for entity_type in (ENTITY_REQUEST, ENTITY_RULE)
+    }
+    work = [(entity_type, entity_id, text) for entity_type, texts in texts_by_type.items() for entity_id, text in texts.items()]
+    result["missing"] = len(entries) - len(work)
+
+    try:
+        # Savepoint: a backend failure rolls back cache writes but keeps the row locks
+        with db.begin_nested():
+            vectors = embedding_service.embed_batch([text for _, _, text in work], db) if work else []
+    except Exception as exc:
+        for entry in entries:
+            entry.attempts += 1
+            entry.last_error = str(exc)
+            entry.available_at = _now() + timedelta(
+                seconds=settings.EMBEDDING_OUTBOX_RETRY_SECONDS * 2 ** (entry.attempts - 1)
+            )
+        db.commit()
+        result["failed"] = len(entries)
+        return result
+
+    for model, pk, entity_type in ((Request, "request_id", ENTITY_REQUEST), (PhysicalRule, "rule_id", ENTITY_RULE)):
+        rows = [
+            {
+                pk: entity_id,
+                "embedding_text": text,
+                "embedding": vector,
+                "embedding_short": embedding_service.truncate_embedding(vector),
+            }
+            for (kind, entity_id, text), vector in zip(work, vectors)
+            if kind == entity_type
+        ]
+        if rows:
+            db.execute(update(model), rows)
+
+    for entry in entries:
+        db.delete(entry)
+    db.commit()
+    result["embedded"] = len(work)
+    return result
+
+
+def drain(db: Session, limit: int | None = None) -> dict:
+    """Process batches until no claimable entry is left; returns the summed counters."""
+    totals = {"claimed": 0, "embedded": 0, "missing": 0, "failed": 0}
+    while True:
+        result = process_batch(db, limit)
+        for key in totals:
+            totals[key] += result[key]
+        if result["claimed"] == 0 or result["failed"]:
+            return totals
@@ -1,9 +1,19 @@
+import hashlib
 import ipaddress
+import math
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
-import httpx
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
 
 from app.config import settings
+from app.models.embedding_cache import EmbeddingCache
+from app.services.embedding_client import get_client
+
+_RANGE_RE = re.compile(r"^(\d+\.\d+\.\d+\.\d+)-(\d+\.\d+\.\d+\.\d+)$")
 
 
 def normalize_address(address: str) -> str:
@@ -16,7 +26,7 @@ def normalize_address(address: str) -> str:
     address = address.strip()
 
     # Check for range format: x.x.x.x-y.y.y.y
-    range_match = re.match(r"^(\d+\.\d+\.\d+\.\d+)-(\d+\.\d+\.\d+\.\d+)$", address)
+    range_match = _RANGE_RE.match(address)
     if range_match:
         start_ip = range_match.group(1)
         end_ip = range_match.group(2)
@@ -75,23 +85,142 @@ def build_rule_text(rule_name: str, action: str, sources: list[str], destination
     )
 
 
-def embed(text: str) -> list[float]:
-    """Generate a single embedding vector via Ollama API."""
-    with httpx.Client(timeout=120.0) as client:
-        resp = client.post(
-            f"{settings.OLLAMA_BASE_URL}/api/embed",
-            json={"model": settings.EMBEDDING_MODEL, "input": text},
-        )
-        resp.raise_for_status()
-        return resp.json()["embeddings"][0]
+def truncate_embedding(vector) -> list[float]:
+    """Matryoshka truncation: the leading EMBEDDING_SHORT_DIMENSIONS dimensions, re-normalized."""
+    head = [float(x) for x in vector[:settings.EMBEDDING_SHORT_DIMENSIONS]]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+
+def set_embedding(entity, text: str, vector) -> None:
+    """Store the embedding text, full vector and truncated vector on a Request or PhysicalRule."""
+    entity.embedding_text = text
+    entity.embedding = vector
+    entity.embedding_short = truncate_embedding(vector)
+
+
+def text_hash(text: str) -> str:
+    """Return the content address of an embedding text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 
+def _embed_with_cache(
+    db: Session,
+    texts: list[str],
+    embed_missing: Callable[[list[str]], list[list[float]]],
+    stats: dict | None,
+) -> list[list[float]]:
+    """Serve texts from embedding_cache, embedding each distinct unseen text exactly once.
 
-def embed_batch(texts: list[str]) -> list[list[float]]:
-    """Generate embedding vectors for multiple texts via Ollama API."""
-    with httpx.Client(timeout=300.0) as client:
-        resp = client.post(
-            f"{settings.OLLAMA_BASE_URL}/api/embed",
-            json={"model": settings.EMBEDDING_MODEL, "input": texts},
+    Backends that are cheaper to run than a cache lookup bypass the cache.
+    """
+    client = get_client()
+    if not client.cacheable:
+        return embed_missing(texts)
+
+    hashes = [text_hash(t) for t in texts]
+    unique: dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        unique.setdefault(h, t)
+
+    vectors: dict[str, list[float]] = {}
+    if unique:
+        rows = (
+            db.query(EmbeddingCache.text_hash, EmbeddingCache.embedding)
+            .filter(
+                EmbeddingCache.model == client.model,
+                EmbeddingCache.text_hash.in_(list(unique)),
+            )
+            .all()
         )
-        resp.raise_for_status()
-        return resp.json()["embeddings"]
+        vectors = {h: list(vec) for h, vec in rows}
+
+    missing = [h for h in unique if h not in vectors]
+    if missing:
+        embedded = embed_missing([unique[h] for h in missing])
+        for h, vec in zip(missing, embedded):
+            vectors[h] = vec
+        db.execute(
+            pg_insert(EmbeddingCache)
+            .values([
+                {"text_hash": h, "model": client.model, "embedding": vectors[h]}
+                for h in missing
+            ])
+            .on_conflict_do_nothing()
+        )
+
+    if stats is not None:
+        stats["cache_hits"] = stats.get("cache_hits", 0) + len(unique) - len(missing)
+        stats["cache_misses"] = stats.get("cache_misses", 0) + len(missing)
+        stats["duplicates"] = stats.get("duplicates", 0) + len(texts) - len(unique)
+
+    return [vectors[h] for h in hashes]
+
+
+def embed(text: str, db: Session | None = None, stats: dict | None = None) -> list[float]:
+    """Generate a single embedding vector via Ollama API.
+
+    When a session is given, embedding_cache is consulted first and new vectors are stored in it.
+    """
+    if db is not None:
+        return embed_batch([text], db, stats)[0]
+    return get_client().embed_batch([text])[0]
+
+
+def embed_batch(texts: list[str], db: Session | None = None, stats: dict | None = None) -> list[list[float]]:
+    """Generate embedding vectors for multiple texts via Ollama API.
+
+    When a session is given, duplicate texts are embedded once and cached vectors are reused.
+    """
+    if db is not None:
+        return _embed_with_cache(db, texts, get_client().embed_batch, stats)
+    return get_client().embed_batch(texts)
+
+
+async def aembed(text: str) -> list[float]:
+    """Async variant of embed for event-loop callers (no cache lookup)."""
+    return (await get_client().aembed_batch([text]))[0]
+
+
+async def aembed_batch(texts: list[str]) -> list[list[float]]:
+    """Async variant of embed_batch for event-loop callers (no cache lookup)."""
+    return await get_client().aembed_batch(texts)
+
+
+def embed_in_batches(
+    texts: list[str],
+    batch_size: int | None = None,
+    max_concurrency: int | None = None,
+    db: Session | None = None,
+    stats: dict | None = None,
+) -> tuple[list[list[float]], list[float]]:
+    """Embed texts in fixed-size batches, running up to max_concurrency batches at once.
+
+    Returns the vectors in input order and the latency of each batch in milliseconds.
+    When a session is given, only texts missing from embedding_cache are sent to Ollama.
+    Without an explicit batch_size, the shared client's adaptive batch size is used.
+    """
+    client = get_client()
+    batch_size = batch_size or client.batch_size
+    max_concurrency = max_concurrency or client.max_concurrency
+    latencies: list[float] = []
+
+    def _timed(batch: list[str]) -> tuple[list[list[float]], float]:
+        started = time.perf_counter()
+        vectors = client.embed_batch(batch)
+        return vectors, (time.perf_counter() - started) * 1000.0
+
+    def _embed_parallel(pending: list[str]) -> list[list[float]]:
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        if not batches:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as pool:
+            results = list(pool.map(_timed, batches))
+        latencies.extend(latency for _, latency in results)
+        return [vec for batch_vectors, _ in results for vec in batch_vectors]
+
+    if db is not None:
+        vectors = _embed_with_cache(db, texts, _embed_parallel, stats)
+    else:
+        vectors = _embed_parallel(texts)
+    return vectors, latencies
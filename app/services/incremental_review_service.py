@@ -0,0 +1,306 @@
+import time
+from functools import partial
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.models.review_run import ReviewRun
+from app.models.rule_sync import RuleChange
+from app.models.semantic_deficiency import SemanticDeficiency
+from app.models.semantic_match import SemanticMatch
+from app.services import review_state, rule_sync_service, vector_search
+from app.services.review_service import run_review_sql
+from app.services.semantic_review_service import best_matches, evaluate_requests, evaluate_rules, run_semantic_review
+
+
+def run_incremental_review(db: Session) -> ReviewRun:
+    """Exact-match review of only what changed since the last exact review.
+
+    An entity's exact-match outcome depends only on which rules and requests
+    share its fingerprint. So the affected fingerprints are collected: the old
+    and new fingerprints of rules changed since the watermark, those of rules
+    deleted by syncs, and those of new requests. Only rules and requests with
+    one of those fingerprints are re-evaluated, and their deficiency rows are
+    added or retired. Unaffected rows (and their deficiency_ids) are left
+    alone. Falls back to a full run_review_sql when no exact review ran yet.
+    """
+    previous = review_state.last_run(db, review_state.REVIEW_EXACT)
+    if previous is None:
+        run_review_sql(db)
+        return review_state.last_run(db, review_state.REVIEW_EXACT)
+
+    started = time.perf_counter()
+    watermark = review_state.safe_watermark(db)
+    params = {"since": previous.watermark}
+
+    db.execute(text("""
+        CREATE TEMP TABLE review_changed_rules ON COMMIT DROP AS
+        SELECT rule_id, reviewed_fingerprint AS old_fingerprint
+        FROM physical_rules
+        WHERE updated_at >= :since OR reviewed_fingerprint IS NULL
+    """), params)
+    db.execute(text("""
+        UPDATE physical_rules p
+        SET reviewed_fingerprint = v.fingerprint
+        FROM review_changed_rules c
+        JOIN physical_rules_view v ON v.rule_id = c.rule_id
+        WHERE p.rule_id = c.rule_id
+    """))
+    db.execute(text("""
+        CREATE TEMP TABLE review_affected_fingerprints ON COMMIT DROP AS
+        SELECT old_fingerprint AS fingerprint FROM review_changed_rules WHERE old_fingerprint IS NOT NULL
+        UNION
+        SELECT p.reviewed_fingerprint FROM physical_rules p JOIN review_changed_rules c ON c.rule_id = p.rule_id
+        UNION
+        SELECT reviewed_fingerprint FROM rule_changes
+        WHERE change_type = :delete AND created_at >= :since AND reviewed_fingerprint IS NOT NULL
+        UNION
+        SELECT fingerprint FROM requests WHERE updated_at >= :since
+    """), {**params, "delete": rule_sync_service.CHANGE_DELETE})
+    db.execute(text("ANALYZE review_affected_fingerprints"))
+
+    # New outcome of every affected rule and request; requests as in run_review_sql,
+    # where only the highest request_id of a fingerprint counts as matched
+    db.execute(text("""
+        CREATE TEMP TABLE review_affected_rules ON COMMIT DROP AS
+        SELECT p.rule_id,
+               EXISTS (SELECT 1 FROM requests q WHERE q.fingerprint = p.reviewed_fingerprint) AS matched
+        FROM physical_rules p
+        JOIN review_affected_fingerprints f ON f.fingerprint = p.reviewed_fingerprint
+    """))
+    db.execute(text("""
+        CREATE TEMP TABLE review_affected_requests ON COMMIT DROP AS
+        SELECT q.request_id,
+               q.request_id = max(q.request_id) OVER (PARTITION BY q.fingerprint)
+               AND EXISTS (SELECT 1 FROM physical_rules p WHERE p.reviewed_fingerprint = q.fingerprint) AS matched
+        FROM requests q
+        JOIN review_affected_fingerprints f ON f.fingerprint = q.fingerprint
+    """))
+
+    retired = db.execute(text("""
+        DELETE FROM deficiencies d USING review_affected_rules a
+        WHERE d.rule_id = a.rule_id AND a.matched
+    """)).rowcount
+    retired += db.execute(text("""
+        DELETE FROM deficiencies d USING review_affected_requests a
+        WHERE d.request_id = a.request_id AND a.matched
+    """)).rowcount
+    added = db.execute(text("""
+        INSERT INTO deficiencies (type, rule_id)
+        SELECT 'no_matching_request', a.rule_id
+        FROM review_affected_rules a
+        WHERE NOT a.matched AND NOT EXISTS (SELECT 1 FROM deficiencies d WHERE d.rule_id = a.rule_id)
+        ORDER BY a.rule_id
+    """)).rowcount
+    added += db.execute(text("""
+        INSERT INTO deficiencies (type, request_id)
+        SELECT 'no_matching_rule', a.request_id
+        FROM review_affected_requests a
+        WHERE NOT a.matched AND NOT EXISTS (SELECT 1 FROM deficiencies d WHERE d.request_id = a.request_id)
+        ORDER BY a.request_id
+    """)).rowcount
+
+    counts = db.execute(text("""
+        SELECT (SELECT count(*) FROM review_affected_rules) AS rules,
+               (SELECT count(*) FROM review_affected_requests) AS requests
+    """)).one()
+    run = review_state.record_run(
+        db,
+        review_state.REVIEW_EXACT,
+        review_state.MODE_INCREMENTAL,
+        watermark,
+        started,
+        since=previous.watermark,
+        rules_evaluated=counts.rules,
+        requests_evaluated=counts.requests,
+        deficiencies_added=added,
+        deficiencies_retired=retired,
+    )
+    db.commit()
+    return run
+
+
+def _ids(db: Session, query) -> set[int]:
+    return set(db.scalars(query))
+
+
+def run_incremental_semantic_review(db: Session, threshold: float | None = None) -> ReviewRun:
+    """Semantic review of only the rules and requests whose outcome may have changed.
+
+    Rules are re-evaluated when they changed since the watermark, were
+    evaluated before they had an embedding, or had a changed request as their
+    previous best match (semantic_matches or the deficiency's best match).
+    A best match that was deleted since (NULL best match with a score, left
+    by ON DELETE SET NULL) counts as changed. The REVIEW_INCREMENTAL_NEIGHBORS nearest rules of every changed request
+    are re-evaluated too, since it may now be their best match. Requests are
+    re-evaluated when they changed, lost or gained their match, had a changed
+    or deleted rule as best match, or are among the nearest neighbours of a
+    changed rule. Each one is evaluated as in run_semantic_review, and its
+    deficiency row is updated in place, added or retired. The neighbour sets
+    come from the HNSW index, so this is as approximate as the KNN queries
+    themselves. Rows whose own rule or request was deleted are retired. Falls
+    back to a full run when no semantic review ran yet or the threshold differs.
+    """
+    if threshold is None:
+        threshold = settings.SIMILARITY_THRESHOLD
+    previous = review_state.last_run(db, review_state.REVIEW_SEMANTIC)
+    if previous is None or previous.threshold_used != threshold:
+        run_semantic_review(db, threshold)
+        return review_state.last_run(db, review_state.REVIEW_SEMANTIC)
+
+    started = time.perf_counter()
+    watermark = review_state.safe_watermark(db)
+    since = previous.watermark
+    neighbors = settings.REVIEW_INCREMENTAL_NEIGHBORS
+
+    # Rules / requests whose deficiency was recorded before they had an embedding
+    unembedded_rules = (
+        select(SemanticDeficiency.rule_id)
+        .join(PhysicalRule, PhysicalRule.rule_id == SemanticDeficiency.rule_id)
+        .where(SemanticDeficiency.similarity_score.is_(None), PhysicalRule.embedding.is_not(None))
+    )
+    unembedded_requests = (
+        select(SemanticDeficiency.request_id)
+        .join(Request, Request.request_id == SemanticDeficiency.request_id)
+        .where(SemanticDeficiency.similarity_score.is_(None), Request.embedding.is_not(None))
+    )
+    changed_rules = _ids(db, select(PhysicalRule.rule_id).where(PhysicalRule.updated_at >= since))
+    changed_rules |= _ids(db, unembedded_rules)
+    changed_requests = _ids(db, select(Request.request_id).where(Request.updated_at >= since))
+    changed_requests |= _ids(db, unembedded_requests)
+    # Deficiencies whose best match was deleted (the FKs are ON DELETE SET NULL)
+    vanished_match = SemanticDeficiency.similarity_score.is_not(None)
+    deleted_rules = _ids(db, select(RuleChange.rule_id).where(
+        RuleChange.change_type == rule_sync_service.CHANGE_DELETE, RuleChange.created_at >= since
+    ))
+
+    affected_rules = set(changed_rules)
+    if changed_requests:
+        affected_rules |= _ids(db, select(SemanticMatch.rule_id).where(SemanticMatch.request_id.in_(changed_requests)))
+        affected_rules |= _ids(db, select(SemanticDeficiency.rule_id).where(
+            SemanticDeficiency.best_match_request_id.in_(changed_requests)
+        ))
+        affected_rules |= {
+            rule_id
+            for _, rule_id, _ in vector_search.nearest_batch(db, Request, PhysicalRule, list(changed_requests), neighbors)
+        }
+    affected_rules |= _ids(db, select(SemanticDeficiency.rule_id).where(
+        SemanticDeficiency.type == "no_matching_request",
+        SemanticDeficiency.rule_id.is_not(None),
+        SemanticDeficiency.best_match_request_id.is_(None),
+        vanished_match,
+    ))
+    affected_rules -= deleted_rules
+
+    # Previous outcome of the affected and deleted rules
+    stale_rules = affected_rules | deleted_rules
+    previous_matched_requests = _ids(db, select(SemanticMatch.request_id).where(SemanticMatch.rule_id.in_(stale_rules)))
+    db.execute(delete(SemanticMatch).where(SemanticMatch.rule_id.in_(stale_rules)))
+    rule_deficiencies = {
+        d.rule_id: d
+        for d in db.scalars(select(SemanticDeficiency).where(
+            SemanticDeficiency.type == "no_matching_request", SemanticDeficiency.rule_id.in_(stale_rules)
+        ))
+    }
+
+    added = updated = retired = 0
+
+    def settle(existing: SemanticDeficiency | None, fields: dict | None) -> None:
+        """Make the deficiency row match the new outcome (None = no deficiency)."""
+        nonlocal added, updated, retired
+        if fields is None:
+            if existing is not None:
+                db.delete(existing)
+                retired += 1
+        elif existing is None:
+            db.add(SemanticDeficiency(**fields))
+            added += 1
+        elif any(getattr(existing, k) != v for k, v in fields.items()):
+            for k, v in fields.items():
+                setattr(existing, k, v)
+            updated += 1
+
+    for rule_id in deleted_rules:
+        settle(rule_deficiencies.get(rule_id), None)
+    # Rows left without their own rule or request by ON DELETE SET NULL
+    for orphan in db.scalars(select(SemanticDeficiency).where(
+        ((SemanticDeficiency.type == "no_matching_request") & SemanticDeficiency.rule_id.is_(None))
+        | ((SemanticDeficiency.type == "no_matching_rule") & SemanticDeficiency.request_id.is_(None))
+    )):
+        settle(orphan, None)
+
+    # Exact pre-pass on current fingerprints, as in run_semantic_review
+    exact = dict(db.execute(text("""
+        SELECT v.rule_id, max(q.request_id)
+        FROM physical_rules_view v
+        JOIN requests q ON q.fingerprint = v.fingerprint
+        WHERE v.rule_id = ANY(:ids)
+        GROUP BY v.rule_id
+    """), {"ids": list(affected_rules)}).all()) if affected_rules else {}
+
+    new_matches: list[SemanticMatch] = []
+    rules = db.execute(select(PhysicalRule.rule_id, PhysicalRule.embedding.is_not(None)).where(
+        PhysicalRule.rule_id.in_(affected_rules)
+    )).all()
+    outcomes = evaluate_rules(
+        [(rule_id, exact.get(rule_id), embedded) for rule_id, embedded in rules],
+        threshold,
+        partial(best_matches, db, PhysicalRule, Request),
+    )
+    for rule_id, match, deficiency, _ in outcomes:
+        if match is not None:
+            new_matches.append(SemanticMatch(threshold_used=threshold, **match))
+        settle(rule_deficiencies.get(rule_id), deficiency)
+    db.add_all(new_matches)
+    db.flush()
+
+    affected_requests = changed_requests | previous_matched_requests | {m.request_id for m in new_matches}
+    affected_requests |= _ids(db, select(SemanticDeficiency.request_id).where(
+        SemanticDeficiency.best_match_rule_id.in_(changed_rules | deleted_rules)
+    ))
+    affected_requests |= _ids(db, select(SemanticDeficiency.request_id).where(
+        SemanticDeficiency.type == "no_matching_rule",
+        SemanticDeficiency.request_id.is_not(None),
+        SemanticDeficiency.best_match_rule_id.is_(None),
+        vanished_match,
+    ))
+    affected_requests |= {
+        request_id
+        for _, request_id, _ in vector_search.nearest_batch(db, PhysicalRule, Request, list(changed_rules), neighbors)
+    }
+
+    matched_requests = _ids(db, select(SemanticMatch.request_id).where(SemanticMatch.request_id.in_(affected_requests)))
+    request_deficiencies = {
+        d.request_id: d
+        for d in db.scalars(select(SemanticDeficiency).where(
+            SemanticDeficiency.type == "no_matching_rule", SemanticDeficiency.request_id.in_(affected_requests)
+        ))
+    }
+    existing_requests = _ids(db, select(Request.request_id).where(Request.request_id.in_(affected_requests)))
+    unmatched_requests = sorted(existing_requests - matched_requests)
+    for request_id in matched_requests:
+        settle(request_deficiencies.get(request_id), None)
+    outcomes = evaluate_requests(unmatched_requests, threshold, partial(best_matches, db, Request, PhysicalRule))
+    for request_id, deficiency, _ in outcomes:
+        settle(request_deficiencies.get(request_id), deficiency)
+    db.flush()
+
+    run = review_state.record_run(
+        db,
+        review_state.REVIEW_SEMANTIC,
+        review_state.MODE_INCREMENTAL,
+        watermark,
+        started,
+        since=since,
+        threshold_used=threshold,
+        rules_evaluated=len(affected_rules),
+        requests_evaluated=len(affected_requests),
+        deficiencies_added=added,
+        deficiencies_updated=updated,
+        deficiencies_retired=retired,
+    )
+    db.commit()
+    return run
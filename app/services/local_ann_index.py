@@ -0,0 +1,387 @@
+"""Process-local IVF-flat ANN index over memory-mapped snapshot files.
+
+An optional search path (VECTOR_SEARCH_MODE / mode="local") that keeps the
+KNN step out of Postgres. build() writes a snapshot per table into
+LOCAL_ANN_DIR: k-means centroids, the normalized embeddings grouped by
+nearest centroid and their IDs, all as .npy files, and a manifest naming the
+current generation and the pg_snapshot it was read in. Every uvicorn worker
+memory-maps the same files, so the page cache holds one copy.
+
+Rows embedded after the build are kept in a small in-process delta. A
+refresh only reads what committed since the previous one (migration 015):
+rows whose embedding_xid is not visible in the previous pg_snapshot are
+fetched into the delta, and embedding_tombstones written since then mask
+deleted and cleared rows. Snapshot rows that were re-embedded are masked
+too, so a refresh costs O(changes), not O(rows). After the first load,
+searches never wait for it: a due refresh runs in a background thread at most
+every LOCAL_ANN_REFRESH_SECONDS while searches keep using the current state.
+Rebuilding (python -m app.ann_index) folds the delta back into a new
+generation; workers switch on their next refresh. Searches probe the
+LOCAL_ANN_PROBES nearest lists plus the delta, and Postgres is only asked to
+hydrate the final rows.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services import similarity_engine
+
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_PER_LIST = 64
+_PARTS = ("centroids", "offsets", "ids", "vectors")
+
+
+def _manifest_path(table: str) -> str:
+    return os.path.join(settings.LOCAL_ANN_DIR, f"{table}.json")
+
+
+def _part_path(table: str, generation: int, part: str) -> str:
+    return os.path.join(settings.LOCAL_ANN_DIR, f"{table}-{generation}.{part}.npy")
+
+
+def _read_manifest(table: str) -> dict | None:
+    try:
+        with open(_manifest_path(table)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _committed_since(column: str) -> str:
+    """SQL condition: the transaction id in `column` committed after the pg_snapshot :since."""
+    return (
+        f"{column} >= pg_snapshot_xmin(CAST(:since AS pg_snapshot)) "
+        f"AND NOT pg_visible_in_snapshot({column}, CAST(:since AS pg_snapshot))"
+    )
+
+
+def _kmeans(vectors: np.ndarray, lists: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means centroids, trained on a sample of `vectors`."""
+    sample_size = min(len(vectors), lists * _KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = similarity_engine.top_k(sample, centroids, 1)[0][:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=lists) == 0
+        # Lists that lost all their points restart from random sample rows
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+
+def build(db: Session, model) -> dict:
+    """Write a new snapshot generation of `model`'s embeddings and make it current.
+
+    Reads the embeddings with a binary COPY inside one REPEATABLE READ
+    snapshot, clusters them into LOCAL_ANN_LISTS lists (default 4 * sqrt(rows)),
+    and writes the parts before switching the manifest, so readers never see
+    a partial snapshot. Files of older generations are removed; workers that
+    still map them keep reading until their next refresh. Tombstones that no
+    worker can still need, those older than the previous generation, are
+    deleted.
+    """
+    if not settings.LOCAL_ANN_DIR:
+        raise ValueError("LOCAL_ANN_DIR is not set")
+    table = model.__tablename__
+    started = time.perf_counter()
+    if not db.in_transaction():
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    # Taken first, so whatever the COPY misses is picked up by the refreshes
+    since = db.scalar(text("SELECT pg_current_snapshot()::text"))
+    matrix = similarity_engine.copy_embeddings(db, model, None)
+    db.rollback()
+
+    count = len(matrix.ids)
+    lists = min(count, settings.LOCAL_ANN_LISTS or max(1, int(4 * np.sqrt(count))))
+    if count:
+        centroids = _kmeans(matrix.vectors, lists, np.random.default_rng(0))
+        assignment = similarity_engine.top_k(matrix.vectors, centroids, 1)[0][:, 0]
+    else:
+        centroids = np.empty((0, settings.EMBEDDING_DIMENSIONS), np.float32)
+        assignment = np.empty(0, np.int64)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=lists))]).astype(np.int64)
+
+    previous = _read_manifest(table)
+    generation = (previous["generation"] + 1) if previous else 1
+    os.makedirs(settings.LOCAL_ANN_DIR, exist_ok=True)
+    np.save(_part_path(table, generation, "centroids"), centroids)
+    np.save(_part_path(table, generation, "offsets"), offsets)
+    np.save(_part_path(table, generation, "ids"), matrix.ids[order])
+    vectors = np.lib.format.open_memmap(
+        _part_path(table, generation, "vectors"), mode="w+", dtype=np.float32, shape=matrix.vectors.shape
+    )
+    for start in range(0, count, settings.SIMILARITY_BLOCK_SIZE):
+        vectors[start:start + settings.SIMILARITY_BLOCK_SIZE] = matrix.vectors[
+            order[start:start + settings.SIMILARITY_BLOCK_SIZE]
+        ]
+    vectors.flush()
+    del vectors
+
+    manifest = {"table": table, "generation": generation, "rows": count, "lists": lists, "snapshot": since}
+    tmp = f"{_manifest_path(table)}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, _manifest_path(table))
+    current = {_part_path(table, generation, part) for part in _PARTS}
+    for path in glob.glob(os.path.join(settings.LOCAL_ANN_DIR, f"{table}-*.npy")):
+        if path not in current:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    if previous and previous.get("snapshot"):
+        # Workers on the previous generation read tombstones since its snapshot at the earliest
+        db.execute(
+            text(
+                "DELETE FROM embedding_tombstones "
+                "WHERE table_name = :table AND xid < pg_snapshot_xmin(CAST(:since AS pg_snapshot))"
+            ),
+            {"table": table, "since": previous["snapshot"]},
+        )
+        db.commit()
+    return {**manifest, "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1)}
+
+
+@dataclass
+class _Snapshot:
+    generation: int
+    centroids: np.ndarray
+    offsets: np.ndarray
+    ids: np.ndarray
+    vectors: np.ndarray
+    # pg_snapshot the embeddings were read in
+    since: str
+    # Positions of the ids in ascending order, and those ids, for the refresh lookups
+    by_id: np.ndarray
+    sorted_ids: np.ndarray
+
+    def positions(self, ids: list[int]) -> np.ndarray:
+        """Positions of those of `ids` that are in the snapshot."""
+        if not len(self.ids) or not ids:
+            return np.empty(0, np.int64)
+        ids = np.array(ids, np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_ids, ids), len(self.sorted_ids) - 1)
+        return self.by_id[pos[self.sorted_ids[pos] == ids]]
+
+
+@dataclass
+class _State:
+    snapshot: _Snapshot
+    # pg_snapshot the state is current as of
+    since: str
+    alive: np.ndarray
+    delta_ids: np.ndarray
+    delta_vectors: np.ndarray
+    refreshed_at: float
+
+
+def _load_snapshot(table: str, manifest: dict) -> _Snapshot:
+    generation = manifest["generation"]
+    parts = {part: np.load(_part_path(table, generation, part), mmap_mode="r") for part in _PARTS}
+    by_id = np.argsort(parts["ids"])
+    return _Snapshot(
+        generation=generation, since=manifest["snapshot"], by_id=by_id, sorted_ids=parts["ids"][by_id], **parts
+    )
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, settings.EMBEDDING_DIMENSIONS)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class LocalIndex:
+    """The current snapshot of one table plus this worker's delta."""
+
+    def __init__(self, model):
+        self.model = model
+        self.table = model.__tablename__
+        self._state: _State | None = None
+        self._lock = threading.Lock()
+        # Held while a background refresh is running
+        self._refreshing = threading.Lock()
+
+    def _due(self, state: _State) -> bool:
+        return time.monotonic() - state.refreshed_at >= settings.LOCAL_ANN_REFRESH_SECONDS
+
+    def current(self) -> _State | None:
+        """The state to search; None while no snapshot has been built.
+
+        Loaded on first use. After that a due refresh runs in a background
+        thread and this returns the current state without waiting for it.
+        """
+        state = self._state
+        if state is None:
+            return self.refresh()
+        if self._due(state) and self._refreshing.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name=f"local-ann-{self.table}", daemon=True).start()
+        return state
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        finally:
+            self._refreshing.release()
+
+    def refresh(self) -> _State | None:
+        """Reload the manifest and apply the embedding changes committed since the last refresh.
+
+        Returns None while no snapshot has been built, or if it was built
+        before migration 015 and has no snapshot to start from.
+        """
+        with self._lock:
+            state = self._state
+            snapshot = None
+            # A rebuild may remove the generation between reading the manifest and its files
+            for _ in range(2):
+                manifest = _read_manifest(self.table)
+                if manifest is None or "snapshot" not in manifest:
+                    self._state = None
+                    return None
+                if state is not None and state.snapshot.generation == manifest["generation"]:
+                    snapshot = state.snapshot
+                    break
+                try:
+                    snapshot = _load_snapshot(self.table, manifest)
+                    state = None
+                    break
+                except FileNotFoundError:
+                    continue
+            if snapshot is None:
+                return self._state
+            self._state = self._apply_changes(snapshot, state)
+            return self._state
+
+    def _apply_changes(self, snapshot: _Snapshot, previous: _State | None) -> _State:
+        model = self.model
+        pk = model.__mapper__.primary_key[0]
+        since = previous.since if previous is not None else snapshot.since
+        db = SessionLocal()
+        try:
+            # One snapshot for the changes and the new `since`
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            gone = db.scalars(
+                text(
+                    "SELECT DISTINCT row_id FROM embedding_tombstones "
+                    f"WHERE table_name = :table AND {_committed_since('xid')}"
+                ),
+                {"table": self.table, "since": since},
+            ).all()
+            embedded = db.execute(
+                select(pk, model.embedding).where(
+                    model.embedding.isnot(None), text(_committed_since("embedding_xid")).bindparams(since=since)
+                )
+            ).all()
+            now = db.scalar(text("SELECT pg_current_snapshot()::text"))
+        finally:
+            db.close()
+
+        if previous is None:
+            alive = np.ones(len(snapshot.ids), bool)
+            delta_ids = np.empty(0, np.int64)
+            delta_vectors = np.empty((0, settings.EMBEDDING_DIMENSIONS), np.float32)
+        else:
+            alive, delta_ids, delta_vectors = previous.alive, previous.delta_ids, previous.delta_vectors
+        changed = set(gone).union(row_id for row_id, _ in embedded)
+        if changed:
+            # Snapshot rows that were re-embedded, cleared or deleted since the build
+            rows = snapshot.positions(list(changed))
+            if len(rows):
+                alive = alive.copy()
+                alive[rows] = False
+            # Searches may still hold the previous arrays, so the delta is rebuilt, not edited
+            keep = ~np.isin(delta_ids, list(changed))
+            delta_ids = np.concatenate([delta_ids[keep], np.array([row_id for row_id, _ in embedded], np.int64)])
+            delta_vectors = np.concatenate([
+                delta_vectors[keep],
+                _normalized([embedding for _, embedding in embedded]) if embedded else delta_vectors[:0],
+            ])
+        return _State(
+            snapshot=snapshot,
+            since=now,
+            alive=alive,
+            delta_ids=delta_ids,
+            delta_vectors=delta_vectors,
+            refreshed_at=time.monotonic(),
+        )
+
+    def search(self, query_vector, limit: int, max_distance: float | None = None) -> list[tuple[int, float]] | None:
+        """(id, cosine_distance) of the `limit` nearest rows, closest first; None without a snapshot.
+
+        With `max_distance`, only rows within it count: lists are probed in
+        centroid order past LOCAL_ANN_PROBES until `limit` of them are found or
+        VECTOR_MAX_SCAN_TUPLES rows were scored, like pgvector's iterative scan.
+        """
+        state = self.current()
+        if state is None:
+            return None
+        query = _normalized(query_vector)[0]
+        snapshot = state.snapshot
+        min_sim = None if max_distance is None else 1.0 - max_distance
+        cand_ids, cand_sims = [state.delta_ids], [state.delta_vectors @ query]
+        found = 0 if min_sim is None else int((cand_sims[0] >= min_sim).sum())
+        if len(snapshot.centroids):
+            probes = min(settings.LOCAL_ANN_PROBES, len(snapshot.centroids))
+            if min_sim is None:
+                lists = np.argpartition(-(snapshot.centroids @ query), probes - 1)[:probes]
+            else:
+                lists = np.argsort(-(snapshot.centroids @ query), kind="stable")
+            scanned = 0
+            for probed, i in enumerate(lists):
+                if probed >= probes and (found >= limit or scanned >= settings.VECTOR_MAX_SCAN_TUPLES):
+                    break
+                start, end = int(snapshot.offsets[i]), int(snapshot.offsets[i + 1])
+                alive = state.alive[start:end]
+                sims = (snapshot.vectors[start:end] @ query)[alive]
+                cand_ids.append(snapshot.ids[start:end][alive])
+                cand_sims.append(sims)
+                scanned += end - start
+                if min_sim is not None:
+                    found += int((sims >= min_sim).sum())
+        ids, sims = np.concatenate(cand_ids), np.concatenate(cand_sims)
+        if min_sim is not None:
+            keep = sims >= min_sim
+            ids, sims = ids[keep], sims[keep]
+        if len(ids) > limit:
+            top = np.argpartition(-sims, limit - 1)[:limit]
+            ids, sims = ids[top], sims[top]
+        order = np.argsort(-sims, kind="stable")
+        return [(int(i), float(1.0 - s)) for i, s in zip(ids[order], sims[order])]
+
+    def stats(self) -> dict:
+        state = self._state
+        if state is None:
+            return {"table": self.table, "generation": None, "rows": 0, "alive": 0, "delta": 0}
+        return {
+            "table": self.table,
+            "generation": state.snapshot.generation,
+            "rows": len(state.snapshot.ids),
+            "alive": int(state.alive.sum()),
+            "delta": len(state.delta_ids),
+        }
+
+
+_indexes: dict[str, LocalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get(model) -> LocalIndex:
+    """This process's index of `model`'s table."""
+    with _indexes_lock:
+        index = _indexes.get(model.__tablename__)
+        if index is None:
+            index = _indexes[model.__tablename__] = LocalIndex(model)
+        return index
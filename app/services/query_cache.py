@@ -0,0 +1,108 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services import embedding_service
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a free-text query: trimmed, lowercased, single-spaced."""
+    return _WHITESPACE_RE.sub(" ", query.strip().lower())
+
+
+class QueryEmbeddingCache:
+    """Bounded in-process LRU cache with TTL, mapping normalized query text to its embedding.
+
+    Vectors are stored as packed float32 arrays to keep the footprint at roughly
+    4 bytes per dimension.
+    """
+
+    def __init__(self, max_entries: int | None = None, ttl_seconds: float | None = None):
+        self.max_entries = max_entries or settings.QUERY_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.QUERY_CACHE_TTL_SECONDS
+        self._entries: OrderedDict[tuple[str, str], tuple[float, array]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: tuple[str, str]) -> list[float] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, vector = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+    def put(self, key: tuple[str, str], vector: list[float]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), array("f", vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            memory = sum(
+                sys.getsizeof(key[1]) + vector.itemsize * len(vector) + 64
+                for key, (_, vector) in self._entries.items()
+            )
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "memory_bytes": memory,
+                "shared": settings.QUERY_CACHE_SHARED,
+            }
+
+
+query_cache = QueryEmbeddingCache()
+
+
+def embed_query(query: str, db: Session) -> list[float]:
+    """Embed a free-text query, answering repeats from the in-process cache.
+
+    On a local miss with QUERY_CACHE_SHARED enabled, the Postgres-backed
+    embedding_cache table is consulted (and filled) so other workers benefit.
+    """
+    text = normalize_query(query)
+    key = (embedding_service.get_client().model, text)
+    vector = query_cache.get(key)
+    if vector is not None:
+        return vector
+
+    if settings.QUERY_CACHE_SHARED:
+        vector = [float(x) for x in embedding_service.embed(text, db)]
+        db.commit()
+    else:
+        vector = embedding_service.embed(text)
+    query_cache.put(key, vector)
+    return vector
@@ -1,134 +1,327 @@
-from sqlalchemy.orm import Session, joinedload
+import time
+from collections import defaultdict
+from typing import Iterable, Iterator
 
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
 from app.models.deficiency import Deficiency
-from app.models.physical_rule import PhysicalRule
-from app.models.request import Request
 from app.schemas.review import (
     MatchedPair,
     ReviewResult,
     ReviewSummary,
+    SqlReviewResult,
     UnmatchedRequest,
     UnmatchedRule,
 )
+from app.services import address_canon, review_state
+from app.services.bulk_ingest_service import CopySpool, reserve_ids
 
 
 def _build_fingerprint(sources: list[str], destinations: list[str], ports: list[str]) -> tuple:
-    return (
-        frozenset(sources),
-        frozenset(destinations),
-        frozenset(ports),
-    )
+    # Canonical merged intervals: '10.0.10.0/24' and '10.0.10.0-10.0.10.255' fingerprint the same
+    return address_canon.fingerprint(sources, destinations, ports)
 
 
-def run_review(db: Session) -> ReviewResult:
-    # Clear previous deficiencies
-    db.query(Deficiency).delete()
-    db.flush()
-
-    physical_rules = (
-        db.query(PhysicalRule)
-        .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
-        .all()
+def clear_table(db: Session, model) -> None:
+    """Empty a results table with TRUNCATE.
+
+    TRUNCATE takes an ACCESS EXCLUSIVE lock, so every reader of the table
+    waits until the transaction ends; call this right before the new rows are
+    inserted and commit soon after.
+    """
+    db.execute(text(f"TRUNCATE {model.__tablename__}"))
+
+
+# Columns of the results tables that reference rules or requests. A staged row whose own rule or
+# request is gone is dropped; a vanished best match is cleared, as ON DELETE SET NULL does.
+_REFERENCES = {
+    "rule_id": ("physical_rules", "rule_id"),
+    "request_id": ("requests", "request_id"),
+    "best_match_rule_id": ("physical_rules", "rule_id"),
+    "best_match_request_id": ("requests", "request_id"),
+}
+
+
+class ResultStage:
+    """A streaming review's result rows, kept out of the results table until the review ends.
+
+    The streaming reviews run at their client's pace, so they must not write
+    the results table meanwhile: its locks would be held for the whole
+    download. IDs are reserved from the table's sequence instead, so streamed
+    items carry their final IDs, and the rows are spooled to a temporary file.
+    swap() writes them at the end.
+    """
+
+    def __init__(self, db: Session, model, references: tuple[str, ...] = ()):
+        self.db = db
+        self.table = model.__tablename__
+        self.pk = model.__mapper__.primary_key[0].name
+        self.references = references
+        # Columns with a server default (created_at) are left to the table
+        self.spool = CopySpool(tuple(c.name for c in model.__table__.columns if c.server_default is None))
+
+    def add(self, rows: list[dict]) -> list[int]:
+        """Stage rows and return their primary keys, reserving IDs for rows without one; missing columns are NULL."""
+        if not rows:
+            return []
+        if self.pk not in rows[0]:
+            ids = reserve_ids(self.db, self.table, self.pk, len(rows))
+            rows = [{self.pk: row_id, **row} for row_id, row in zip(ids, rows)]
+        self.spool.write(tuple(row.get(column) for column in self.spool.columns) for row in rows)
+        return [row[self.pk] for row in rows]
+
+    def swap(self) -> int:
+        """Replace the table's rows with the staged ones; returns the number of rows replaced.
+
+        Uses DELETE, not TRUNCATE, so readers keep seeing the old rows until
+        commit. Run it in a short READ COMMITTED transaction after the
+        review's snapshot transaction: rules deleted since the snapshot are
+        then visible, and the staged rows are adjusted to them (_REFERENCES).
+        """
+        retired = self.db.execute(text(f"DELETE FROM {self.table}")).rowcount
+        staging = f"staged_{self.table}"
+        self.db.execute(text(f"CREATE TEMP TABLE {staging} (LIKE {self.table} INCLUDING DEFAULTS) ON COMMIT DROP"))
+        self.spool.load(self.db, staging)
+        self.spool.close()
+        for column in self.references:
+            table, key = _REFERENCES[column]
+            missing = f"{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = s.{column})"
+            if column.startswith("best_match_"):
+                self.db.execute(text(f"UPDATE {staging} s SET {column} = NULL WHERE {missing}"))
+            else:
+                self.db.execute(text(f"DELETE FROM {staging} s WHERE {missing}"))
+        self.db.execute(text(f"INSERT INTO {self.table} SELECT * FROM {staging}"))
+        return retired
+
+
+# Record kinds yielded by the iter_* reviews; the summary always comes last
+RECORD_MATCHED = "matched"
+RECORD_UNMATCHED_RULE = "unmatched_rule"
+RECORD_UNMATCHED_REQUEST = "unmatched_request"
+RECORD_SUMMARY = "summary"
+
+ReviewRecord = tuple[str, BaseModel]
+
+
+def collect_records(records: Iterable[ReviewRecord]) -> dict:
+    """Gather a record stream into {kind: [items]} plus the summary item under "summary"."""
+    collected: dict = defaultdict(list)
+    for kind, item in records:
+        if kind == RECORD_SUMMARY:
+            collected[kind] = item
+        else:
+            collected[kind].append(item)
+    return collected
+
+
+def stream_rows(db: Session, sql: str, batch_size: int):
+    """Rows of a query read from a server-side cursor, `batch_size` at a time."""
+    return db.execute(text(sql), execution_options={"yield_per": batch_size})
+
+
+def begin_snapshot(db: Session) -> None:
+    # The streaming reviews read rules and requests in several passes; one snapshot keeps them consistent.
+    # The isolation level can only be chosen before the transaction's first statement.
+    if not db.in_transaction():
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+def _flush_deficiencies(stage: ResultStage, type_: str, key: str, pending: list[dict], item_type) -> list:
+    """Stage the deficiency rows of `pending` and return its items with their deficiency_id."""
+    ids = stage.add([{"type": type_, key: fields[key]} for fields in pending])
+    items = [item_type(deficiency_id=deficiency_id, **fields) for deficiency_id, fields in zip(ids, pending)]
+    pending.clear()
+    return items
+
+
+def iter_review(db: Session, batch_size: int | None = None) -> Iterator[ReviewRecord]:
+    """Exact-match review that yields its results while they are produced.
+
+    Yields (RECORD_MATCHED, MatchedPair), (RECORD_UNMATCHED_RULE,
+    UnmatchedRule) and (RECORD_UNMATCHED_REQUEST, UnmatchedRequest) items, and
+    (RECORD_SUMMARY, ReviewSummary) last. Rules and requests are read from
+    server-side cursors inside one snapshot. The deficiencies of unmatched
+    ones are staged (ResultStage) a batch at a time, so each yielded item
+    carries its deficiency_id while the deficiencies table is not touched.
+    Only the request fingerprints and the matched request IDs are held in
+    memory. Once everything is yielded, the snapshot ends and the staged rows
+    replace the old ones in a short transaction, just before the summary; a
+    consumer that stops early leaves the previous deficiencies in place.
+    """
+    batch_size = batch_size or settings.REVIEW_STREAM_BATCH_SIZE
+    begin_snapshot(db)
+    started = time.perf_counter()
+    watermark = review_state.safe_watermark(db)
+    stage = ResultStage(db, Deficiency, references=("rule_id", "request_id"))
+
+    # Fingerprint -> request_id for O(R+P) matching; the highest request_id represents a fingerprint
+    fp_to_request: dict[tuple, int] = {}
+    total_requests = 0
+    for request_id, data in stream_rows(db, "SELECT request_id, request_json FROM requests ORDER BY request_id", batch_size):
+        fp_to_request[_build_fingerprint(data["sources"], data["destinations"], data["ports"])] = request_id
+        total_requests += 1
+
+    matched_request_ids: set[int] = set()
+    total_rules = matched_count = unmatched_rules_count = 0
+    pending: list[dict] = []
+    rules = stream_rows(
+        db, "SELECT rule_id, rule_name, sources, destinations, ports FROM physical_rules_view ORDER BY rule_id", batch_size
     )
-    user_requests = db.query(Request).all()
-
-    # Build fingerprints for physical rules
-    rule_fingerprints: dict[int, tuple] = {}
-    rule_details: dict[int, dict] = {}
-    for rule in physical_rules:
-        sources = [s.address for s in rule.sources]
-        destinations = [d.address for d in rule.destinations]
-        rule_fingerprints[rule.rule_id] = _build_fingerprint(sources, destinations, rule.ports)
-        rule_details[rule.rule_id] = {
-            "rule_name": rule.rule_name,
-            "sources": sources,
-            "destinations": destinations,
-            "ports": rule.ports,
+    for row in rules:
+        total_rules += 1
+        details = {
+            "sources": row.sources or [],
+            "destinations": row.destinations or [],
+            "ports": row.ports,
         }
+        req_id = fp_to_request.get(_build_fingerprint(details["sources"], details["destinations"], details["ports"]))
+        if req_id is not None:
+            matched_request_ids.add(req_id)
+            matched_count += 1
+            yield RECORD_MATCHED, MatchedPair(rule_id=row.rule_id, request_id=req_id, **details)
+            continue
+        pending.append({"rule_id": row.rule_id, "rule_name": row.rule_name, **details})
+        if len(pending) >= batch_size:
+            for item in _flush_deficiencies(stage, "no_matching_request", "rule_id", pending, UnmatchedRule):
+                unmatched_rules_count += 1
+                yield RECORD_UNMATCHED_RULE, item
+    for item in _flush_deficiencies(stage, "no_matching_request", "rule_id", pending, UnmatchedRule):
+        unmatched_rules_count += 1
+        yield RECORD_UNMATCHED_RULE, item
 
-    # Build fingerprints for user requests
-    request_fingerprints: dict[int, tuple] = {}
-    request_details: dict[int, dict] = {}
-    for req in user_requests:
-        data = req.request_json
-        request_fingerprints[req.request_id] = _build_fingerprint(
-            data["sources"], data["destinations"], data["ports"]
-        )
-        request_details[req.request_id] = {
-            "name": req.name,
+    unmatched_requests_count = 0
+    for row in stream_rows(db, "SELECT request_id, name, request_json FROM requests ORDER BY request_id", batch_size):
+        if row.request_id in matched_request_ids:
+            continue
+        data = row.request_json
+        pending.append({
+            "request_id": row.request_id,
+            "name": row.name,
             "sources": data["sources"],
             "destinations": data["destinations"],
             "ports": data["ports"],
-        }
+        })
+        if len(pending) >= batch_size:
+            for item in _flush_deficiencies(stage, "no_matching_rule", "request_id", pending, UnmatchedRequest):
+                unmatched_requests_count += 1
+                yield RECORD_UNMATCHED_REQUEST, item
+    for item in _flush_deficiencies(stage, "no_matching_rule", "request_id", pending, UnmatchedRequest):
+        unmatched_requests_count += 1
+        yield RECORD_UNMATCHED_REQUEST, item
 
-    # Build a lookup from fingerprint to request_id for O(R+P) matching
-    fp_to_request: dict[tuple, int] = {}
-    for req_id, fp in request_fingerprints.items():
-        fp_to_request[fp] = req_id
+    # State for the next incremental review, as of the snapshot
+    fingerprints = review_state.spool_rule_fingerprints(db)
+    db.commit()
 
-    matched: list[MatchedPair] = []
-    unmatched_rules: list[UnmatchedRule] = []
-    matched_request_ids: set[int] = set()
+    # Nothing has been written so far; swap in the results with one short transaction
+    retired = stage.swap()
+    review_state.refresh_rule_fingerprints(db, fingerprints)
+    review_state.record_run(
+        db,
+        review_state.REVIEW_EXACT,
+        review_state.MODE_FULL,
+        watermark,
+        started,
+        rules_evaluated=total_rules,
+        requests_evaluated=total_requests,
+        deficiencies_added=unmatched_rules_count + unmatched_requests_count,
+        deficiencies_retired=retired,
+    )
+    db.commit()
 
-    for rule_id, rule_fp in rule_fingerprints.items():
-        req_id = fp_to_request.get(rule_fp)
-        if req_id is not None:
-            details = rule_details[rule_id]
-            matched.append(MatchedPair(
-                rule_id=rule_id,
-                request_id=req_id,
-                sources=details["sources"],
-                destinations=details["destinations"],
-                ports=details["ports"],
-            ))
-            matched_request_ids.add(req_id)
-        else:
-            details = rule_details[rule_id]
-            deficiency = Deficiency(
-                type="no_matching_request",
-                rule_id=rule_id,
-            )
-            db.add(deficiency)
-            db.flush()
-            unmatched_rules.append(UnmatchedRule(
-                deficiency_id=deficiency.deficiency_id,
-                rule_id=rule_id,
-                rule_name=details["rule_name"],
-                sources=details["sources"],
-                destinations=details["destinations"],
-                ports=details["ports"],
-            ))
-
-    unmatched_requests: list[UnmatchedRequest] = []
-    for req_id in request_fingerprints:
-        if req_id not in matched_request_ids:
-            details = request_details[req_id]
-            deficiency = Deficiency(
-                type="no_matching_rule",
-                request_id=req_id,
-            )
-            db.add(deficiency)
-            db.flush()
-            unmatched_requests.append(UnmatchedRequest(
-                deficiency_id=deficiency.deficiency_id,
-                request_id=req_id,
-                name=details["name"],
-                sources=details["sources"],
-                destinations=details["destinations"],
-                ports=details["ports"],
-            ))
+    yield RECORD_SUMMARY, ReviewSummary(
+        total_physical_rules=total_rules,
+        total_requests=total_requests,
+        matched_count=matched_count,
+        unmatched_rules_count=unmatched_rules_count,
+        unmatched_requests_count=unmatched_requests_count,
+    )
 
-    db.commit()
 
+def run_review(db: Session) -> ReviewResult:
+    records = collect_records(iter_review(db))
     return ReviewResult(
-        matched=matched,
-        unmatched_physical_rules=unmatched_rules,
-        unmatched_requests=unmatched_requests,
+        matched=records[RECORD_MATCHED],
+        unmatched_physical_rules=records[RECORD_UNMATCHED_RULE],
+        unmatched_requests=records[RECORD_UNMATCHED_REQUEST],
+        summary=records[RECORD_SUMMARY],
+    )
+
+
+def run_review_sql(db: Session) -> SqlReviewResult:
+    """Exact-match review computed entirely in PostgreSQL (migrations 011 and 012).
+
+    Same semantics as run_review: fingerprints are md5 hashes of the canonical
+    address / port multiranges (access_fingerprint, the SQL twin of
+    address_canon). Requests carry theirs as a generated column; rules get
+    physical_rules_view.fingerprint stored as reviewed_fingerprint first.
+    Matching is then a join on indexed columns, and deficiencies are written
+    with INSERT ... SELECT. As in run_review, each fingerprint matches a single
+    request (the highest request_id); other requests with the same
+    fingerprint stay unmatched. Only the counts come back to Python.
+    """
+    started = time.perf_counter()
+    watermark = review_state.safe_watermark(db)
+    review_state.refresh_rule_fingerprints(db)
+
+    # The request that represents each fingerprint shared with a rule
+    db.execute(text("""
+        CREATE TEMP TABLE review_matched_requests ON COMMIT DROP AS
+        SELECT max(q.request_id) AS request_id
+        FROM requests q
+        WHERE EXISTS (SELECT 1 FROM physical_rules p WHERE p.reviewed_fingerprint = q.fingerprint)
+        GROUP BY q.fingerprint
+    """))
+    db.execute(text("ANALYZE review_matched_requests"))
+
+    matched = db.execute(text("""
+        SELECT count(*) FROM physical_rules p
+        WHERE EXISTS (SELECT 1 FROM requests q WHERE q.fingerprint = p.reviewed_fingerprint)
+    """)).scalar_one()
+
+    retired = review_state.deficiency_count(db, review_state.REVIEW_EXACT)
+    clear_table(db, Deficiency)
+    unmatched_rules = db.execute(text("""
+        INSERT INTO deficiencies (type, rule_id)
+        SELECT 'no_matching_request', p.rule_id
+        FROM physical_rules p
+        WHERE NOT EXISTS (SELECT 1 FROM requests q WHERE q.fingerprint = p.reviewed_fingerprint)
+        ORDER BY p.rule_id
+    """)).rowcount
+    unmatched_requests = db.execute(text("""
+        INSERT INTO deficiencies (type, request_id)
+        SELECT 'no_matching_rule', q.request_id
+        FROM requests q
+        WHERE NOT EXISTS (SELECT 1 FROM review_matched_requests m WHERE m.request_id = q.request_id)
+        ORDER BY q.request_id
+    """)).rowcount
+    totals = db.execute(text("""
+        SELECT (SELECT count(*) FROM physical_rules) AS rules,
+               (SELECT count(*) FROM requests) AS requests
+    """)).one()
+    review_state.record_run(
+        db,
+        review_state.REVIEW_EXACT,
+        review_state.MODE_FULL,
+        watermark,
+        started,
+        rules_evaluated=totals.rules,
+        requests_evaluated=totals.requests,
+        deficiencies_added=unmatched_rules + unmatched_requests,
+        deficiencies_retired=retired,
+    )
+    db.commit()
+
+    return SqlReviewResult(
         summary=ReviewSummary(
-            total_physical_rules=len(physical_rules),
-            total_requests=len(user_requests),
-            matched_count=len(matched),
-            unmatched_rules_count=len(unmatched_rules),
-            unmatched_requests_count=len(unmatched_requests),
+            total_physical_rules=totals.rules,
+            total_requests=totals.requests,
+            matched_count=matched,
+            unmatched_rules_count=unmatched_rules,
+            unmatched_requests_count=unmatched_requests,
         ),
+        elapsed_ms=round((time.perf_counter() - started) * 1000.0, 1),
     )
@@ -0,0 +1,106 @@
+import time
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.models.review_run import ReviewRun
+from app.services.bulk_ingest_service import CopySpool
+
+REVIEW_EXACT = "exact"
+REVIEW_SEMANTIC = "semantic"
+
+MODE_FULL = "full"
+MODE_INCREMENTAL = "incremental"
+
+_DEFICIENCY_TABLES = {REVIEW_EXACT: "deficiencies", REVIEW_SEMANTIC: "semantic_deficiencies"}
+
+
+def safe_watermark(db: Session) -> datetime:
+    """Timestamp from which the next incremental review has to look for changes.
+
+    This is the start of the current transaction, or the start of the oldest
+    transaction still open elsewhere if that is earlier. A row stamped by a
+    transaction that commits after this review has read its snapshot is then
+    still newer than the watermark; re-evaluating a row twice is harmless.
+    """
+    return db.execute(text("""
+        SELECT least(now(), coalesce(min(xact_start), now()))
+        FROM pg_stat_activity
+        WHERE datname = current_database()
+          AND backend_type = 'client backend'
+          AND xact_start IS NOT NULL
+          AND pid <> pg_backend_pid()
+    """)).scalar_one()
+
+
+def last_run(db: Session, review_type: str) -> ReviewRun | None:
+    return db.scalars(
+        select(ReviewRun).where(ReviewRun.review_type == review_type).order_by(ReviewRun.run_id.desc()).limit(1)
+    ).first()
+
+
+def deficiency_count(db: Session, review_type: str) -> int:
+    return db.execute(text(f"SELECT count(*) FROM {_DEFICIENCY_TABLES[review_type]}")).scalar_one()
+
+
+def record_run(
+    db: Session,
+    review_type: str,
+    mode: str,
+    watermark: datetime,
+    started: float,
+    **fields,
+) -> ReviewRun:
+    """Add the review_runs row of a finished review; committed with the review itself."""
+    run = ReviewRun(
+        review_type=review_type,
+        mode=mode,
+        watermark=watermark,
+        deficiency_count=deficiency_count(db, review_type),
+        elapsed_ms=round((time.perf_counter() - started) * 1000.0, 1),
+        **fields,
+    )
+    db.add(run)
+    db.flush()
+    return run
+
+
+def refresh_rule_fingerprints(db: Session, fingerprints: CopySpool | None = None) -> int:
+    """Store every rule's current access_fingerprint as its reviewed_fingerprint; returns rows changed.
+
+    With `fingerprints` (from spool_rule_fingerprints), the fingerprints read
+    in an earlier snapshot are stored instead, skipping rules deleted since.
+    """
+    if fingerprints is None:
+        return db.execute(text("""
+            UPDATE physical_rules p
+            SET reviewed_fingerprint = v.fingerprint
+            FROM physical_rules_view v
+            WHERE v.rule_id = p.rule_id AND p.reviewed_fingerprint IS DISTINCT FROM v.fingerprint
+        """)).rowcount
+    db.execute(text("CREATE TEMP TABLE review_rule_fingerprints (rule_id INT, fingerprint VARCHAR(32)) ON COMMIT DROP"))
+    fingerprints.load(db, "review_rule_fingerprints")
+    fingerprints.close()
+    return db.execute(text("""
+        UPDATE physical_rules p
+        SET reviewed_fingerprint = f.fingerprint
+        FROM review_rule_fingerprints f
+        WHERE f.rule_id = p.rule_id
+    """)).rowcount
+
+
+def spool_rule_fingerprints(db: Session) -> CopySpool:
+    """The access_fingerprint of every rule whose reviewed_fingerprint is out of date, as of this snapshot.
+
+    A streaming review reads these inside its snapshot and stores them after
+    the snapshot transaction has ended, so reviewed_fingerprint is what the
+    review actually evaluated even if a rule changed in between.
+    """
+    spool = CopySpool(("rule_id", "fingerprint"))
+    spool.write(db.execute(text("""
+        SELECT v.rule_id, v.fingerprint
+        FROM physical_rules_view v JOIN physical_rules p ON p.rule_id = v.rule_id
+        WHERE p.reviewed_fingerprint IS DISTINCT FROM v.fingerprint
+    """)))
+    return spool
@@ -0,0 +1,226 @@
+import csv
+import io
+import json
+import re
+import tempfile
+import time
+from typing import Callable, Iterable, Iterator, TextIO
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.schemas.physical_rule import PhysicalRuleCreate
+from app.services import address_canon, bulk_ingest_service, rule_sync_service
+
+FORMATS = ("csv", "jsonl")
+
+# Accepted spellings of each field in CSV headers and JSON-lines keys
+FIELD_ALIASES = {
+    "rule_name": ("rule_name", "name", "rule"),
+    "firewall_device": ("firewall_device", "device", "firewall"),
+    "action": ("action",),
+    "sources": ("sources", "source", "src", "source_addresses"),
+    "destinations": ("destinations", "destination", "dst", "destination_addresses"),
+    "ports": ("ports", "port", "dst_port", "service_ports"),
+}
+
+# Separators between values of a multi-valued CSV cell (or JSON string)
+_MULTI_VALUE_RE = re.compile(r"[;,|\s]+")
+
+# Upload bodies larger than this are spooled to disk instead of memory
+_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# Rejected rows reported back in full; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class RuleImportError(ValueError):
+    """A row of an import file could not be mapped onto a physical rule."""
+
+
+def detect_format(filename: str) -> str:
+    """Guess the import format from a file name (.csv, .jsonl / .ndjson, optionally .gz)."""
+    name = filename.lower().removesuffix(".gz")
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    raise RuleImportError(f"Cannot detect the import format of {filename!r}; pass it explicitly")
+
+
+def format_for_content_type(content_type: str) -> str | None:
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in bulk_ingest_service.NDJSON_CONTENT_TYPES:
+        return "jsonl"
+    return None
+
+
+def _split(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v for v in _MULTI_VALUE_RE.split(str(value).strip()) if v]
+
+
+def _field(record: dict, name: str):
+    for alias in FIELD_ALIASES[name]:
+        if alias in record:
+            return record[alias]
+    return None
+
+
+def map_record(record: dict, firewall_device: str | None = None) -> PhysicalRuleCreate:
+    """Map one exported record onto PhysicalRuleCreate, validating every address.
+
+    `firewall_device` fills in the device for exports taken from a single device.
+    """
+    rule_name = str(_field(record, "rule_name") or "").strip()
+    if not rule_name:
+        raise RuleImportError("missing rule_name")
+    device = str(_field(record, "firewall_device") or firewall_device or "").strip()
+    if not device:
+        raise RuleImportError("missing firewall_device")
+
+    sources = _split(_field(record, "sources"))
+    destinations = _split(_field(record, "destinations"))
+    ports = _split(_field(record, "ports"))
+    if not sources or not destinations:
+        raise RuleImportError("rule needs at least one source and one destination")
+    for address in sources + destinations:
+        if address_canon.parse_address(address) is None:
+            raise RuleImportError(f"invalid address: {address!r}")
+
+    action = str(_field(record, "action") or "allow").strip().lower()
+    # Column widths of physical_rules; longer values would abort the whole COPY batch
+    if len(rule_name) > 255 or len(device) > 255 or len(action) > 20:
+        raise RuleImportError("rule_name, firewall_device or action too long")
+
+    return PhysicalRuleCreate(
+        rule_name=rule_name,
+        firewall_device=device,
+        ports=ports,
+        action=action,
+        sources=sources,
+        destinations=destinations,
+    )
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[dict | Exception]:
+    """Stream records (or the parse error of a bad line) from a CSV or JSON-lines text stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if reader.fieldnames:
+            reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+        yield from reader
+    elif fmt == "jsonl":
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield RuleImportError(f"invalid JSON: {exc}")
+                continue
+            yield record if isinstance(record, dict) else RuleImportError("expected a JSON object")
+    else:
+        raise RuleImportError(f"Unknown import format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_rules(
+    db: Session,
+    stream: TextIO,
+    fmt: str,
+    firewall_device: str | None = None,
+    defer_embedding: bool = False,
+    batch_size: int | None = None,
+    strict: bool = False,
+    sync: bool = False,
+    progress: Callable[[dict], None] | None = None,
+) -> dict:
+    """Stream-import physical rules from a CSV / JSON-lines export with constant memory.
+
+    Records are mapped and validated one at a time and written in batches of
+    `batch_size` through the COPY-based BulkIngester, in a single transaction.
+    With `sync`, the export is treated as the complete rule set of its devices
+    and applied as a diff by RuleSyncer instead (see rule_sync_service).
+    Invalid rows are skipped and reported, unless `strict` (implied by `sync`)
+    is set, in which case the first one aborts the import. `progress` is called with the running
+    counters after every batch.
+    """
+    batch_size = batch_size or settings.BULK_INGEST_CHUNK_SIZE
+    # A skipped row would look like a removed rule to the sync and be deleted
+    strict = strict or sync
+    if sync:
+        ingester = rule_sync_service.RuleSyncer(db, [firewall_device] if firewall_device else None, defer_embedding)
+    else:
+        ingester = bulk_ingest_service.BulkIngester(db, bulk_ingest_service.KIND_RULES, defer_embedding)
+    counters = {"rows_read": 0, "rows_rejected": 0, "rows_imported": 0}
+    errors: list[str] = []
+    started = time.perf_counter()
+
+    def rules() -> Iterator[PhysicalRuleCreate]:
+        for record in iter_records(stream, fmt):
+            counters["rows_read"] += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                yield map_record(record, firewall_device)
+            except (RuleImportError, ValueError) as exc:
+                if strict:
+                    raise RuleImportError(f"Row {counters['rows_read']}: {exc}") from exc
+                counters["rows_rejected"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"Row {counters['rows_read']}: {exc}")
+
+    def snapshot() -> dict:
+        elapsed = time.perf_counter() - started
+        return {
+            **counters,
+            "elapsed_ms": round(elapsed * 1000.0, 1),
+            "rows_per_second": round(counters["rows_imported"] / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    try:
+        for batch in _batched(rules(), batch_size):
+            ingester.add(batch)
+            counters["rows_imported"] += len(batch)
+            if progress is not None:
+                progress(snapshot())
+        result = ingester.finish()
+    except BaseException:
+        ingester.abort()
+        raise
+
+    return {**result, **snapshot(), "errors": errors}
+
+
+async def import_body(http_request, db: Session, fmt: str, **options) -> dict:
+    """Import an export sent as the raw request body.
+
+    The body is spooled to a temporary file as it arrives (in memory up to
+    8 MB, on disk beyond), then parsed by import_rules in the threadpool.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES) as spool:
+        async for data in http_request.stream():
+            spool.write(data)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+        try:
+            return await run_in_threadpool(import_rules, db, stream, fmt, **options)
+        finally:
+            stream.detach()
@@ -0,0 +1,256 @@
+import time
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.exc import DataError
+from sqlalchemy.orm import Session
+
+from app.models.rule_sync import RuleSync
+from app.services import bulk_ingest_service
+
+# First key of the per-device advisory lock that serializes syncs of one device
+_SYNC_LOCK_NAMESPACE = 7302
+
+CHANGE_INSERT = "insert"
+CHANGE_UPDATE = "update"
+CHANGE_DELETE = "delete"
+
+_STAGING_COLUMNS = ("ord", "rule_name", "firewall_device", "action", "ports", "sources", "destinations", "content_hash")
+
+
+class RuleSyncer:
+    """Synchronize the stored rules of one or more devices with a complete snapshot.
+
+    Rules are keyed on (firewall_device, rule_name) and compared by content_hash.
+    The snapshot is COPYed into a temporary staging table chunk by chunk (same
+    add / finish / abort interface as BulkIngester), then finish() applies the
+    diff set-based, in one transaction:
+
+    - new keys are inserted,
+    - keys whose content hash changed are updated in place (sources and
+      destinations replaced, embedding cleared and re-queued),
+    - stored rules of the synced devices missing from the snapshot are deleted,
+    - unchanged rules are not touched, so they keep their embeddings.
+
+    Every touched rule is recorded in rule_changes under the new rule_syncs row.
+    The synced devices are the explicit `firewall_devices` plus every device
+    present in the snapshot; an explicit device with no rows in the snapshot
+    has all its rules deleted.
+    """
+
+    def __init__(self, db: Session, firewall_devices: list[str] | None = None, defer_embedding: bool = False):
+        self.db = db
+        self.firewall_devices = sorted(set(firewall_devices or []))
+        self.defer_embedding = defer_embedding
+        self.rows_received = 0
+        self.started = time.perf_counter()
+        db.execute(text("""
+            CREATE TEMP TABLE rule_sync_staging (
+                ord BIGINT NOT NULL,
+                rule_name TEXT NOT NULL,
+                firewall_device TEXT NOT NULL,
+                action TEXT NOT NULL,
+                ports TEXT[] NOT NULL,
+                sources TEXT[] NOT NULL,
+                destinations TEXT[] NOT NULL,
+                content_hash TEXT NOT NULL
+            ) ON COMMIT DROP
+        """))
+
+    def add(self, items: list) -> None:
+        """COPY one chunk of PhysicalRuleCreate items into the staging table."""
+        if not items:
+            return
+        cursor = self.db.connection().connection.cursor()
+        try:
+            bulk_ingest_service.copy_rows(
+                cursor,
+                "rule_sync_staging",
+                _STAGING_COLUMNS,
+                [
+                    (
+                        self.rows_received + i,
+                        item.rule_name,
+                        item.firewall_device,
+                        item.action,
+                        bulk_ingest_service.array_literal(item.ports),
+                        bulk_ingest_service.array_literal(item.sources),
+                        bulk_ingest_service.array_literal(item.destinations),
+                        bulk_ingest_service.rule_content_hash(item.action, item.sources, item.destinations, item.ports),
+                    )
+                    for i, item in enumerate(items)
+                ],
+            )
+        except psycopg2.DataError as exc:
+            # e.g. a NUL character, which text columns cannot hold
+            first = self.rows_received + 1
+            raise bulk_ingest_service.BulkIngestError(
+                f"Rows {first}-{first + len(items) - 1}: {str(exc).strip()}", first
+            ) from exc
+        finally:
+            cursor.close()
+        self.rows_received += len(items)
+
+    def finish(self) -> dict:
+        try:
+            return self._apply()
+        except DataError as exc:
+            # Values the staging table took but physical_rules does not
+            raise bulk_ingest_service.BulkIngestError(str(exc.orig).strip()) from exc
+
+    def _apply(self) -> dict:
+        db = self.db
+        # Later rows win when the snapshot repeats a key
+        duplicates = db.execute(text("""
+            DELETE FROM rule_sync_staging a USING rule_sync_staging b
+            WHERE a.firewall_device = b.firewall_device AND a.rule_name = b.rule_name AND a.ord < b.ord
+        """)).rowcount
+        db.execute(text("CREATE INDEX ON rule_sync_staging (firewall_device, rule_name)"))
+        db.execute(text("ANALYZE rule_sync_staging"))
+
+        devices = sorted(
+            set(self.firewall_devices)
+            | set(db.execute(text("SELECT DISTINCT firewall_device FROM rule_sync_staging")).scalars())
+        )
+        for device in devices:
+            db.execute(text("SELECT pg_advisory_xact_lock(:ns, hashtext(:device))"), {"ns": _SYNC_LOCK_NAMESPACE, "device": device})
+
+        sync = RuleSync(firewall_devices=devices, rows_received=self.rows_received, duplicates=duplicates)
+        db.add(sync)
+        db.flush()
+        params = {"sync_id": sync.sync_id, "devices": devices}
+
+        _backfill_content_hashes(db, devices)
+
+        # Deletes: stored rules of the synced devices that are not in the snapshot
+        db.execute(text("""
+            INSERT INTO rule_changes (sync_id, rule_id, firewall_device, rule_name, change_type, reviewed_fingerprint)
+            SELECT :sync_id, p.rule_id, p.firewall_device, p.rule_name, 'delete', p.reviewed_fingerprint
+            FROM physical_rules p
+            WHERE p.firewall_device = ANY(:devices)
+              AND NOT EXISTS (
+                  SELECT 1 FROM rule_sync_staging s
+                  WHERE s.firewall_device = p.firewall_device AND s.rule_name = p.rule_name
+              )
+        """), params)
+        deleted_ids = "SELECT rule_id FROM rule_changes WHERE sync_id = :sync_id AND change_type = 'delete'"
+        for table in ("physical_rule_sources", "physical_rule_destinations", "deficiencies"):
+            db.execute(text(f"DELETE FROM {table} WHERE rule_id IN ({deleted_ids})"), params)
+        # The semantic_deficiencies FKs are ON DELETE SET NULL, which would leave the
+        # rule's own row behind without a rule; requests that had the rule as best
+        # match keep their row with a NULL best match for the next semantic review
+        db.execute(text(f"""
+            DELETE FROM semantic_deficiencies
+            WHERE type = 'no_matching_request' AND rule_id IN ({deleted_ids})
+        """), params)
+        db.execute(text(f"DELETE FROM embedding_outbox WHERE entity_type = 'rule' AND entity_id IN ({deleted_ids})"), params)
+        deleted = db.execute(text(f"DELETE FROM physical_rules WHERE rule_id IN ({deleted_ids})"), params).rowcount
+
+        # Updates: same key, different content; the stale embedding is cleared
+        updated = db.execute(text("""
+            WITH changed AS (
+                UPDATE physical_rules p
+                SET action = s.action,
+                    ports = s.ports,
+                    content_hash = s.content_hash,
+                    updated_at = NOW(),
+                    embedding_text = NULL,
+                    embedding = NULL,
+                    embedding_short = NULL
+                FROM rule_sync_staging s
+                WHERE p.firewall_device = s.firewall_device
+                  AND p.rule_name = s.rule_name
+                  AND p.content_hash IS DISTINCT FROM s.content_hash
+                RETURNING p.rule_id, p.firewall_device, p.rule_name
+            )
+            INSERT INTO rule_changes (sync_id, rule_id, firewall_device, rule_name, change_type)
+            SELECT :sync_id, rule_id, firewall_device, rule_name, 'update' FROM changed
+        """), params).rowcount
+        updated_ids = "SELECT rule_id FROM rule_changes WHERE sync_id = :sync_id AND change_type = 'update'"
+        db.execute(text(f"DELETE FROM physical_rule_sources WHERE rule_id IN ({updated_ids})"), params)
+        db.execute(text(f"DELETE FROM physical_rule_destinations WHERE rule_id IN ({updated_ids})"), params)
+
+        # Inserts: keys not stored yet
+        inserted = db.execute(text("""
+            WITH added AS (
+                INSERT INTO physical_rules (rule_name, firewall_device, action, ports, content_hash)
+                SELECT s.rule_name, s.firewall_device, s.action, s.ports, s.content_hash
+                FROM rule_sync_staging s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM physical_rules p
+                    WHERE p.firewall_device = s.firewall_device AND p.rule_name = s.rule_name
+                )
+                ORDER BY s.ord
+                RETURNING rule_id, firewall_device, rule_name
+            )
+            INSERT INTO rule_changes (sync_id, rule_id, firewall_device, rule_name, change_type)
+            SELECT :sync_id, rule_id, firewall_device, rule_name, 'insert' FROM added
+        """), params).rowcount
+
+        # Sources and destinations of inserted and updated rules, straight from staging
+        for table, column in (("physical_rule_sources", "sources"), ("physical_rule_destinations", "destinations")):
+            db.execute(text(f"""
+                INSERT INTO {table} (rule_id, address)
+                SELECT c.rule_id, unnest(s.{column})
+                FROM rule_changes c
+                JOIN rule_sync_staging s
+                  ON s.firewall_device = c.firewall_device AND s.rule_name = c.rule_name
+                WHERE c.sync_id = :sync_id AND c.change_type IN ('insert', 'update')
+            """), params)
+
+        if not self.defer_embedding:
+            db.execute(text("""
+                INSERT INTO embedding_outbox (entity_type, entity_id)
+                SELECT 'rule', rule_id FROM rule_changes
+                WHERE sync_id = :sync_id AND change_type IN ('insert', 'update')
+                ON CONFLICT ON CONSTRAINT uq_embedding_outbox_entity
+                DO UPDATE SET attempts = 0, last_error = NULL, available_at = NOW()
+            """), params)
+
+        sync.inserted = inserted
+        sync.updated = updated
+        sync.deleted = deleted
+        sync.unchanged = self.rows_received - duplicates - inserted - updated
+        db.commit()
+
+        elapsed = time.perf_counter() - self.started
+        return {
+            "sync_id": sync.sync_id,
+            "firewall_devices": devices,
+            "rows_received": self.rows_received,
+            "duplicates": duplicates,
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+            "unchanged": sync.unchanged,
+            "embedding_deferred": self.defer_embedding,
+            "elapsed_ms": round(elapsed * 1000.0, 1),
+            "rows_per_second": round(self.rows_received / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def abort(self) -> None:
+        self.db.rollback()
+
+
+def _backfill_content_hashes(db: Session, devices: list[str]) -> None:
+    """Hash stored rules of the given devices that predate content hashes (migration 010)."""
+    rows = db.execute(text("""
+        SELECT p.rule_id, p.action, p.ports,
+               ARRAY(SELECT s.address FROM physical_rule_sources s WHERE s.rule_id = p.rule_id) AS sources,
+               ARRAY(SELECT d.address FROM physical_rule_destinations d WHERE d.rule_id = p.rule_id) AS destinations
+        FROM physical_rules p
+        WHERE p.firewall_device = ANY(:devices) AND p.content_hash IS NULL
+    """), {"devices": devices}).all()
+    if rows:
+        db.execute(
+            text("UPDATE physical_rules SET content_hash = :content_hash WHERE rule_id = :rule_id"),
+            [
+                {
+                    "rule_id": row.rule_id,
+                    "content_hash": bulk_ingest_service.rule_content_hash(
+                        row.action, list(row.sources), list(row.destinations), list(row.ports)
+                    ),
+                }
+                for row in rows
+            ],
+        )
@@ -1,9 +1,14 @@
-from sqlalchemy.orm import Session, joinedload
+import time
+from functools import partial
+from typing import Callable, Iterator
+
+from sqlalchemy.orm import Session
 
 from app.config import settings
 from app.models.physical_rule import PhysicalRule
 from app.models.request import Request
 from app.models.semantic_deficiency import SemanticDeficiency
+from app.models.semantic_match import SemanticMatch
 from app.schemas.semantic_search import (
     SemanticMatchedPair,
     SemanticReviewResult,
@@ -11,192 +16,308 @@ from app.schemas.semantic_search import (
     SemanticUnmatchedRequest,
     SemanticUnmatchedRule,
 )
+from app.services import address_canon, review_state, similarity_engine, vector_search
+from app.services.review_service import (
+    RECORD_MATCHED,
+    RECORD_SUMMARY,
+    RECORD_UNMATCHED_REQUEST,
+    RECORD_UNMATCHED_RULE,
+    ResultStage,
+    ReviewRecord,
+    begin_snapshot,
+    collect_records,
+    stream_rows,
+)
 
 
-def run_semantic_review(db: Session, threshold: float | None = None) -> SemanticReviewResult:
-    if threshold is None:
-        threshold = settings.SIMILARITY_THRESHOLD
+def deficiency_row(type_: str, threshold: float, **fields) -> dict:
+    # Every row carries every column, so the batched INSERT has one shape
+    row = dict.fromkeys(
+        ("request_id", "rule_id", "best_match_request_id", "best_match_rule_id", "similarity_score")
+    )
+    row.update(fields, type=type_, threshold_used=threshold)
+    return row
 
-    # Clear previous semantic deficiencies
-    db.query(SemanticDeficiency).delete()
-    db.flush()
 
-    physical_rules = (
-        db.query(PhysicalRule)
-        .options(joinedload(PhysicalRule.sources), joinedload(PhysicalRule.destinations))
-        .all()
-    )
-    user_requests = db.query(Request).all()
-
-    # Build detail dicts for response construction; no longer loading embeddings into Python.
-    rule_details: dict[int, dict] = {}
-    for rule in physical_rules:
-        sources = [s.address for s in rule.sources]
-        destinations = [d.address for d in rule.destinations]
-        rule_details[rule.rule_id] = {
-            "rule_name": rule.rule_name,
-            "sources": sources,
-            "destinations": destinations,
-            "ports": rule.ports,
-        }
+def _flush_deficiencies(stage: ResultStage, pending: list[tuple[dict, dict]], item_type) -> list:
+    """Stage the deficiency rows of `pending` (row, response fields) and return the items with their IDs."""
+    ids = stage.add([row for row, _ in pending])
+    items = [item_type(semantic_deficiency_id=deficiency_id, **fields) for deficiency_id, (_, fields) in zip(ids, pending)]
+    pending.clear()
+    return items
+
 
-    request_details: dict[int, dict] = {}
-    for req in user_requests:
-        data = req.request_json
-        request_details[req.request_id] = {
-            "name": req.name,
-            "sources": data["sources"],
-            "destinations": data["destinations"],
-            "ports": data["ports"],
+def _flush_matches(stage: ResultStage, pending: list[SemanticMatchedPair], threshold: float) -> list[SemanticMatchedPair]:
+    # Matches are kept too, so an incremental run knows each rule's previous best match
+    stage.add([
+        {
+            "rule_id": m.rule_id,
+            "request_id": m.request_id,
+            "similarity_score": m.similarity_score,
+            "match_type": m.match_type,
+            "threshold_used": threshold,
         }
+        for m in pending
+    ])
+    items = list(pending)
+    pending.clear()
+    return items
 
-    matched: list[SemanticMatchedPair] = []
-    unmatched_rules: list[SemanticUnmatchedRule] = []
-    matched_request_ids: set[int] = set()
 
-    # For each physical rule, find the best matching request via pgvector KNN (HNSW index).
-    for rule in physical_rules:
-        rule_info = rule_details[rule.rule_id]
+def best_matches(db: Session, query_model, target, ids: list[int], *columns) -> dict[int, tuple]:
+    """id -> (target_id, similarity_score, *columns) of the nearest `target` row, from one batched KNN query."""
+    return {
+        query_id: (target_id, round(1.0 - distance, 4), *extra)
+        for query_id, target_id, distance, *extra in vector_search.nearest_batch(
+            db, query_model, target, ids, 1, columns=columns
+        )
+    }
 
-        if rule.embedding is None:
-            deficiency = SemanticDeficiency(
-                type="no_matching_request",
-                rule_id=rule.rule_id,
-                threshold_used=threshold,
-            )
-            db.add(deficiency)
-            db.flush()
-            unmatched_rules.append(
-                SemanticUnmatchedRule(
-                    semantic_deficiency_id=deficiency.id,
-                    rule_id=rule.rule_id,
-                    rule_name=rule_info["rule_name"],
-                    sources=rule_info["sources"],
-                    destinations=rule_info["destinations"],
-                    ports=rule_info["ports"],
-                    reason="Rule has no embedding — generate embeddings first",
-                )
-            )
-            continue
 
-        # KNN query: LIMIT 1 finds the single nearest request using the HNSW index.
-        distance_expr = Request.embedding.cosine_distance(list(rule.embedding)).label("distance")
-        best_row = (
-            db.query(Request, distance_expr)
-            .filter(Request.embedding.isnot(None))
-            .order_by(distance_expr)
-            .first()
-        )
+def evaluate_rules(
+    rules: list[tuple[int, int | None, bool]], threshold: float, nearest: Callable[[list[int]], dict[int, tuple]]
+) -> Iterator[tuple[int, dict | None, dict | None, tuple]]:
+    """Decide the outcome of a batch of rules; every semantic review goes through here.
 
-        if best_row is not None:
-            best_req, best_distance = best_row
-            best_score = round(1.0 - best_distance, 4)
-            best_req_id = best_req.request_id
-        else:
-            best_req, best_score, best_req_id = None, -1.0, None
-
-        if best_req is not None and best_score >= threshold:
-            matched.append(
-                SemanticMatchedPair(
-                    rule_id=rule.rule_id,
-                    request_id=best_req_id,
-                    rule_name=rule_info["rule_name"],
-                    request_name=best_req.name,
-                    sources=rule_info["sources"],
-                    destinations=rule_info["destinations"],
-                    ports=rule_info["ports"],
-                    similarity_score=best_score,
-                )
-            )
-            matched_request_ids.add(best_req_id)
+    `rules` are (rule_id, exact_request_id, embedded) tuples, where
+    exact_request_id is the representative request with the rule's canonical
+    fingerprint, or None. Such a rule is an exact match. The other embedded
+    rules are looked up with one nearest(rule_ids) call returning rule_id ->
+    (request_id, similarity_score, *columns), and match when the score reaches
+    the threshold. Yields (rule_id, match, deficiency, best) in input order:
+    a semantic_matches row (without threshold_used) or a deficiency_row, and
+    the rule's nearest() tuple, empty when there is none.
+    """
+    best = nearest([rule_id for rule_id, exact_request_id, embedded in rules if exact_request_id is None and embedded])
+    for rule_id, exact_request_id, _ in rules:
+        if exact_request_id is not None:
+            match = {"rule_id": rule_id, "request_id": exact_request_id, "similarity_score": 1.0, "match_type": "exact"}
+            yield rule_id, match, None, ()
+            continue
+        found = best.get(rule_id, ())
+        best_req_id, best_score = found[:2] if found else (None, None)
+        if best_score is not None and best_score >= threshold:
+            match = {"rule_id": rule_id, "request_id": best_req_id, "similarity_score": best_score, "match_type": "semantic"}
+            yield rule_id, match, None, found
         else:
-            deficiency = SemanticDeficiency(
-                type="no_matching_request",
-                rule_id=rule.rule_id,
+            deficiency = deficiency_row(
+                "no_matching_request",
+                threshold,
+                rule_id=rule_id,
                 best_match_request_id=best_req_id,
-                similarity_score=best_score if best_req_id is not None else None,
-                threshold_used=threshold,
-            )
-            db.add(deficiency)
-            db.flush()
-            unmatched_rules.append(
-                SemanticUnmatchedRule(
-                    semantic_deficiency_id=deficiency.id,
-                    rule_id=rule.rule_id,
-                    rule_name=rule_info["rule_name"],
-                    sources=rule_info["sources"],
-                    destinations=rule_info["destinations"],
-                    ports=rule_info["ports"],
-                    best_match_request_id=best_req_id,
-                    best_match_request_name=best_req.name if best_req else None,
-                    similarity_score=best_score if best_req_id is not None else None,
-                )
+                similarity_score=best_score,
             )
+            yield rule_id, None, deficiency, found
 
-    unmatched_requests: list[SemanticUnmatchedRequest] = []
-    request_lookup: dict[int, Request] = {r.request_id: r for r in user_requests}
 
-    for req_id in request_details:
-        if req_id in matched_request_ids:
-            continue
+def evaluate_requests(
+    request_ids: list[int], threshold: float, nearest: Callable[[list[int]], dict[int, tuple]]
+) -> Iterator[tuple[int, dict, tuple]]:
+    """Deficiency rows of a batch of requests no rule matched, as (request_id, deficiency, best).
 
-        req = request_lookup[req_id]
-        req_info = request_details[req_id]
-
-        best_rule_id = None
-        best_rule_name = None
-        best_score = None
-
-        if req.embedding is not None:
-            # KNN query: LIMIT 1 finds the single nearest rule using the HNSW index.
-            distance_expr = PhysicalRule.embedding.cosine_distance(list(req.embedding)).label("distance")
-            best_rule_row = (
-                db.query(PhysicalRule, distance_expr)
-                .filter(PhysicalRule.embedding.isnot(None))
-                .order_by(distance_expr)
-                .first()
-            )
-            if best_rule_row is not None:
-                best_rule, best_distance = best_rule_row
-                best_rule_id = best_rule.rule_id
-                best_rule_name = best_rule.rule_name
-                best_score = round(1.0 - best_distance, 4)
-
-        deficiency = SemanticDeficiency(
-            type="no_matching_rule",
-            request_id=req_id,
+    The best match comes from one nearest(request_ids) call, as in
+    evaluate_rules; requests without an embedding get none.
+    """
+    best = nearest(request_ids)
+    for request_id in request_ids:
+        found = best.get(request_id, ())
+        best_rule_id, best_score = found[:2] if found else (None, None)
+        deficiency = deficiency_row(
+            "no_matching_rule",
+            threshold,
+            request_id=request_id,
             best_match_rule_id=best_rule_id,
             similarity_score=best_score,
-            threshold_used=threshold,
         )
-        db.add(deficiency)
-        db.flush()
-        unmatched_requests.append(
-            SemanticUnmatchedRequest(
-                semantic_deficiency_id=deficiency.id,
-                request_id=req_id,
-                request_name=req_info["name"],
-                sources=req_info["sources"],
-                destinations=req_info["destinations"],
-                ports=req_info["ports"],
-                best_match_rule_id=best_rule_id,
-                best_match_rule_name=best_rule_name,
-                similarity_score=best_score,
+        yield request_id, deficiency, found
+
+
+def iter_semantic_review(
+    db: Session, threshold: float | None = None, batch_size: int | None = None, engine: str | None = None
+) -> Iterator[ReviewRecord]:
+    """Semantic review that yields its results while they are produced.
+
+    Same record stream as review_service.iter_review, with
+    SemanticMatchedPair, SemanticUnmatchedRule / SemanticUnmatchedRequest
+    items and a SemanticReviewSummary last. Rules and requests are read in
+    batches from server-side cursors, and deficiencies and matches are
+    written a batch at a time. The nearest neighbours of a batch come from
+    one LATERAL KNN query (vector_search.nearest_batch) against the stored
+    embeddings, so no vector is read into Python; only IDs and scores come
+    back. With engine="numpy" (similarity_engine) both embedding matrices are
+    loaded once instead and every nearest neighbour comes from an exact
+    blocked matrix multiply. Each batch is decided by evaluate_rules /
+    evaluate_requests, like the incremental and sharded reviews. Deficiencies and matches are staged
+    (ResultStage) and swapped in with one short transaction just before the
+    summary, as in iter_review.
+    """
+    if threshold is None:
+        threshold = settings.SIMILARITY_THRESHOLD
+    batch_size = batch_size or settings.REVIEW_STREAM_BATCH_SIZE
+    engine = engine or settings.SEMANTIC_REVIEW_ENGINE
+    if engine not in similarity_engine.ENGINES:
+        raise ValueError(f"Unknown semantic review engine: {engine!r}")
+
+    begin_snapshot(db)
+    started = time.perf_counter()
+    watermark = review_state.safe_watermark(db)
+    deficiency_stage = ResultStage(
+        db, SemanticDeficiency, references=("rule_id", "request_id", "best_match_rule_id", "best_match_request_id")
+    )
+    # semantic_matches has no foreign keys; matches of rules deleted meanwhile tell the next incremental run
+    # which requests lost their match
+    match_stage = ResultStage(db, SemanticMatch)
+
+    if engine == similarity_engine.ENGINE_NUMPY:
+        nearest = similarity_engine.ExactMatcher(db, PhysicalRule, Request)
+    else:
+        nearest = partial(best_matches, db)
+
+    def nearest_requests(rule_ids: list[int]) -> dict[int, tuple]:
+        return nearest(PhysicalRule, Request, rule_ids, Request.name)
+
+    def nearest_rules(request_ids: list[int]) -> dict[int, tuple]:
+        return nearest(Request, PhysicalRule, request_ids, PhysicalRule.rule_name)
+
+    # Canonical fingerprint -> request_id, to settle exact matches without a KNN query
+    fp_to_request: dict[tuple, int] = {}
+    request_names: dict[int, str] = {}
+    total_requests = 0
+    for row in stream_rows(db, "SELECT request_id, name, request_json FROM requests ORDER BY request_id", batch_size):
+        data = row.request_json
+        fp_to_request[address_canon.fingerprint(data["sources"], data["destinations"], data["ports"])] = row.request_id
+        request_names[row.request_id] = row.name
+        total_requests += 1
+
+    matched_request_ids: set[int] = set()
+    total_rules = matched_count = exact_matched = unmatched_rules_count = 0
+    pending_matches: list[SemanticMatchedPair] = []
+    pending: list[tuple[dict, dict]] = []
+
+    # Rules are evaluated a partition at a time: exact matches by fingerprint, the rest with one batched KNN query
+    rules = stream_rows(db, """
+        SELECT v.rule_id, v.rule_name, v.sources, v.destinations, v.ports, p.embedding IS NOT NULL AS embedded
+        FROM physical_rules_view v JOIN physical_rules p ON p.rule_id = v.rule_id
+        ORDER BY v.rule_id
+    """, batch_size)
+    for partition in rules.partitions():
+        rows = {row.rule_id: row for row in partition}
+        batch = [
+            (
+                row.rule_id,
+                fp_to_request.get(address_canon.fingerprint(row.sources or [], row.destinations or [], row.ports)),
+                row.embedded,
             )
-        )
+            for row in partition
+        ]
+        total_rules += len(batch)
+        for rule_id, match, deficiency, best in evaluate_rules(batch, threshold, nearest_requests):
+            row = rows[rule_id]
+            rule_info = {
+                "rule_id": row.rule_id,
+                "rule_name": row.rule_name,
+                "sources": row.sources or [],
+                "destinations": row.destinations or [],
+                "ports": row.ports,
+            }
+            if match is not None:
+                exact = match["match_type"] == "exact"
+                pending_matches.append(SemanticMatchedPair(
+                    request_id=match["request_id"],
+                    request_name=request_names[match["request_id"]] if exact else best[2],
+                    similarity_score=match["similarity_score"],
+                    match_type=match["match_type"],
+                    **rule_info,
+                ))
+                matched_request_ids.add(match["request_id"])
+                exact_matched += exact
+            elif not row.embedded:
+                pending.append((deficiency, dict(rule_info, reason="Rule has no embedding — generate embeddings first")))
+            else:
+                pending.append((deficiency, dict(
+                    rule_info,
+                    best_match_request_id=deficiency["best_match_request_id"],
+                    best_match_request_name=best[2] if best else None,
+                    similarity_score=deficiency["similarity_score"],
+                )))
+
+        if len(pending_matches) >= batch_size:
+            for item in _flush_matches(match_stage, pending_matches, threshold):
+                matched_count += 1
+                yield RECORD_MATCHED, item
+        if len(pending) >= batch_size:
+            for item in _flush_deficiencies(deficiency_stage, pending, SemanticUnmatchedRule):
+                unmatched_rules_count += 1
+                yield RECORD_UNMATCHED_RULE, item
+    for item in _flush_matches(match_stage, pending_matches, threshold):
+        matched_count += 1
+        yield RECORD_MATCHED, item
+    for item in _flush_deficiencies(deficiency_stage, pending, SemanticUnmatchedRule):
+        unmatched_rules_count += 1
+        yield RECORD_UNMATCHED_RULE, item
+
+    unmatched_requests_count = 0
+    requests = stream_rows(db, "SELECT request_id, name, request_json FROM requests ORDER BY request_id", batch_size)
+    for partition in requests.partitions():
+        unmatched = {row.request_id: row for row in partition if row.request_id not in matched_request_ids}
+        for request_id, deficiency, best in evaluate_requests(list(unmatched), threshold, nearest_rules):
+            row = unmatched[request_id]
+            data = row.request_json
+            pending.append((deficiency, dict(
+                request_id=request_id,
+                request_name=row.name,
+                sources=data["sources"],
+                destinations=data["destinations"],
+                ports=data["ports"],
+                best_match_rule_id=deficiency["best_match_rule_id"],
+                best_match_rule_name=best[2] if best else None,
+                similarity_score=deficiency["similarity_score"],
+            )))
+        if len(pending) >= batch_size:
+            for item in _flush_deficiencies(deficiency_stage, pending, SemanticUnmatchedRequest):
+                unmatched_requests_count += 1
+                yield RECORD_UNMATCHED_REQUEST, item
+    for item in _flush_deficiencies(deficiency_stage, pending, SemanticUnmatchedRequest):
+        unmatched_requests_count += 1
+        yield RECORD_UNMATCHED_REQUEST, item
 
     db.commit()
 
+    # Nothing has been written so far; swap in the results with one short transaction
+    retired = deficiency_stage.swap()
+    match_stage.swap()
+    review_state.record_run(
+        db,
+        review_state.REVIEW_SEMANTIC,
+        review_state.MODE_FULL,
+        watermark,
+        started,
+        threshold_used=threshold,
+        rules_evaluated=total_rules,
+        requests_evaluated=total_requests,
+        deficiencies_added=unmatched_rules_count + unmatched_requests_count,
+        deficiencies_retired=retired,
+    )
+    db.commit()
+
+    yield RECORD_SUMMARY, SemanticReviewSummary(
+        total_physical_rules=total_rules,
+        total_requests=total_requests,
+        matched_count=matched_count,
+        unmatched_rules_count=unmatched_rules_count,
+        unmatched_requests_count=unmatched_requests_count,
+        threshold_used=threshold,
+        exact_matched_count=exact_matched,
+    )
+
+
+def run_semantic_review(
+    db: Session, threshold: float | None = None, engine: str | None = None
+) -> SemanticReviewResult:
+    records = collect_records(iter_semantic_review(db, threshold, engine=engine))
     return SemanticReviewResult(
-        matched=matched,
-        unmatched_physical_rules=unmatched_rules,
-        unmatched_requests=unmatched_requests,
-        summary=SemanticReviewSummary(
-            total_physical_rules=len(physical_rules),
-            total_requests=len(user_requests),
-            matched_count=len(matched),
-            unmatched_rules_count=len(unmatched_rules),
-            unmatched_requests_count=len(unmatched_requests),
-            threshold_used=threshold,
-        ),
+        matched=records[RECORD_MATCHED],
+        unmatched_physical_rules=records[RECORD_UNMATCHED_RULE],
+        unmatched_requests=records[RECORD_UNMATCHED_REQUEST],
+        summary=records[RECORD_SUMMARY],
     )
@@ -0,0 +1,331 @@
+"""Exact and semantic reviews sharded across a process pool.
+
+The rule side of a review is split into shards, by firewall_device or by
+rule_id range, and evaluated by worker processes with their own database
+sessions. The parent merges the shard results, runs the request side (the
+semantic one sharded as well), and stages the deficiencies (ResultStage). They
+are swapped in with one short transaction once the snapshot has ended, the
+same way run_review / run_semantic_review do.
+
+All sessions read the same snapshot: the parent exports the one of its
+REPEATABLE READ transaction and every worker imports it, so the shards see
+the tables exactly as the parent does, however long the run takes.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.deficiency import Deficiency
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.models.semantic_deficiency import SemanticDeficiency
+from app.models.semantic_match import SemanticMatch
+from app.services import address_canon, review_state
+from app.services.review_service import ResultStage
+from app.services.semantic_review_service import best_matches, evaluate_requests, evaluate_rules
+
+SHARD_BY_DEVICE = "device"
+SHARD_BY_ID = "id"
+SHARD_BY = (SHARD_BY_DEVICE, SHARD_BY_ID)
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker: dict = {}
+
+
+def _open_snapshot_session(snapshot: str) -> Session:
+    db = SessionLocal()
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    db.execute(text("SET TRANSACTION SNAPSHOT :snapshot"), {"snapshot": snapshot})
+    return db
+
+
+def _init_worker(snapshot: str, fp_to_request: dict[tuple, int]) -> None:
+    _worker["db"] = _open_snapshot_session(snapshot)
+    _worker["fp_to_request"] = fp_to_request
+
+
+def plan_shards(db: Session, shards: int, shard_by: str = SHARD_BY_DEVICE) -> list[dict]:
+    """Split the rules into at most `shards` shards of similar size.
+
+    By device, whole devices are packed largest first into the currently
+    smallest shard, so one device larger than a fair share forms a shard of
+    its own; shard by ID range to split it. By ID, ntile() cuts the ordered
+    rule_ids into equal ranges.
+    """
+    if shard_by == SHARD_BY_DEVICE:
+        counts = db.execute(text("""
+            SELECT firewall_device, count(*) FROM physical_rules
+            GROUP BY firewall_device ORDER BY count(*) DESC, firewall_device
+        """)).all()
+        plan = [{"shard": i, "firewall_devices": [], "rules": 0} for i in range(min(shards, len(counts)))]
+        for device, count in counts:
+            smallest = min(plan, key=lambda shard: shard["rules"])
+            smallest["firewall_devices"].append(device)
+            smallest["rules"] += count
+        return plan
+    if shard_by == SHARD_BY_ID:
+        rows = db.execute(text("""
+            SELECT min(rule_id), max(rule_id), count(*)
+            FROM (SELECT rule_id, ntile(:shards) OVER (ORDER BY rule_id) AS tile FROM physical_rules) tiles
+            GROUP BY tile ORDER BY tile
+        """), {"shards": shards}).all()
+        return [{"shard": i, "rule_ids": [lo, hi], "rules": count} for i, (lo, hi, count) in enumerate(rows)]
+    raise ValueError(f"Unknown shard key: {shard_by!r}")
+
+
+def _shard_filter(shard: dict) -> tuple[str, dict]:
+    if "firewall_devices" in shard:
+        return "firewall_device = ANY(:devices)", {"devices": shard["firewall_devices"]}
+    lo, hi = shard["rule_ids"]
+    return "rule_id BETWEEN :lo AND :hi", {"lo": lo, "hi": hi}
+
+
+def _timing(shard: dict, phase: str, rows: int, started: float) -> dict:
+    return {
+        **{k: v for k, v in shard.items() if k != "rules"},
+        "phase": phase,
+        "rows": rows,
+        "pid": os.getpid(),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+    }
+
+
+def _rule_fingerprints(db: Session, shard: dict) -> list[tuple[int, tuple]]:
+    where, params = _shard_filter(shard)
+    rows = db.execute(text(f"""
+        SELECT rule_id, sources, destinations, ports FROM physical_rules_view
+        WHERE {where} ORDER BY rule_id
+    """), params)
+    return [
+        (rule_id, address_canon.fingerprint(sources or [], destinations or [], ports))
+        for rule_id, sources, destinations, ports in rows
+    ]
+
+
+def _exact_rule_shard(shard: dict) -> dict:
+    started = time.perf_counter()
+    fp_to_request = _worker["fp_to_request"]
+    matched: list[tuple[int, int]] = []
+    unmatched_rule_ids: list[int] = []
+    rules = _rule_fingerprints(_worker["db"], shard)
+    for rule_id, fp in rules:
+        req_id = fp_to_request.get(fp)
+        if req_id is not None:
+            matched.append((rule_id, req_id))
+        else:
+            unmatched_rule_ids.append(rule_id)
+    return {
+        "matched": matched,
+        "unmatched_rule_ids": unmatched_rule_ids,
+        "timing": _timing(shard, "rules", len(rules), started),
+    }
+
+
+def _batches(items: list) -> list[list]:
+    size = settings.REVIEW_STREAM_BATCH_SIZE
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _semantic_rule_shard(shard: dict, threshold: float) -> dict:
+    started = time.perf_counter()
+    db = _worker["db"]
+    fp_to_request = _worker["fp_to_request"]
+    rules = _rule_fingerprints(db, shard)
+    where, params = _shard_filter(shard)
+    embedded = set(db.scalars(
+        select(PhysicalRule.rule_id).where(text(where), PhysicalRule.embedding.is_not(None)), params
+    ))
+
+    matches: list[dict] = []
+    deficiencies: list[dict] = []
+    for batch in _batches(rules):
+        outcomes = evaluate_rules(
+            [(rule_id, fp_to_request.get(fp), rule_id in embedded) for rule_id, fp in batch],
+            threshold,
+            partial(best_matches, db, PhysicalRule, Request),
+        )
+        for _, match, deficiency, _ in outcomes:
+            if match is not None:
+                matches.append(match)
+            else:
+                deficiencies.append(deficiency)
+    return {"matches": matches, "deficiencies": deficiencies, "timing": _timing(shard, "rules", len(rules), started)}
+
+
+def _semantic_request_shard(shard: dict, threshold: float) -> dict:
+    started = time.perf_counter()
+    db = _worker["db"]
+    deficiencies: list[dict] = []
+    for batch in _batches(shard["request_ids"]):
+        outcomes = evaluate_requests(batch, threshold, partial(best_matches, db, Request, PhysicalRule))
+        deficiencies.extend(deficiency for _, deficiency, _ in outcomes)
+    shard_info = {"shard": shard["shard"], "request_ids": [shard["request_ids"][0], shard["request_ids"][-1]]}
+    return {"deficiencies": deficiencies, "timing": _timing(shard_info, "requests", len(shard["request_ids"]), started)}
+
+
+def _request_fingerprints(db: Session) -> tuple[list[int], dict[tuple, int]]:
+    """All request_ids, and each fingerprint's representative request (the highest request_id)."""
+    request_ids: list[int] = []
+    fp_to_request: dict[tuple, int] = {}
+    for req_id, data in db.execute(text("SELECT request_id, request_json FROM requests ORDER BY request_id")):
+        request_ids.append(req_id)
+        fp_to_request[address_canon.fingerprint(data["sources"], data["destinations"], data["ports"])] = req_id
+    return request_ids, fp_to_request
+
+
+def _chunks(ids: list[int], count: int) -> list[list[int]]:
+    size = -(-len(ids) // count) if ids else 1
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def _exact_review(db: Session, pool: ProcessPoolExecutor, plan: list[dict], request_ids: list[int]) -> dict:
+    results = list(pool.map(_exact_rule_shard, plan))
+    unmatched_rule_ids = sorted(rule_id for r in results for rule_id in r["unmatched_rule_ids"])
+    matched_request_ids = {req_id for r in results for _, req_id in r["matched"]}
+    unmatched_request_ids = [req_id for req_id in request_ids if req_id not in matched_request_ids]
+
+    stage = ResultStage(db, Deficiency, references=("rule_id", "request_id"))
+    stage.add([{"type": "no_matching_request", "rule_id": rule_id} for rule_id in unmatched_rule_ids])
+    stage.add([{"type": "no_matching_rule", "request_id": req_id} for req_id in unmatched_request_ids])
+    rules_evaluated = sum(len(r["matched"]) + len(r["unmatched_rule_ids"]) for r in results)
+    return {
+        "stages": [stage],
+        # State for the next incremental review, as of the snapshot
+        "fingerprints": review_state.spool_rule_fingerprints(db),
+        "run_fields": {
+            "rules_evaluated": rules_evaluated,
+            "requests_evaluated": len(request_ids),
+            "deficiencies_added": len(unmatched_rule_ids) + len(unmatched_request_ids),
+        },
+        "summary": {
+            "total_physical_rules": rules_evaluated,
+            "total_requests": len(request_ids),
+            "matched_count": rules_evaluated - len(unmatched_rule_ids),
+            "unmatched_rules_count": len(unmatched_rule_ids),
+            "unmatched_requests_count": len(unmatched_request_ids),
+        },
+        "shards": [r["timing"] for r in results],
+    }
+
+
+def _semantic_review(
+    db: Session, pool: ProcessPoolExecutor, plan: list[dict], request_ids: list[int], threshold: float
+) -> dict:
+    rule_results = list(pool.map(_semantic_rule_shard, plan, [threshold] * len(plan)))
+    matches = [m for r in rule_results for m in r["matches"]]
+    rule_deficiencies = sorted((d for r in rule_results for d in r["deficiencies"]), key=lambda d: d["rule_id"])
+
+    # Request side over the requests no rule matched, in as many ID-ordered shards as the rule side
+    matched_request_ids = {m["request_id"] for m in matches}
+    unmatched_request_ids = [req_id for req_id in request_ids if req_id not in matched_request_ids]
+    request_plan = [
+        {"shard": i, "request_ids": ids} for i, ids in enumerate(_chunks(unmatched_request_ids, max(len(plan), 1)))
+    ]
+    request_results = list(pool.map(_semantic_request_shard, request_plan, [threshold] * len(request_plan)))
+    request_deficiencies = [d for r in request_results for d in r["deficiencies"]]
+
+    deficiency_stage = ResultStage(
+        db, SemanticDeficiency, references=("rule_id", "request_id", "best_match_rule_id", "best_match_request_id")
+    )
+    deficiency_stage.add(rule_deficiencies)
+    deficiency_stage.add(request_deficiencies)
+    match_stage = ResultStage(db, SemanticMatch)
+    match_stage.add([{**m, "threshold_used": threshold} for m in matches])
+    rules_evaluated = len(matches) + len(rule_deficiencies)
+    return {
+        "stages": [deficiency_stage, match_stage],
+        "fingerprints": None,
+        "run_fields": {
+            "threshold_used": threshold,
+            "rules_evaluated": rules_evaluated,
+            "requests_evaluated": len(request_ids),
+            "deficiencies_added": len(rule_deficiencies) + len(request_deficiencies),
+        },
+        "summary": {
+            "total_physical_rules": rules_evaluated,
+            "total_requests": len(request_ids),
+            "matched_count": len(matches),
+            "unmatched_rules_count": len(rule_deficiencies),
+            "unmatched_requests_count": len(request_deficiencies),
+            "threshold_used": threshold,
+            "exact_matched_count": sum(1 for m in matches if m["match_type"] == "exact"),
+        },
+        "shards": [r["timing"] for r in rule_results + request_results],
+    }
+
+
+def run_sharded_review(
+    review_type: str = review_state.REVIEW_EXACT,
+    workers: int | None = None,
+    shards: int | None = None,
+    shard_by: str = SHARD_BY_DEVICE,
+    threshold: float | None = None,
+) -> dict:
+    """Run a full exact or semantic review on a pool of `workers` processes.
+
+    `shards` defaults to four per worker, so a slow shard does not leave the
+    other workers idle at the end. Records a review_runs row like the
+    single-process reviews, and returns the summary with per-shard timings;
+    the deficiencies are read through the deficiency endpoints.
+    """
+    if review_type not in (review_state.REVIEW_EXACT, review_state.REVIEW_SEMANTIC):
+        raise ValueError(f"Unknown review type: {review_type!r}")
+    if threshold is None:
+        threshold = settings.SIMILARITY_THRESHOLD
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        snapshot = db.execute(text("SELECT pg_export_snapshot()")).scalar_one()
+        watermark = review_state.safe_watermark(db)
+        plan = plan_shards(db, shards, shard_by)
+        request_ids, fp_to_request = _request_fingerprints(db)
+
+        # spawn, not fork: a forked worker would share the parent's pooled connections
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(snapshot, fp_to_request),
+        ) as pool:
+            if review_type == review_state.REVIEW_EXACT:
+                result = _exact_review(db, pool, plan, request_ids)
+            else:
+                result = _semantic_review(db, pool, plan, request_ids, threshold)
+        db.commit()
+
+        # Nothing has been written so far; swap in the results with one short transaction
+        deficiency_stage, *other_stages = result["stages"]
+        retired = deficiency_stage.swap()
+        for stage in other_stages:
+            stage.swap()
+        if result["fingerprints"] is not None:
+            review_state.refresh_rule_fingerprints(db, result["fingerprints"])
+        run = review_state.record_run(
+            db, review_type, review_state.MODE_FULL, watermark, started,
+            deficiencies_retired=retired, **result["run_fields"],
+        )
+        run_id, elapsed_ms = run.run_id, run.elapsed_ms
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "run_id": run_id,
+        "review_type": review_type,
+        "shard_by": shard_by,
+        "workers": workers,
+        "summary": result["summary"],
+        "shards": result["shards"],
+        "elapsed_ms": elapsed_ms,
+    }
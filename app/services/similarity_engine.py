@@ -0,0 +1,230 @@
+"""Exact all-pairs cosine top-k over in-memory embedding matrices.
+
+The alternative to per-row HNSW probes for full semantic reviews: both
+embedding matrices are loaded once, in binary, and every row's nearest
+neighbours on the other side come from blocked matrix multiplies. Results are
+exact, i.e. the same as VECTOR_SEARCH_MODE=exact; the compact modes agree up to
+their recall.
+
+Matrices come from COPY ... (FORMAT binary), or from a memory-mapped .npy
+cache in SIMILARITY_CACHE_DIR keyed by the embedding_version stamps of the
+table (migration 014), so an unchanged table is not read again.
+"""
+import glob
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+ENGINE_PGVECTOR = "pgvector"
+ENGINE_NUMPY = "numpy"
+ENGINES = (ENGINE_PGVECTOR, ENGINE_NUMPY)
+
+# COPY binary layout: 11-byte signature, int32 flags, int32 header extension length
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_COPY_HEADER = 19
+
+
+@dataclass
+class EmbeddingMatrix:
+    """Primary keys (ascending) and unit-normalized float32 embeddings of one table."""
+
+    ids: np.ndarray
+    vectors: np.ndarray
+
+
+def _copy_row_dtype(dims: int) -> np.dtype:
+    # Field count, then length-prefixed int8 key and pgvector's binary send format
+    # (int16 dim, int16 unused, float4 values); all big endian, no padding
+    return np.dtype([
+        ("fields", ">i2"),
+        ("id_len", ">i4"),
+        ("id", ">i8"),
+        ("vec_len", ">i4"),
+        ("dim", ">i2"),
+        ("unused", ">i2"),
+        ("vec", ">f4", (dims,)),
+    ])
+
+
+def _cache_key(db: Session, table: str) -> str:
+    stamp = db.execute(text(f"""
+        SELECT count(*), coalesce(max(embedding_version), 0), coalesce(sum(embedding_version), 0)
+        FROM {table} WHERE embedding IS NOT NULL
+    """)).one()
+    return "-".join(str(v) for v in stamp)
+
+
+def _normalize_into(out: np.ndarray, vectors: np.ndarray, block_size: int) -> None:
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size].astype(np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, norms, out=block, where=norms > 0)
+        out[start:start + block_size] = block
+
+
+def copy_embeddings(db: Session, model, vectors_path: str | None) -> EmbeddingMatrix:
+    """COPY the table's embeddings in binary and normalize them, into `vectors_path` if given."""
+    table = model.__tablename__
+    pk = model.__mapper__.primary_key[0].name
+    dims = settings.EMBEDDING_DIMENSIONS
+    row_dtype = _copy_row_dtype(dims)
+    cursor = db.connection().connection.cursor()
+    with tempfile.TemporaryFile() as buffer:
+        cursor.copy_expert(
+            f"COPY (SELECT {pk}::int8, embedding FROM {table} WHERE embedding IS NOT NULL ORDER BY {pk}) "
+            "TO STDOUT WITH (FORMAT binary)",
+            buffer,
+        )
+        size = buffer.tell()
+        buffer.seek(0)
+        header = buffer.read(_COPY_HEADER)
+        if header[:11] != _COPY_SIGNATURE:
+            raise ValueError(f"Unexpected COPY output for {table}")
+        offset = _COPY_HEADER + int.from_bytes(header[15:19], "big")
+        # Every tuple has the same size; the int16 -1 trailer is left out
+        count = (size - offset - 2) // row_dtype.itemsize
+        if count == 0:
+            return EmbeddingMatrix(np.empty(0, np.int64), np.empty((0, dims), np.float32))
+        rows = np.memmap(buffer, dtype=row_dtype, mode="r", offset=offset, shape=(count,))
+        if (rows["dim"][:1] != dims).any():
+            raise ValueError(f"{table} embeddings do not have {dims} dimensions")
+        ids = rows["id"].astype(np.int64)
+        if vectors_path is None:
+            vectors = np.empty((count, dims), np.float32)
+        else:
+            vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(count, dims))
+        _normalize_into(vectors, rows["vec"], settings.SIMILARITY_BLOCK_SIZE)
+        del rows
+    if vectors_path is not None:
+        vectors.flush()
+    return EmbeddingMatrix(ids, vectors)
+
+
+def load_embeddings(db: Session, model) -> EmbeddingMatrix:
+    """Embeddings of every row of `model` that has one, from the cache or a binary COPY.
+
+    With SIMILARITY_CACHE_DIR set, the matrix is written there as .npy files
+    named after the table's version stamp and returned memory-mapped; older
+    files of the table are removed. Call this inside the review's snapshot so
+    the stamp and the rows agree.
+    """
+    cache_dir = settings.SIMILARITY_CACHE_DIR
+    if not cache_dir:
+        return copy_embeddings(db, model, None)
+
+    table = model.__tablename__
+    base = os.path.join(cache_dir, f"{table}-{_cache_key(db, table)}")
+    ids_path, vectors_path = f"{base}.ids.npy", f"{base}.vectors.npy"
+    # The ids file is written last, so its presence means the pair is complete
+    if os.path.exists(ids_path):
+        return EmbeddingMatrix(np.load(ids_path), np.load(vectors_path, mmap_mode="r"))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{base}.{os.getpid()}.tmp"
+    matrix = copy_embeddings(db, model, f"{tmp}.vectors.npy")
+    np.save(f"{tmp}.ids.npy", matrix.ids)
+    os.replace(f"{tmp}.vectors.npy", vectors_path)
+    os.replace(f"{tmp}.ids.npy", ids_path)
+    for path in glob.glob(os.path.join(cache_dir, f"{table}-*.npy")):
+        if not path.startswith(base + "."):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return EmbeddingMatrix(matrix.ids, np.load(vectors_path, mmap_mode="r"))
+
+
+def top_k(
+    queries: np.ndarray,
+    targets: np.ndarray,
+    k: int = 1,
+    block_size: int | None = None,
+    threads: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Exact top-k target rows by cosine similarity for every query row.
+
+    Both matrices hold unit-normalized rows, so a dot product is a cosine
+    similarity. The work is split into query blocks x target blocks of
+    `block_size` rows, so each thread holds one block_size x block_size score
+    matrix plus a running top-k per query row. Query blocks are spread over
+    `threads` threads; NumPy's matmul releases the GIL. Returns (indices into
+    targets, similarities), both (len(queries), k), best first.
+    """
+    block_size = block_size or settings.SIMILARITY_BLOCK_SIZE
+    threads = threads or settings.SIMILARITY_THREADS
+    k = min(k, len(targets))
+    best_idx = np.zeros((len(queries), k), np.int64)
+    best_score = np.zeros((len(queries), k), np.float32)
+    if k == 0:
+        return best_idx, best_score
+
+    def run(start: int) -> None:
+        block = np.asarray(queries[start:start + block_size], dtype=np.float32)
+        scores = np.full((len(block), k), -np.inf, np.float32)
+        idx = np.zeros((len(block), k), np.int64)
+        for t_start in range(0, len(targets), block_size):
+            sims = block @ np.asarray(targets[t_start:t_start + block_size], dtype=np.float32).T
+            if sims.shape[1] > k:
+                part = np.argpartition(sims, -k, axis=1)[:, -k:]
+                sims = np.take_along_axis(sims, part, axis=1)
+            else:
+                part = np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+            merged_scores = np.concatenate([scores, sims], axis=1)
+            merged_idx = np.concatenate([idx, part + t_start], axis=1)
+            keep = np.argpartition(merged_scores, -k, axis=1)[:, -k:]
+            scores = np.take_along_axis(merged_scores, keep, axis=1)
+            idx = np.take_along_axis(merged_idx, keep, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        best_score[start:start + len(block)] = np.take_along_axis(scores, order, axis=1)
+        best_idx[start:start + len(block)] = np.take_along_axis(idx, order, axis=1)
+
+    starts = range(0, len(queries), block_size)
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(run, starts))
+    else:
+        for start in starts:
+            run(start)
+    return best_idx, best_score
+
+
+class ExactMatcher:
+    """Drop-in for semantic_review_service.best_matches backed by an all-pairs top-1.
+
+    Both directions between two models are computed up front; lookups then
+    only fetch the requested extra columns of the best target rows.
+    """
+
+    def __init__(self, db: Session, first, second):
+        self.db = db
+        matrices = {model: load_embeddings(db, model) for model in (first, second)}
+        self._best: dict[tuple, dict[int, tuple[int, float]]] = {}
+        for query_model, target in ((first, second), (second, first)):
+            query, candidates = matrices[query_model], matrices[target]
+            idx, scores = top_k(query.vectors, candidates.vectors, 1)
+            if idx.shape[1] == 0:
+                self._best[(query_model, target)] = {}
+                continue
+            self._best[(query_model, target)] = {
+                int(query_id): (int(target_id), round(float(score), 4))
+                for query_id, target_id, score in zip(query.ids, candidates.ids[idx[:, 0]], scores[:, 0])
+            }
+
+    def __call__(self, query_model, target, ids: list[int], *columns) -> dict[int, tuple]:
+        best = self._best[(query_model, target)]
+        hits = {query_id: best[query_id] for query_id in ids if query_id in best}
+        if not columns or not hits:
+            return hits
+        pk = target.__mapper__.primary_key[0]
+        extra = {
+            row[0]: tuple(row[1:])
+            for row in self.db.execute(select(pk, *columns).where(pk.in_({t for t, _ in hits.values()})))
+        }
+        return {query_id: (t, score, *extra[t]) for query_id, (t, score) in hits.items()}
@@ -0,0 +1,259 @@
+import re
+import socket
+
+import numpy as np
+
+from app.config import settings
+
+# Address roles. Every interval is emitted under its own role and under ROLE_ANY,
+# so free-text queries without a sources/destinations split still share features.
+ROLE_ANY = 0
+ROLE_SOURCE = 1
+ROLE_DESTINATION = 2
+
+# Feature kinds
+KIND_BIAS = 1
+KIND_INTERVAL = 2
+KIND_PREFIX = 3
+KIND_SPAN = 4
+KIND_PORT = 5
+KIND_PORT_ONE = 6
+KIND_PORT_BUCKET = 7
+
+PREFIX_LEVELS = np.array([8, 12, 16, 20, 24, 28, 32], dtype=np.uint64)
+MAX_EXPANDED_PORTS = 16
+
+_IP = r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}"
+# Groups: range start, range end, network, prefix length, host
+_ADDRESS_RE = re.compile(
+    rf"({_IP})\s*(?:-|\bto\b)\s*({_IP})"
+    rf"|({_IP})/(\d{{1,2}})"
+    rf"|({_IP})"
+)
+_PORT_RE = re.compile(r"(?<![\d.])(\d{1,5})(?:\s*-\s*(\d{1,5}))?(?![\d.])")
+_FREE_PORTS_RE = re.compile(r"\bports?\s+((?:\d{1,5}(?:\s*-\s*\d{1,5})?(?:\s*,\s*|\s+and\s+|\s+)?)+)")
+
+
+def _ip_to_int(ip: str) -> int:
+    # The regex guarantees four dotted octets; inet_aton rejects octets above 255.
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+
+def _parse_intervals(section: str) -> set[tuple[int, int]]:
+    """Extract IPv4 intervals from hosts, CIDRs and ranges; equivalent notations collapse."""
+    intervals = set()
+    for start, end, net, prefix, host in _ADDRESS_RE.findall(section):
+        try:
+            if host:
+                lo = hi = _ip_to_int(host)
+            elif start:
+                lo, hi = _ip_to_int(start), _ip_to_int(end)
+                if lo > hi:
+                    lo, hi = hi, lo
+            else:
+                bits = int(prefix)
+                if bits > 32:
+                    continue
+                size = 1 << (32 - bits)
+                lo = _ip_to_int(net) & ~(size - 1) & 0xFFFFFFFF
+                hi = lo + size - 1
+        except OSError:
+            continue
+        intervals.add((lo, hi))
+    return intervals
+
+
+def _parse_ports(section: str) -> set[tuple[int, int]]:
+    ports = set()
+    for first, last in _PORT_RE.findall(section):
+        lo = int(first)
+        hi = int(last) if last else lo
+        if lo <= 65535 and hi <= 65535:
+            ports.add((lo, hi) if lo <= hi else (hi, lo))
+    return ports
+
+
+def parse_text(text: str) -> tuple[list[tuple[int, int, int]], set[tuple[int, int]]]:
+    """Parse an embedding text into (role, lo, hi) address intervals and port intervals.
+
+    Texts produced by build_request_text/build_rule_text are split on their
+    sources/destinations/ports markers; any other text is treated as a free-form
+    query whose addresses have no role.
+    """
+    lowered = text.lower()
+    ports_at = lowered.rfind(" ports ")
+    dst_at = lowered.rfind(" destinations ", 0, ports_at if ports_at >= 0 else None)
+    src_at = lowered.rfind(" sources ", 0, dst_at if dst_at >= 0 else None)
+
+    if src_at >= 0 and dst_at > src_at and ports_at > dst_at:
+        addresses = [(ROLE_SOURCE, iv) for iv in _parse_intervals(lowered[src_at:dst_at])]
+        addresses += [(ROLE_DESTINATION, iv) for iv in _parse_intervals(lowered[dst_at:ports_at])]
+        ports = _parse_ports(lowered[ports_at + len(" ports "):])
+    else:
+        addresses = [(ROLE_ANY, iv) for iv in _parse_intervals(lowered)]
+        ports = set()
+        for m in _FREE_PORTS_RE.finditer(lowered):
+            ports |= _parse_ports(m.group(1))
+    return [(role, lo, hi) for role, (lo, hi) in addresses], ports
+
+
+def _mix(keys: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer over a uint64 array."""
+    with np.errstate(over="ignore"):
+        z = keys + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _hash(kind: int, role: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        h = _mix(np.full(role.shape, kind, dtype=np.uint64) * np.uint64(0x100) + role)
+        h = _mix(h ^ a)
+        return _mix(h ^ b)
+
+
+class StructuralEncoder:
+    """Deterministic in-process embedding backend for structured rule/request texts.
+
+    Addresses are parsed into integer intervals and ports into port ranges, turned
+    into hashed features (exact interval, endpoint prefixes at several lengths,
+    span size, exact and bucketed ports) and scattered into a fixed-dimension,
+    L2-normalized vector. Every feature is hashed into both the leading
+    EMBEDDING_SHORT_DIMENSIONS and the remaining dimensions, so truncated vectors
+    stay meaningful. Equivalent notations yield identical vectors; overlapping
+    or neighbouring networks share coarse prefix features. Parsing is per text, all
+    hashing and accumulation is vectorized with NumPy over the whole batch.
+
+    Exposes the same interface as EmbeddingClient so it can be used as a drop-in backend.
+    """
+
+    cacheable = False
+
+    def __init__(self, dimensions: int | None = None):
+        self.dimensions = dimensions or settings.EMBEDDING_DIMENSIONS
+        self.model = f"structural-v2:{self.dimensions}"
+        self.batch_size = settings.STRUCTURAL_BATCH_SIZE
+        self.max_concurrency = settings.EMBEDDING_MAX_CONCURRENCY
+        self.calls = 0
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Encode texts into an (n, dimensions) float32 matrix of unit vectors."""
+        n = len(texts)
+        rows, roles, los, his = [], [], [], []
+        port_rows, port_los, port_his = [], [], []
+        for i, text in enumerate(texts):
+            addresses, ports = parse_text(text)
+            for role, lo, hi in addresses:
+                rows.append(i)
+                roles.append(role)
+                los.append(lo)
+                his.append(hi)
+            for lo, hi in ports:
+                port_rows.append(i)
+                port_los.append(lo)
+                port_his.append(hi)
+
+        feature_rows: list[np.ndarray] = []
+        feature_hashes: list[np.ndarray] = []
+        feature_weights: list[np.ndarray] = []
+
+        def emit(kind: int, row: np.ndarray, role: np.ndarray, a: np.ndarray, b: np.ndarray, weight: float):
+            feature_rows.append(row)
+            feature_hashes.append(_hash(kind, role, a, b))
+            feature_weights.append(np.full(row.shape, weight, dtype=np.float32))
+
+        all_rows = np.arange(n, dtype=np.int64)
+        zeros = np.zeros(n, dtype=np.uint64)
+        emit(KIND_BIAS, all_rows, zeros, zeros, zeros, 0.1)
+
+        if rows:
+            row = np.array(rows, dtype=np.int64)
+            role = np.array(roles, dtype=np.uint64)
+            lo = np.array(los, dtype=np.uint64)
+            hi = np.array(his, dtype=np.uint64)
+            # Every interval is emitted under its own role and under ROLE_ANY.
+            row = np.concatenate([row, row])
+            lo = np.concatenate([lo, lo])
+            hi = np.concatenate([hi, hi])
+            role = np.concatenate([role, np.zeros_like(role)])
+            _, unique_idx = np.unique(np.stack([row.astype(np.uint64), role, lo, hi]), axis=1, return_index=True)
+            row, role, lo, hi = row[unique_idx], role[unique_idx], lo[unique_idx], hi[unique_idx]
+
+            none = np.zeros(len(row), dtype=np.uint64)
+            emit(KIND_INTERVAL, row, role, lo, hi, 2.0)
+            span = np.floor(np.log2((hi - lo + np.uint64(1)).astype(np.float64))).astype(np.uint64)
+            emit(KIND_SPAN, row, role, span, none, 0.5)
+            for level in PREFIX_LEVELS:
+                shift = np.uint64(32) - level
+                lo_prefix = lo >> shift
+                hi_prefix = hi >> shift
+                emit(KIND_PREFIX, row, role, level, lo_prefix, 1.0)
+                differs = hi_prefix != lo_prefix
+                if differs.any():
+                    emit(KIND_PREFIX, row[differs], role[differs], level, hi_prefix[differs], 1.0)
+
+        if port_rows:
+            row = np.array(port_rows, dtype=np.int64)
+            lo = np.array(port_los, dtype=np.uint64)
+            hi = np.array(port_his, dtype=np.uint64)
+            none = np.zeros(len(row), dtype=np.uint64)
+            emit(KIND_PORT, row, none, lo, hi, 2.0)
+            emit(KIND_PORT_BUCKET, row, none, lo >> np.uint64(10), none, 0.5)
+            # Expand short ranges port by port so "8080-8081" overlaps "8080"
+            width = (hi - lo).astype(np.int64)
+            small = width < MAX_EXPANDED_PORTS
+            if small.any():
+                counts = width[small] + 1
+                expanded_rows = np.repeat(row[small], counts)
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                expanded_ports = np.repeat(lo[small], counts) + offsets.astype(np.uint64)
+                expanded_none = np.zeros(len(expanded_rows), dtype=np.uint64)
+                emit(KIND_PORT_ONE, expanded_rows, expanded_none, expanded_ports, expanded_none, 1.0)
+
+        hashes = np.concatenate(feature_hashes)
+        feature_row = np.concatenate(feature_rows)
+        weights = np.concatenate(feature_weights)
+        signs = np.where((hashes >> np.uint64(63)) == 0, 1.0, -1.0).astype(np.float32)
+        short = settings.EMBEDDING_SHORT_DIMENSIONS
+        if 0 < short < self.dimensions:
+            # Hash every feature into the leading `short` dimensions and again into the
+            # tail, so a truncated (Matryoshka) prefix still carries every feature.
+            head = (hashes % np.uint64(short)).astype(np.int64)
+            tail = short + ((hashes >> np.uint64(32)) % np.uint64(self.dimensions - short)).astype(np.int64)
+            buckets = np.concatenate([head, tail])
+            feature_row = np.concatenate([feature_row, feature_row])
+            weights = np.concatenate([weights, weights])
+            signs = np.concatenate([signs, signs])
+        else:
+            buckets = (hashes % np.uint64(self.dimensions)).astype(np.int64)
+        matrix = np.bincount(
+            feature_row * self.dimensions + buckets, weights=signs * weights, minlength=n * self.dimensions
+        ).astype(np.float32).reshape(n, self.dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        return self.encode(texts).tolist()
+
+    async def aembed_batch(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_batch(texts)
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "batch_size": self.batch_size,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": 0,
+            "calls": self.calls,
+            "retries": 0,
+            "failures": 0,
+            "last_latency_ms": None,
+        }
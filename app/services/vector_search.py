@@ -0,0 +1,292 @@
+import time
+from typing import Any
+
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import cast, func, select, text, true
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import address_canon, local_ann_index
+from app.services.embedding_service import truncate_embedding
+
+SEARCH_MODES = ("exact", "halfvec", "binary", "matryoshka", "local")
+
+# Database mode standing in for "local" where the local index does not apply
+LOCAL_FALLBACK_MODE = "halfvec"
+
+# Upper bound pgvector accepts for hnsw.ef_search
+MAX_EF_SEARCH = 1000
+
+
+def _dims() -> int:
+    return settings.EMBEDDING_DIMENSIONS
+
+
+def compact_column(model, mode: str):
+    """Column whose non-null values the compact index for `mode` covers."""
+    return model.embedding_short if mode == "matryoshka" else model.embedding
+
+
+def compact_distance(model, query_vector, mode: str, query_short=None):
+    """Distance expression matching the compact index for the given mode.
+
+    The halfvec / binary expressions must stay identical to the ones in migration
+    007, otherwise the planner cannot use those HNSW indexes. The matryoshka mode
+    searches the truncated embedding_short column added in migration 008.
+    query_vector may also be an embedding column (batched KNN); query_short is
+    then the matching embedding_short column.
+    """
+    column = model.embedding
+    if mode == "matryoshka":
+        if query_short is None:
+            query_short = truncate_embedding(query_vector)
+        return model.embedding_short.cosine_distance(query_short)
+    if mode == "halfvec":
+        return cast(column, HALFVEC(_dims())).cosine_distance(cast(query_vector, HALFVEC(_dims())))
+    if mode == "binary":
+        return cast(func.binary_quantize(column), BIT(_dims())).hamming_distance(
+            func.binary_quantize(cast(query_vector, Vector(_dims())))
+        )
+    raise ValueError(f"Unknown compact search mode: {mode!r}")
+
+
+def candidate_count(limit: int) -> int:
+    """Number of compact-index candidates fetched for re-ranking `limit` results."""
+    return max(limit * settings.VECTOR_RERANK_FACTOR, settings.VECTOR_RERANK_MIN_CANDIDATES)
+
+
+def port_filter(model, port: str):
+    """Rows of `model` whose ports allow all of `port` ('443', '8000-8080', 'tcp/443' or 'any').
+
+    Parsed like the stored ports (address_canon.parse_port) and matched by
+    range containment on the generated port_ranges column, so 443 finds rules
+    listing 'any', '1-1024' or 'tcp/443'. Stored tokens that do not parse as
+    ports never match. Raises ValueError for an unparseable `port`.
+    """
+    interval = address_canon.parse_port(port)
+    if interval is None:
+        raise ValueError(f"Invalid port: {port!r}")
+    return model.port_ranges.contains(func.int4range(interval[0], interval[1], "[]"))
+
+
+def rule_filters(firewall_device: str | None = None, action: str | None = None, port: str | None = None) -> tuple:
+    """WHERE clauses for a filtered search over physical rules (indexes: migrations 013 and 016)."""
+    filters = []
+    if firewall_device is not None:
+        filters.append(PhysicalRule.firewall_device == firewall_device)
+    if action is not None:
+        filters.append(PhysicalRule.action == action)
+    if port is not None:
+        filters.append(port_filter(PhysicalRule, port))
+    return tuple(filters)
+
+
+def request_filters(status: str | None = None, port: str | None = None) -> tuple:
+    """WHERE clauses for a filtered search over requests (indexes: migrations 013 and 016)."""
+    filters = []
+    if status is not None:
+        filters.append(Request.status == status)
+    if port is not None:
+        filters.append(port_filter(Request, port))
+    return tuple(filters)
+
+
+def tune_index_scan(db: Session, limit: int) -> None:
+    """SET LOCAL the HNSW scan parameters for the rest of the current transaction.
+
+    ef_search is VECTOR_EF_SEARCH, raised to the candidate count of this query
+    so the first pass can already return all of them. Iterative scans
+    (pgvector 0.8) continue past that when filters reject rows; relaxed order
+    is enough because the candidates are re-ranked by exact distance anyway.
+    """
+    ef_search = min(max(settings.VECTOR_EF_SEARCH, candidate_count(limit)), MAX_EF_SEARCH)
+    db.execute(text(
+        f"SET LOCAL hnsw.ef_search = {int(ef_search)}; "
+        "SET LOCAL hnsw.iterative_scan = relaxed_order; "
+        f"SET LOCAL hnsw.max_scan_tuples = {int(settings.VECTOR_MAX_SCAN_TUPLES)}"
+    ))
+
+
+def nearest(
+    db: Session,
+    model,
+    query_vector,
+    limit: int,
+    mode: str | None = None,
+    options: tuple[Any, ...] = (),
+    threshold: float | None = None,
+    filters: tuple[Any, ...] = (),
+) -> list[tuple[Any, float]]:
+    """Return up to `limit` (entity, cosine_distance) rows nearest to query_vector, closest first.
+
+    In "exact" mode the query orders directly by full-precision cosine distance.
+    No index serves that order (migration 007 dropped the float32 HNSW
+    indexes), so it is a brute-force scan: the ground truth for compare_modes,
+    not a serving mode.
+    In "halfvec", "binary" and "matryoshka" modes candidates are fetched from the
+    compact HNSW index and re-ranked by full-precision cosine distance, so the
+    returned distances are always exact. In "local" mode the process-local
+    index (local_ann_index) finds the rows and the database only loads them;
+    without a snapshot in LOCAL_ANN_DIR it searches like LOCAL_FALLBACK_MODE.
+
+    With `threshold`, only rows with a cosine similarity of at least threshold
+    are returned. The predicate sits inside the index scan, which runs as a
+    pgvector iterative scan (tune_index_scan): it keeps walking the graph until
+    enough qualifying candidates are found or VECTOR_MAX_SCAN_TUPLES are
+    visited, so no over-fetch is needed to fill `limit`. The local index
+    applies the threshold the same way, probing further lists as needed.
+
+    `filters` are WHERE clauses on `model` (see rule_filters / request_filters),
+    applied in the same place. The local index cannot filter, so filtered
+    "local" searches run as LOCAL_FALLBACK_MODE.
+    """
+    mode = mode or settings.VECTOR_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown vector search mode: {mode!r}")
+    max_distance = None if threshold is None else 1.0 - threshold
+    if mode == "local":
+        hits = None
+        if settings.LOCAL_ANN_DIR and not filters:
+            hits = local_ann_index.get(model).search(query_vector, limit, max_distance)
+        if hits is not None:
+            return _hydrate(db, model, hits, options)
+        mode = LOCAL_FALLBACK_MODE
+
+    column = model.embedding
+    pk = model.__mapper__.primary_key[0]
+    distance = column.cosine_distance(query_vector)
+    exact = distance.label("distance")
+    query = db.query(model, exact).options(*options)
+
+    if mode == "exact":
+        query = query.filter(column.isnot(None), *filters)
+        if max_distance is not None:
+            query = query.filter(distance <= max_distance)
+    else:
+        candidates = select(pk).where(compact_column(model, mode).isnot(None), *filters)
+        if max_distance is not None:
+            candidates = candidates.where(distance <= max_distance)
+        candidates = (
+            candidates
+            .order_by(compact_distance(model, query_vector, mode))
+            .limit(candidate_count(limit))
+            .subquery()
+        )
+        tune_index_scan(db, limit)
+        query = query.join(candidates, pk == candidates.c[pk.key])
+
+    return query.order_by(exact).limit(limit).all()
+
+
+def _hydrate(db: Session, model, hits: list[tuple[int, float]], options: tuple[Any, ...]) -> list[tuple[Any, float]]:
+    # Rows deleted since the local index last refreshed are dropped
+    pk = model.__mapper__.primary_key[0]
+    entities = {
+        getattr(entity, pk.key): entity
+        for entity in db.query(model).options(*options).filter(pk.in_([row_id for row_id, _ in hits]))
+    }
+    return [(entities[row_id], distance) for row_id, distance in hits if row_id in entities]
+
+
+def nearest_batch(
+    db: Session,
+    query_model,
+    target,
+    query_ids: list[int],
+    limit: int = 1,
+    mode: str | None = None,
+    columns: tuple[Any, ...] = (),
+) -> list[tuple]:
+    """Nearest `target` rows for many `query_model` rows in one statement.
+
+    Each query row's stored embedding is joined LATERAL against the target's
+    HNSW index, the same candidate-and-re-rank plan as nearest(), so no vector
+    leaves the database. Returns (query_id, target_id, cosine_distance,
+    *columns) rows, closest first per query row; query rows without an
+    embedding, or without any candidate, return no rows. `columns` are extra
+    target columns to return alongside, e.g. a name for the response.
+    The index scan is tuned per transaction like nearest() (tune_index_scan).
+    The local index answers single queries only; "local" runs as
+    LOCAL_FALLBACK_MODE here.
+    """
+    mode = mode or settings.VECTOR_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown vector search mode: {mode!r}")
+    if mode == "local":
+        mode = LOCAL_FALLBACK_MODE
+    if not query_ids:
+        return []
+
+    q = aliased(query_model, name="q")
+    q_pk = getattr(q, query_model.__mapper__.primary_key[0].key)
+    pk = target.__mapper__.primary_key[0]
+    exact = target.embedding.cosine_distance(q.embedding)
+
+    best = select(pk.label("target_id"), exact.label("distance"), *columns)
+    if mode == "exact":
+        best = best.where(target.embedding.isnot(None))
+    else:
+        candidate = aliased(target, name="candidate")
+        candidates = (
+            select(getattr(candidate, pk.key))
+            .where(compact_column(candidate, mode).isnot(None))
+            .order_by(compact_distance(candidate, q.embedding, mode, query_short=q.embedding_short))
+            .limit(candidate_count(limit))
+        )
+        best = best.where(pk.in_(candidates))
+    best = best.order_by(exact).limit(limit).lateral("best")
+
+    if mode != "exact":
+        tune_index_scan(db, limit)
+    rows = db.execute(
+        select(q_pk, best)
+        .select_from(q)
+        .join(best, true())
+        .where(q_pk.in_(query_ids), q.embedding.isnot(None))
+        .order_by(q_pk, best.c.distance)
+    )
+    return [tuple(row) for row in rows]
+
+
+def compare_modes(db: Session, target, query_model, sample_size: int, limit: int) -> list[dict]:
+    """Measure recall@limit and latency of every search mode against the brute-force "exact" mode.
+
+    Query vectors are sampled at random from `query_model` (e.g. requests) and
+    searched against `target` (e.g. physical rules).
+    """
+    queries = [
+        list(vector) for (vector,) in
+        db.query(query_model.embedding)
+        .filter(query_model.embedding.isnot(None))
+        .order_by(func.random())
+        .limit(sample_size)
+        .all()
+    ]
+    pk_key = target.__mapper__.primary_key[0].key
+
+    results: dict[str, dict] = {mode: {"latencies": [], "hits": 0, "expected": 0} for mode in SEARCH_MODES}
+    for query_vector in queries:
+        truth: set | None = None
+        for mode in SEARCH_MODES:
+            started = time.perf_counter()
+            rows = nearest(db, target, query_vector, limit, mode)
+            results[mode]["latencies"].append((time.perf_counter() - started) * 1000.0)
+            ids = {getattr(entity, pk_key) for entity, _ in rows}
+            if truth is None:
+                truth = ids
+            results[mode]["hits"] += len(ids & truth)
+            results[mode]["expected"] += len(truth)
+
+    report = []
+    for mode in SEARCH_MODES:
+        latencies = sorted(results[mode]["latencies"])
+        expected = results[mode]["expected"]
+        report.append({
+            "mode": mode,
+            "recall": round(results[mode]["hits"] / expected, 4) if expected else None,
+            "latency_ms_avg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else None,
+        })
+    return report
@@ -0,0 +1,117 @@
+"""Shared fixtures.
+
+Tests that need PostgreSQL (with pgvector) run against TEST_DATABASE_URL and
+are skipped when it is not set. The database is migrated to head once per
+session and every table is emptied before each test, so point it at a
+scratch database. Embeddings use the offline structural backend.
+"""
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+ROOT = Path(__file__).resolve().parent.parent
+
+# app.config reads the environment on import, so it is set up before any app import
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+os.environ["EMBEDDING_BACKEND"] = "structural"
+os.environ["LOCAL_ANN_DIR"] = ""
+os.environ["SIMILARITY_CACHE_DIR"] = ""
+
+
+@pytest.fixture(scope="session")
+def database():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT / "alembic"))
+    command.upgrade(config, "head")
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def db(database):
+    from sqlalchemy import text
+
+    from app.database import SessionLocal, engine
+
+    with engine.begin() as conn:
+        tables = conn.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename <> 'alembic_version'"
+        )).scalars().all()
+        conn.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    # Not used as a context manager: the lifespan would resume embedding jobs
+    return TestClient(app)
+
+
+@pytest.fixture
+def add_request(client):
+    def add(name: str, sources: list[str], destinations: list[str], ports: list[str]) -> int:
+        response = client.post("/api/requests", json={
+            "name": name,
+            "request_json": {"sources": sources, "destinations": destinations, "ports": ports},
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["request_id"]
+    return add
+
+
+@pytest.fixture
+def add_rule(client):
+    def add(
+        rule_name: str,
+        sources: list[str],
+        destinations: list[str],
+        ports: list[str],
+        action: str = "allow",
+        firewall_device: str = "fw-1",
+    ) -> int:
+        response = client.post("/api/physical-rules", json={
+            "rule_name": rule_name, "firewall_device": firewall_device, "action": action,
+            "sources": sources, "destinations": destinations, "ports": ports,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["rule_id"]
+    return add
+
+
+@pytest.fixture
+def sync_rules(client):
+    """Sync one device with a complete export given as a list of rule dicts."""
+    def sync(firewall_device: str, rules: list[dict]) -> dict:
+        body = "".join(json.dumps(rule) + "\n" for rule in rules)
+        response = client.post(
+            f"/api/rule-syncs?format=jsonl&firewall_device={firewall_device}",
+            content=body,
+            headers={"content-type": "application/x-ndjson"},
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+    return sync
+
+
+@pytest.fixture
+def embed_all(db):
+    """Embed everything queued in the outbox, as app.embedding_worker would."""
+    from app.services import embedding_outbox_service
+
+    def embed() -> None:
+        embedding_outbox_service.drain(db)
+    return embed
@@ -0,0 +1,85 @@
+import pytest
+
+from app.services import address_canon
+
+NET_10_0_10 = ((0x0A000A00, 0x0A000AFF),)
+
+
+@pytest.mark.parametrize("addresses", [
+    ["10.0.10.0/24"],
+    ["10.0.10.0-10.0.10.255"],
+    ["10.0.10.0/25", "10.0.10.128/25"],
+    ["10.0.10.128/25", "10.0.10.0-10.0.10.127"],
+    ["10.0.10.77/24"],
+    [" 10.0.10.0 - 10.0.10.255 "],
+    ["10.0.10.0/24", "10.0.10.5"],
+])
+def test_notations_of_the_same_network_are_equal(addresses):
+    assert address_canon.canonical_addresses(addresses) == (NET_10_0_10, ())
+
+
+@pytest.mark.parametrize("address, interval", [
+    ("any", (0, address_canon.MAX_IPV4)),
+    (" ALL ", (0, address_canon.MAX_IPV4)),
+    ("*", (0, address_canon.MAX_IPV4)),
+    ("0.0.0.0/0", (0, address_canon.MAX_IPV4)),
+    ("10.0.0.1", (0x0A000001, 0x0A000001)),
+    ("10.0.0.1/32", (0x0A000001, 0x0A000001)),
+    ("10.0.0.0/024", (0x0A000000, 0x0A0000FF)),
+    ("10.0.0.256", None),
+    ("10.0.0.0/33", None),
+    ("10.0.0.9-10.0.0.1", None),
+    ("10.0.0", None),
+    ("host.example", None),
+])
+def test_parse_address(address, interval):
+    assert address_canon.parse_address(address) == interval
+
+
+def test_adjacent_intervals_merge_and_gaps_do_not():
+    assert address_canon.merge_intervals([(10, 19), (0, 9), (25, 30), (28, 40)]) == ((0, 19), (25, 40))
+
+
+def test_unparsed_addresses_are_kept_lower_cased_and_sorted():
+    canonical = address_canon.canonical_addresses(["Web-Servers", "10.0.0.1", "db", "web-servers "])
+    assert canonical == (((0x0A000001, 0x0A000001),), ("db", "web-servers"))
+
+
+@pytest.mark.parametrize("port, interval", [
+    ("443", (443, 443)),
+    ("tcp/443", (443, 443)),
+    ("UDP/53", (53, 53)),
+    ("8000-9000", (8000, 9000)),
+    ("8000 - 9000", (8000, 9000)),
+    ("any", (0, address_canon.MAX_PORT)),
+    ("65535", (65535, 65535)),
+    ("65536", None),
+    ("90-80", None),
+    ("http", None),
+    ("sctp/80", None),
+])
+def test_parse_port(port, interval):
+    assert address_canon.parse_port(port) == interval
+
+
+def test_port_lists_merge():
+    assert address_canon.canonical_ports(["80", "81", "82"]) == address_canon.canonical_ports(["80-82"])
+    assert address_canon.canonical_ports(["tcp/443", "443"]) == (((443, 443),), ())
+
+
+def test_fingerprint_ignores_notation_but_not_direction():
+    a = address_canon.fingerprint(["10.0.10.0/24"], ["10.1.0.1"], ["443"])
+    assert a == address_canon.fingerprint(["10.0.10.0-10.0.10.255"], ["10.1.0.1/32"], ["tcp/443"])
+    assert a != address_canon.fingerprint(["10.1.0.1"], ["10.0.10.0/24"], ["443"])
+    assert a != address_canon.fingerprint(["10.0.10.0/24"], ["10.1.0.1"], ["443", "80"])
+
+
+@pytest.mark.parametrize("lo, hi, text", [
+    (0, address_canon.MAX_IPV4, "any"),
+    (0x0A000001, 0x0A000001, "10.0.0.1"),
+    (0x0A000A00, 0x0A000AFF, "10.0.10.0/24"),
+    (0x0A000001, 0x0A000005, "10.0.0.1-10.0.0.5"),
+])
+def test_format_address_interval_round_trips(lo, hi, text):
+    assert address_canon.format_address_interval(lo, hi) == text
+    assert address_canon.parse_address(text) == (lo, hi)
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from sqlalchemy import select, text
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+
+NDJSON = {"content-type": "application/x-ndjson"}
+
+
+def rule(name, sources, destinations, ports, action="allow", firewall_device="fw-1"):
+    return {
+        "rule_name": name, "firewall_device": firewall_device, "action": action,
+        "sources": sources, "destinations": destinations, "ports": ports,
+    }
+
+
+def ndjson(rows) -> str:
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "BULK_INGEST_CHUNK_SIZE", 2)
+
+
+def counts(db) -> tuple:
+    return db.execute(text(
+        "SELECT (SELECT count(*) FROM physical_rules), (SELECT count(*) FROM requests),"
+        " (SELECT count(*) FROM embedding_outbox)"
+    )).one()
+
+
+@pytest.mark.parametrize("value", [
+    "plain",
+    "tab\there",
+    "new\nline",
+    "back\\slash",
+    'quote"d',
+    "{brace,comma}",
+])
+def test_copy_round_trips_special_characters(client, db, value):
+    body = ndjson([rule(value, [value], ["10.1.0.1"], [value, "443"], firewall_device=value)])
+    response = client.post("/api/physical-rules/bulk", content=body, headers=NDJSON)
+    assert response.status_code == 200, response.text
+    stored = db.scalars(select(PhysicalRule)).one()
+    assert (stored.rule_name, stored.firewall_device, stored.ports) == (value, value, [value, "443"])
+    assert [s.address for s in stored.sources] == [value]
+
+
+def test_ndjson_rules_are_copied_in_chunks_and_queued(client, db, small_chunks, add_rule):
+    rows = [rule(f"r{i}", [f"10.0.{i}.0/24", f"10.9.{i}.1"], ["10.1.0.1"], ["443"]) for i in range(5)]
+    # A blank line and a missing trailing newline are both accepted
+    body = ndjson(rows[:3]) + "\n" + ndjson(rows[3:]).rstrip("\n")
+    response = client.post("/api/physical-rules/bulk", content=body, headers=NDJSON)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["rows_inserted"], result["sources_inserted"], result["destinations_inserted"]) == (5, 10, 5)
+    assert (result["embeddings_queued"], result["embedding_deferred"]) == (5, False)
+    assert counts(db) == (5, 0, 5)
+
+    # Same content hash as the single-row endpoint, and IDs continue from the sequence
+    single = add_rule("single", ["10.0.0.0/24", "10.9.0.1"], ["10.1.0.1"], ["443"])
+    hashes = dict(db.execute(select(PhysicalRule.rule_name, PhysicalRule.content_hash)).all())
+    assert hashes["single"] == hashes["r0"]
+    assert single == 6
+
+
+def test_json_array_of_requests_with_deferred_embedding(client, db, small_chunks):
+    rows = [
+        {"name": f"q{i}", "request_json": {"sources": [f"10.0.{i}.0/24"], "destinations": ["10.1.0.1"], "ports": ["443"]}}
+        for i in range(3)
+    ]
+    response = client.post("/api/requests/bulk?defer_embedding=true", json=rows)
+    assert response.status_code == 200, response.text
+    assert (response.json()["rows_inserted"], response.json()["embeddings_queued"]) == (3, 0)
+    assert counts(db) == (0, 3, 0)
+    stored = client.get("/api/requests").json()
+    assert [(r["name"], r["request_json"]) for r in stored] == [(r["name"], r["request_json"]) for r in rows]
+
+
+@pytest.mark.parametrize("body, headers, message", [
+    (ndjson([rule("a", ["10.0.0.1"], ["10.1.0.1"], ["443"])] * 3) + '{"rule_name": "b"}\n', NDJSON, "Row 4:"),
+    (ndjson([rule("a", ["10.0.0.1"], ["10.1.0.1"], ["443"])] * 2) + "\n{not json\n", NDJSON, "Row 4: invalid JSON"),
+    (json.dumps({"rule_name": "a"}), {"content-type": "application/json"}, "Expected a JSON array"),
+    ("[", {"content-type": "application/json"}, "Invalid JSON"),
+    (ndjson([rule("a", ["10.0.0.1"], ["10.1.0.1"], ["443"])] * 2 + [rule("x" * 300, ["10.0.0.1"], ["10.1.0.1"], ["443"])]),
+     NDJSON, "Rows 3-3:"),
+    (ndjson([rule("a", ["10.0.0.1"], ["10.1.0.1"], ["443"]), rule("nul\x00", ["10.0.0.1"], ["10.1.0.1"], ["443"])]),
+     NDJSON, "Rows 1-2:"),
+])
+def test_bad_rows_are_reported_and_nothing_is_loaded(client, db, small_chunks, body, headers, message):
+    response = client.post("/api/physical-rules/bulk", content=body, headers=headers)
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith(message)
+    # Earlier chunks were rolled back with the rest
+    assert counts(db) == (0, 0, 0)
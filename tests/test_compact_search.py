@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import embedding_service, vector_search
+
+COMPACT_MODES = ("halfvec", "binary")
+
+
+@pytest.fixture
+def embedded(db, sync_rules, add_request, embed_all):
+    sync_rules("fw-1", [
+        {"rule_name": f"r{i}", "sources": [f"10.{i % 5}.{i}.0/24"], "destinations": [f"10.1.0.{i % 30}"],
+         "ports": [str(1000 + i % 11)]}
+        for i in range(80)
+    ])
+    for i in range(4):
+        add_request(f"q{i}", [f"10.{i}.{2 * i}.0/24"], [f"10.1.0.{i}"], [str(1000 + i)])
+    embed_all()
+
+
+def plan(db, model, mode) -> str:
+    """EXPLAIN of a compact candidate query, with sequential scans ruled out."""
+    query = [1.0] + [0.0] * 1023
+    candidates = select(model.__mapper__.primary_key[0]).order_by(
+        vector_search.compact_distance(model, query, mode)
+    ).limit(10)
+    sql = str(candidates.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    lines = db.execute(text(f"EXPLAIN {sql}")).scalars().all()
+    db.rollback()
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("model", [PhysicalRule, Request])
+@pytest.mark.parametrize("mode, index", [("halfvec", "embedding_halfvec"), ("binary", "embedding_bit")])
+def test_compact_distance_matches_the_index_expression(db, model, mode, index):
+    assert f"idx_{model.__tablename__}_{index}" in plan(db, model, mode)
+
+
+@pytest.mark.parametrize("mode", COMPACT_MODES)
+def test_compact_modes_rerank_with_exact_distances(db, embedded, mode):
+    rules = db.execute(select(PhysicalRule.rule_id, PhysicalRule.embedding)).all()
+    vectors = np.array([embedding for _, embedding in rules], np.float64)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    distances = dict(zip([rule_id for rule_id, _ in rules], (1.0 - vectors @ vectors[0]).tolist()))
+    db.rollback()
+
+    rows = vector_search.nearest(db, PhysicalRule, list(rules[0][1]), 10, mode)
+    assert len(rows) == 10
+    returned = [distance for _, distance in rows]
+    assert returned == sorted(returned)
+    for rule, distance in rows:
+        assert distance == pytest.approx(distances[rule.rule_id], abs=1e-5)
+    # The query row itself is always found, at distance 0
+    assert rows[0][0].rule_id == rules[0][0]
+
+
+def test_benchmark_reports_every_mode(client, embedded):
+    response = client.get("/api/semantic-search/benchmark?target=rules&sample_size=4&limit=5")
+    assert response.status_code == 200, response.text
+    modes = {m["mode"]: m for m in response.json()["modes"]}
+    assert list(modes) == list(vector_search.SEARCH_MODES)
+    assert modes["exact"]["recall"] == 1.0
+    assert all(0.0 <= m["recall"] <= 1.0 and m["latency_ms_avg"] > 0 for m in modes.values())
+
+
+def test_unknown_mode_is_rejected(client, db):
+    with pytest.raises(ValueError):
+        vector_search.nearest(db, PhysicalRule, [0.0] * 1024, 5, "float32")
+    response = client.post("/api/semantic-search/by-text", json={"query": "web", "mode": "float32"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("model", [PhysicalRule, Request])
+def test_matryoshka_distance_uses_the_short_index(db, model):
+    assert f"idx_{model.__tablename__}_embedding_short" in plan(db, model, "matryoshka")
+
+
+def test_truncated_embedding_is_the_normalized_prefix():
+    vector = np.arange(1, settings.EMBEDDING_DIMENSIONS + 1, dtype=np.float64)
+    prefix = vector[:settings.EMBEDDING_SHORT_DIMENSIONS]
+    short = np.array(embedding_service.truncate_embedding(vector.tolist()))
+    assert np.linalg.norm(short) == pytest.approx(1.0)
+    np.testing.assert_allclose(short, prefix / np.linalg.norm(prefix))
+
+
+def test_stored_short_vectors_match_the_migration_backfill(db, embedded):
+    # Migration 008 fills embedding_short with l2_normalize(subvector(...)); the app must write the same
+    rows = db.execute(text(f"""
+        SELECT embedding_short::text,
+               l2_normalize(subvector(embedding, 1, {settings.EMBEDDING_SHORT_DIMENSIONS}))::text
+        FROM physical_rules
+    """)).all()
+    assert rows
+    for stored, backfilled in rows:
+        np.testing.assert_allclose(
+            np.array(stored.strip("[]").split(","), float), np.array(backfilled.strip("[]").split(","), float), atol=1e-6
+        )
+
+
+def test_matryoshka_mode_reranks_with_full_vectors(db, embedded):
+    rules = db.execute(select(PhysicalRule.rule_id, PhysicalRule.embedding)).all()
+    db.rollback()
+    query = list(rules[0][1])
+    exact = vector_search.nearest(db, PhysicalRule, query, 10, "exact")
+    rows = vector_search.nearest(db, PhysicalRule, query, 10, "matryoshka")
+    assert rows[0][0].rule_id == rules[0][0]
+    exact_distances = {rule.rule_id: distance for rule, distance in vector_search.nearest(db, PhysicalRule, query, 80, "exact")}
+    for rule, distance in rows:
+        assert distance == pytest.approx(exact_distances[rule.rule_id], abs=1e-5)
+    hits = {rule.rule_id for rule, _ in rows} & {rule.rule_id for rule, _ in exact}
+    assert len(hits) >= 8
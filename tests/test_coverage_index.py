@@ -0,0 +1,158 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from app.services import address_canon, coverage_index
+from app.services.coverage_index import BoxIndex
+
+# Small coordinates, so coverage can be checked point by point
+SIDE = 12
+
+
+def random_box(rng, side=SIDE):
+    box = []
+    for _ in range(3):
+        lo, hi = sorted(rng.integers(0, side, 2).tolist())
+        box += [lo, hi]
+    return tuple(box)
+
+
+def points(box):
+    return set(itertools.product(range(box[0], box[1] + 1), range(box[2], box[3] + 1), range(box[4], box[5] + 1)))
+
+
+def overlaps(a, b):
+    return all(a[i] <= b[i + 1] and b[i] <= a[i + 1] for i in (0, 2, 4))
+
+
+def test_boxes_for_is_the_cross_product_of_merged_intervals():
+    boxes = coverage_index.boxes_for(["10.0.0.0/25", "10.0.0.128/25", "10.0.2.1"], ["10.1.0.1"], ["80", "443"])
+    assert boxes == [
+        (0x0A000000, 0x0A0000FF, 0x0A010001, 0x0A010001, 80, 80),
+        (0x0A000000, 0x0A0000FF, 0x0A010001, 0x0A010001, 443, 443),
+        (0x0A000201, 0x0A000201, 0x0A010001, 0x0A010001, 80, 80),
+        (0x0A000201, 0x0A000201, 0x0A010001, 0x0A010001, 443, 443),
+    ]
+
+
+@pytest.mark.parametrize("sources, destinations, ports", [
+    (["web"], ["10.1.0.1"], ["443"]),
+    (["10.0.0.1"], ["10.1.0.1"], ["http"]),
+    ([], ["10.1.0.1"], ["443"]),
+])
+def test_boxes_for_unknown_space_is_none(sources, destinations, ports):
+    assert coverage_index.boxes_for(sources, destinations, ports) is None
+
+
+def clip(box, cutter):
+    return tuple(max(box[i], cutter[i]) if i % 2 == 0 else min(box[i], cutter[i]) for i in range(6))
+
+
+def test_union_volume_counts_overlaps_once():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        boxes = [random_box(rng) for _ in range(rng.integers(0, 8))]
+        assert coverage_index.union_volume(boxes) == len(set().union(*map(points, boxes)))
+
+
+def test_uncovered_boxes_are_disjoint_and_exactly_the_rest():
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        box = random_box(rng)
+        cutters = [clip(box, c) for c in (random_box(rng) for _ in range(rng.integers(0, 6))) if overlaps(box, c)]
+        expected = points(box).difference(*map(points, cutters))
+        fragments = list(coverage_index.uncovered_boxes(box, cutters))
+        assert set().union(*map(points, fragments)) == expected
+        assert sum(coverage_index.volume(f) for f in fragments) == len(expected)
+
+
+def test_many_disjoint_cutters_stay_cheap():
+    # Hosts inside an 'any' box: the union is their count, and remainder boxes are produced on demand
+    rng = np.random.default_rng(5)
+    any_box = (0, address_canon.MAX_IPV4, 0, address_canon.MAX_IPV4, 0, address_canon.MAX_PORT)
+    hosts = {tuple(int(v) for v in (s, s, d, d, p, p)) for s, d, p in rng.integers(0, 1 << 16, (20000, 3))}
+    assert coverage_index.union_volume(list(hosts)) == len(hosts)
+    coverage = coverage_index.evaluate({1: [any_box]}, BoxIndex.build(dict(enumerate([h] for h in hosts))), 20)
+    assert len(coverage.remainder[0]) == 20
+    assert coverage.truncated == {0}
+    assert len(coverage.owners(0)) == len(hosts)
+
+
+def test_intersecting_finds_every_overlap():
+    rng = np.random.default_rng(3)
+    # Destination lengths from single addresses to the whole axis, across all length classes
+    indexed = {owner: [random_box(rng, 1 << 10) for _ in range(rng.integers(1, 3))] for owner in range(60)}
+    index = BoxIndex.build(indexed)
+    queries = np.array([random_box(rng, 1 << 10) for _ in range(200)], dtype=np.int64)
+    rows, boxes, owners = index.intersecting(queries)
+    found = sorted(zip(rows.tolist(), map(tuple, boxes.tolist()), owners.tolist()))
+    expected = sorted(
+        (row, box, owner)
+        for row, query in enumerate(map(tuple, queries.tolist()))
+        for owner, owned in indexed.items()
+        for box in owned
+        if overlaps(query, box)
+    )
+    assert found == expected
+
+
+def test_empty_index_has_no_hits():
+    rows, boxes, owners = BoxIndex.build({}).intersecting(np.array([(0, 1, 0, 1, 0, 1)], dtype=np.int64))
+    assert len(rows) == len(boxes) == len(owners) == 0
+
+
+def test_evaluate_matches_point_counting():
+    rng = np.random.default_rng(4)
+    indexed = {owner: [random_box(rng)] for owner in range(8)}
+    queries = {entity: [random_box(rng) for _ in range(rng.integers(1, 3))] for entity in range(100, 140)}
+    coverage = coverage_index.evaluate(queries, BoxIndex.build(indexed), max_remainder=1000)
+
+    covered_points = set().union(*(points(box) for boxes in indexed.values() for box in boxes))
+    for i, (entity, boxes) in enumerate(queries.items()):
+        space = set().union(*map(points, boxes))
+        # Query boxes of one entity are disjoint when they come from boxes_for; here they may overlap
+        total = sum(len(points(box)) for box in boxes)
+        uncovered = sum(len(points(box) - covered_points) for box in boxes)
+        assert coverage.covered_fraction[i] == pytest.approx(1.0 - uncovered / total)
+        assert coverage.owners(i) == sorted(
+            owner for owner, owned in indexed.items() if any(overlaps(b, o) for b in boxes for o in owned)
+        )
+        left = set().union(*map(points, coverage.remainder.get(i, [])))
+        assert left == space - covered_points
+    assert not coverage.truncated
+
+
+def test_evaluate_truncates_the_remainder():
+    index = BoxIndex.build({1: [(2, 3, 2, 3, 2, 3)]})
+    coverage = coverage_index.evaluate({7: [(0, 5, 0, 5, 0, 5)]}, index, max_remainder=2)
+    assert coverage.remainder[0] == [(0, 1, 0, 5, 0, 5), (2, 3, 0, 1, 0, 5)]
+    assert coverage.truncated == {0}
+    assert coverage.covered_fraction[0] == pytest.approx(1.0 - (216 - 8) / 216)
+
+
+def test_coverage_review_reports_partial_requests_and_excess_rules(client, add_request, add_rule):
+    covered = add_request("covered", ["10.0.0.5"], ["10.1.0.1"], ["443"])
+    partial = add_request("partial", ["10.0.0.0/23"], ["10.1.0.1"], ["443"])
+    add_request("uncovered", ["192.168.0.1"], ["10.1.0.1"], ["22"])
+    add_request("named", ["web"], ["10.1.0.1"], ["443"])
+    wide = add_rule("wide", ["10.0.0.0/24"], ["10.1.0.0/24"], ["443"])
+    add_rule("lonely", ["172.16.0.1"], ["172.16.0.2"], ["80"])
+    add_rule("blocked", ["10.0.0.0/8"], ["10.1.0.1"], ["22"], action="deny")
+
+    result = client.post("/api/review/run-coverage?include_covered=true").json()
+    requests = {r["name"]: r for r in result["requests"]}
+    assert requests["covered"]["status"] == "covered" and requests["covered"]["request_id"] == covered
+    assert requests["partial"]["status"] == "partial"
+    assert requests["partial"]["covering_rule_ids"] == [wide]
+    assert requests["partial"]["covered_fraction"] == 0.5
+    assert requests["partial"]["uncovered"] == [{"sources": "10.0.1.0/24", "destinations": "10.1.0.1", "ports": "443"}]
+    assert requests["uncovered"]["status"] == "uncovered"
+    assert requests["named"]["status"] == "unparsable"
+    rules = {r["rule_name"]: r for r in result["physical_rules"]}
+    assert rules["wide"]["status"] == "over_permissive"
+    assert sorted(rules["wide"]["request_ids"]) == sorted([covered, partial])
+    assert rules["lonely"]["status"] == "unrequested"
+    assert "blocked" not in rules
+    summary = result["summary"]
+    assert (summary["total_physical_rules"], summary["evaluated_physical_rules"], summary["total_requests"]) == (3, 2, 4)
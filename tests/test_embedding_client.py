@@ -0,0 +1,141 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import embedding_client
+from app.services.embedding_client import EmbeddingClient
+from app.services.structural_encoder import StructuralEncoder
+
+
+def vectors(request: httpx.Request) -> httpx.Response:
+    texts = json.loads(request.content)["input"]
+    return httpx.Response(200, json={"embeddings": [[float(len(t))] for t in texts]})
+
+
+def make_client(handler, **options) -> EmbeddingClient:
+    client = EmbeddingClient(base_url="http://ollama", model="m", **options)
+    client._client = httpx.Client(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    client._async_client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    client._async_semaphore = asyncio.Semaphore(client.max_concurrency)
+    client._backoff = lambda attempt, deadline: 0.0
+    return client
+
+
+def failing(statuses: list[int]):
+    """Answer with the given statuses first, then with vectors."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) <= len(statuses):
+            return httpx.Response(statuses[len(calls) - 1])
+        return vectors(request)
+    return handler, calls
+
+
+def test_transient_failures_are_retried():
+    handler, calls = failing([503, 429])
+    client = make_client(handler, max_retries=3)
+    assert client.embed_batch(["a", "bb"]) == [[1.0], [2.0]]
+    assert len(calls) == 3
+    assert {k: client.stats()[k] for k in ("calls", "retries", "failures")} == {"calls": 1, "retries": 2, "failures": 0}
+
+
+def test_client_errors_are_not_retried():
+    handler, calls = failing([400])
+    client = make_client(handler, max_retries=3)
+    with pytest.raises(httpx.HTTPStatusError):
+        client.embed_batch(["a"])
+    assert len(calls) == 1
+    assert client.stats()["failures"] == 1
+
+
+def test_retries_are_bounded():
+    handler, calls = failing([502] * 10)
+    client = make_client(handler, max_retries=2)
+    with pytest.raises(httpx.HTTPStatusError):
+        client.embed_batch(["a"])
+    assert len(calls) == 3
+    assert (client.retries, client.failures) == (2, 1)
+
+
+def test_transport_errors_are_retried():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return vectors(request)
+
+    client = make_client(handler, max_retries=1)
+    assert client.embed_batch(["abc"]) == [[3.0]]
+    assert client.retries == 1
+
+
+def test_calls_in_flight_are_bounded():
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+
+    def handler(request):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.02)
+        with lock:
+            state["in_flight"] -= 1
+        return vectors(request)
+
+    client = make_client(handler, max_concurrency=2)
+    threads = [threading.Thread(target=client.embed_batch, args=(["a"],)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["peak"] == 2
+    assert client.calls == 6 and client.in_flight == 0
+
+
+def test_batch_size_adapts_to_latency():
+    client = EmbeddingClient(batch_size=64, min_batch_size=8, max_batch_size=100, target_batch_latency_ms=1000.0)
+    client._record(64, 2000.0)
+    assert client.batch_size == 32
+    client._record(32, 100.0)
+    assert client.batch_size == 40
+    # A short batch says nothing about the batch size
+    client._record(10, 100.0)
+    assert client.batch_size == 40
+    for _ in range(10):
+        client._record(client.batch_size, 100.0)
+    assert client.batch_size == 100
+    for _ in range(10):
+        client._record(client.batch_size, 5000.0)
+    assert client.batch_size == 8
+
+
+def test_async_face_retries_too():
+    handler, calls = failing([500])
+    client = make_client(handler, max_retries=1)
+    assert asyncio.run(client.aembed_batch(["ab"])) == [[2.0]]
+    assert len(calls) == 2 and client.retries == 1
+
+
+@pytest.mark.parametrize("backend, expected", [("structural", StructuralEncoder), ("ollama", EmbeddingClient)])
+def test_get_client_follows_the_backend_setting(monkeypatch, backend, expected):
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", backend)
+    monkeypatch.setattr(embedding_client, "_client", None)
+    client = embedding_client.get_client()
+    assert isinstance(client, expected)
+    assert embedding_client.get_client() is client
+
+
+def test_get_client_rejects_unknown_backends(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", "openai")
+    monkeypatch.setattr(embedding_client, "_client", None)
+    with pytest.raises(ValueError):
+        embedding_client.get_client()
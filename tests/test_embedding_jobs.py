@@ -0,0 +1,136 @@
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+from app.models.embedding_job import EmbeddingJob
+from app.services import embedding_job_service, embedding_service
+from app.services.structural_encoder import StructuralEncoder
+
+
+class FlakyClient:
+    """Structural vectors, failing on the given call numbers."""
+
+    model = "flaky"
+    cacheable = False
+    batch_size = 2
+    max_concurrency = 1
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self.texts: list[str] = []
+        self.encoder = StructuralEncoder()
+
+    def embed_batch(self, texts):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise RuntimeError("embedding backend unavailable")
+        self.texts.extend(texts)
+        return self.encoder.embed_batch(texts)
+
+
+@pytest.fixture
+def rows(add_request, add_rule):
+    requests = [add_request(f"q{i}", [f"10.0.{i}.0/24"], ["10.1.0.1"], ["443"]) for i in range(5)]
+    rules = [add_rule(f"r{i}", [f"10.0.{i}.0/24"], ["10.1.0.1"], ["443"]) for i in range(5)]
+    return requests, rules
+
+
+def use_client(monkeypatch, client):
+    monkeypatch.setattr(embedding_service, "get_client", lambda: client)
+    return client
+
+
+def unembedded(db) -> int:
+    count = db.execute(text(
+        "SELECT (SELECT count(*) FROM requests WHERE embedding IS NULL)"
+        " + (SELECT count(*) FROM physical_rules WHERE embedding IS NULL)"
+    )).scalar()
+    db.rollback()
+    return count
+
+
+def wait_for(client, job_id) -> dict:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/embeddings/jobs/{job_id}").json()
+        if job["status"] not in embedding_job_service.ACTIVE_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_commits_chunks_with_their_checkpoint(db, rows, monkeypatch):
+    backend = use_client(monkeypatch, FlakyClient())
+    job = embedding_job_service.submit_job(db, batch_size=2, commit_every=2)
+    job = embedding_job_service.run_job(job.job_id)
+    requests, rules = rows
+    assert (job.status, job.phase) == ("completed", "done")
+    assert (job.total_requests, job.total_rules, job.requests_generated, job.rules_generated) == (5, 5, 5, 5)
+    assert (job.last_request_id, job.last_rule_id) == (requests[-1], rules[-1])
+    # Three chunks per table, each one batch of at most two texts
+    assert job.batches == backend.calls == 6
+    assert unembedded(db) == 0
+
+
+def test_failed_job_resumes_after_its_last_checkpoint(client, db, rows, monkeypatch):
+    backend = use_client(monkeypatch, FlakyClient(fail_on={3}))
+    job_id = embedding_job_service.submit_job(db, batch_size=2, commit_every=2).job_id
+    failed = embedding_job_service.run_job(job_id)
+    requests, _ = rows
+    assert failed.status == "failed" and "unavailable" in failed.error
+    assert (failed.requests_generated, failed.last_request_id) == (4, requests[3])
+    assert unembedded(db) == 6
+
+    embedded_before = list(backend.texts)
+    response = client.post(f"/api/embeddings/jobs/{job_id}/resume")
+    assert response.status_code == 200, response.text
+    job = wait_for(client, job_id)
+    assert job["status"] == "completed"
+    assert (job["requests_generated"], job["rules_generated"]) == (5, 5)
+    # Only the rows after the checkpoint were embedded again
+    assert len(backend.texts) - len(embedded_before) == 6
+    assert unembedded(db) == 0
+
+    assert client.post(f"/api/embeddings/jobs/{job_id}/resume").status_code == 409
+
+
+def test_cancelled_job_stops_after_its_chunk(client, db, rows, monkeypatch):
+    use_client(monkeypatch, FlakyClient())
+    job = embedding_job_service.submit_job(db, commit_every=2)
+    assert client.post(f"/api/embeddings/jobs/{job.job_id}/cancel").json()["status"] == "cancelled"
+    assert embedding_job_service.run_job(job.job_id).status == "cancelled"
+    assert unembedded(db) == 10
+
+    job = embedding_job_service.submit_job(db, commit_every=2)
+    job.status = "running"
+    job.cancel_requested = True
+    db.commit()
+    # A running job checks for the request after each chunk; this one is already set
+    assert embedding_job_service.run_job(job.job_id).status == "cancelled"
+
+
+def test_one_runner_per_job(db, rows, monkeypatch):
+    backend = use_client(monkeypatch, FlakyClient())
+    job_id = embedding_job_service.submit_job(db).job_id
+    with engine.connect() as other:
+        other.execute(text("SELECT pg_advisory_lock(:ns, :job_id)"), {"ns": embedding_job_service._JOB_LOCK_NAMESPACE, "job_id": job_id})
+        other.commit()
+        assert embedding_job_service.run_job(job_id).status == "queued"
+        other.execute(text("SELECT pg_advisory_unlock(:ns, :job_id)"), {"ns": embedding_job_service._JOB_LOCK_NAMESPACE, "job_id": job_id})
+        other.commit()
+    assert backend.calls == 0
+    assert embedding_job_service.run_job(job_id).status == "completed"
+
+
+def test_force_reembeds_everything(db, rows, monkeypatch, embed_all):
+    embed_all()
+    backend = use_client(monkeypatch, FlakyClient())
+    db.rollback()
+    job = embedding_job_service.run_job(embedding_job_service.submit_job(db).job_id)
+    assert (job.total_requests, job.requests_skipped, job.rules_skipped, backend.calls) == (0, 5, 5, 0)
+    job = embedding_job_service.run_job(embedding_job_service.submit_job(db, force=True).job_id)
+    assert (job.requests_generated, job.rules_generated) == (5, 5)
+    assert db.query(EmbeddingJob).count() == 2
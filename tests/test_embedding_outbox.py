@@ -0,0 +1,118 @@
+import select
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services import embedding_outbox_service, embedding_service
+
+
+class FailingClient:
+    model = "failing"
+    cacheable = False
+    batch_size = 8
+    max_concurrency = 1
+
+    def embed_batch(self, texts):
+        raise RuntimeError("embedding backend unavailable")
+
+
+def entries(db) -> list:
+    rows = db.execute(text(
+        "SELECT entity_type, entity_id, attempts, last_error, available_at > now() AS backing_off"
+        " FROM embedding_outbox ORDER BY id"
+    )).all()
+    # The outbox only claims entries queued before the transaction began
+    db.rollback()
+    return rows
+
+
+def test_created_rows_are_queued_and_embedded_by_the_worker(client, db, add_request, add_rule):
+    request_id = add_request("web", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    rule_id = add_rule("web", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    assert [(e.entity_type, e.entity_id) for e in entries(db)] == [("request", request_id), ("rule", rule_id)]
+    status = client.get("/api/embeddings/status").json()
+    assert (status["outbox_pending"], status["outbox_failed"]) == (2, 0)
+    assert status["outbox_oldest_pending_seconds"] is not None
+
+    assert embedding_outbox_service.drain(db, limit=1) == {"claimed": 2, "embedded": 2, "missing": 0, "failed": 0}
+    assert entries(db) == []
+    status = client.get("/api/embeddings/status").json()
+    assert (status["requests_with_embeddings"], status["rules_with_embeddings"]) == (1, 1)
+    assert (status["outbox_pending"], status["outbox_oldest_pending_seconds"]) == (0, None)
+    short = db.execute(text("SELECT embedding_short IS NOT NULL FROM physical_rules")).scalar()
+    assert short
+
+
+def test_deleted_rows_are_dropped_from_the_outbox(db, add_request):
+    request_id = add_request("gone", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    db.execute(text("DELETE FROM requests WHERE request_id = :id"), {"id": request_id})
+    db.commit()
+    assert embedding_outbox_service.process_batch(db) == {"claimed": 1, "embedded": 0, "missing": 1, "failed": 0}
+    assert entries(db) == []
+
+
+def test_failures_back_off_until_the_entry_is_dead_lettered(client, db, monkeypatch, add_request):
+    add_request("web", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    monkeypatch.setattr(embedding_service, "get_client", lambda: FailingClient())
+    db.rollback()
+
+    assert embedding_outbox_service.drain(db)["failed"] == 1
+    (entry,) = entries(db)
+    assert (entry.attempts, entry.last_error, entry.backing_off) == (1, "embedding backend unavailable", True)
+    # Not claimed again before its backoff has elapsed
+    assert embedding_outbox_service.process_batch(db)["claimed"] == 0
+
+    for _ in range(settings.EMBEDDING_OUTBOX_MAX_ATTEMPTS - 1):
+        db.execute(text("UPDATE embedding_outbox SET available_at = now() - interval '1 second'"))
+        db.commit()
+        assert embedding_outbox_service.process_batch(db)["failed"] == 1
+    db.execute(text("UPDATE embedding_outbox SET available_at = now() - interval '1 second'"))
+    db.commit()
+    assert embedding_outbox_service.process_batch(db)["claimed"] == 0
+    status = client.get("/api/embeddings/status").json()
+    assert (status["outbox_pending"], status["outbox_failed"]) == (0, 1)
+
+    monkeypatch.undo()
+    assert client.post("/api/embeddings/outbox/retry").json() == {"requeued": 1}
+    (entry,) = entries(db)
+    assert (entry.attempts, entry.last_error) == (0, None)
+    assert embedding_outbox_service.drain(db)["embedded"] == 1
+    assert entries(db) == []
+
+
+def test_requeueing_resets_a_failed_entry(db, add_rule):
+    rule_id = add_rule("web", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    db.execute(text("UPDATE embedding_outbox SET attempts = 3, last_error = 'down', available_at = now() + interval '1 hour'"))
+    embedding_outbox_service.enqueue(db, embedding_outbox_service.ENTITY_RULE, [rule_id])
+    db.commit()
+    (entry,) = entries(db)
+    assert (entry.attempts, entry.last_error, entry.backing_off) == (0, None, False)
+
+
+def test_workers_skip_entries_claimed_by_another(db, add_request):
+    ids = [add_request(f"q{i}", [f"10.0.{i}.0/24"], ["10.1.0.1"], ["443"]) for i in range(3)]
+    other = SessionLocal()
+    try:
+        other.execute(text("SELECT 1 FROM embedding_outbox WHERE entity_id = :id FOR UPDATE"), {"id": ids[0]})
+        db.rollback()
+        assert embedding_outbox_service.process_batch(db) == {"claimed": 2, "embedded": 2, "missing": 0, "failed": 0}
+    finally:
+        other.close()
+    assert [e.entity_id for e in entries(db)] == [ids[0]]
+
+
+def test_queued_rows_notify_listeners(db, add_request):
+    listener = engine.raw_connection()
+    try:
+        conn = listener.dbapi_connection
+        conn.autocommit = True
+        conn.cursor().execute(f"LISTEN {embedding_outbox_service.OUTBOX_CHANNEL}")
+        add_request("web", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+        readable, _, _ = select.select([conn], [], [], 5)
+        assert readable
+        conn.poll()
+        assert [n.channel for n in conn.notifies][:1] == [embedding_outbox_service.OUTBOX_CHANNEL]
+    finally:
+        listener.close()
+
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.services import embedding_service
+from app.services.structural_encoder import StructuralEncoder
+
+
+class RecordingClient:
+    """Structural vectors behind the client interface, recording every call."""
+
+    model = "recording"
+
+    def __init__(self, batch_size=4, max_concurrency=2, cacheable=True, delay=0.02):
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.cacheable = cacheable
+        self.delay = delay
+        self.encoder = StructuralEncoder()
+        self.batches: list[list[str]] = []
+        self.in_flight = self.peak = 0
+        self._lock = threading.Lock()
+
+    def embed_batch(self, texts):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            self.batches.append(list(texts))
+        return self.encoder.embed_batch(texts)
+
+
+@pytest.fixture
+def recording(monkeypatch):
+    recording = RecordingClient()
+    monkeypatch.setattr(embedding_service, "get_client", lambda: recording)
+    return recording
+
+
+def texts(count):
+    return [f"rule r{i} allow sources host 10.0.0.{i} destinations host 10.1.0.1 ports 443" for i in range(count)]
+
+
+def test_embed_in_batches_keeps_the_input_order(recording):
+    batch = texts(10)
+    vectors, latencies = embedding_service.embed_in_batches(batch, batch_size=3, max_concurrency=2)
+    assert vectors == StructuralEncoder().embed_batch(batch)
+    assert sorted(map(len, recording.batches)) == [1, 3, 3, 3]
+    assert len(latencies) == 4 and all(latency > 0 for latency in latencies)
+    assert recording.peak == 2
+
+
+def test_embed_in_batches_defaults_to_the_client_settings(recording):
+    embedding_service.embed_in_batches(texts(9))
+    assert sorted(map(len, recording.batches)) == [1, 4, 4]
+    assert recording.peak <= recording.max_concurrency
+
+
+def test_embed_in_batches_without_texts(recording):
+    assert embedding_service.embed_in_batches([]) == ([], [])
+    assert recording.batches == []
+
+
+def test_generate_embeds_every_row_in_batches(recording, client, db, add_request, add_rule, monkeypatch):
+    monkeypatch.setattr(recording, "cacheable", False)
+    for i in range(5):
+        add_request(f"q{i}", [f"10.0.{i}.0/24"], ["10.1.0.1"], ["443"])
+        add_rule(f"r{i}", [f"10.0.{i}.0/24"], ["10.1.0.1"], ["443"])
+    response = client.post("/api/embeddings/generate?batch_size=2&commit_every=3")
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["requests_generated"], result["rules_generated"]) == (5, 5)
+    # Chunks of 3 and 2 rows per table, each sent as batches of at most 2 texts
+    assert result["batches"] == 6
+    assert sorted(map(len, recording.batches)) == [1, 1, 2, 2, 2, 2]
+    assert result["batch_latency_ms_avg"] > 0
+    assert db.execute(text("SELECT count(*) FROM requests WHERE embedding IS NULL")).scalar() == 0
+    assert db.execute(text("SELECT count(*) FROM physical_rules WHERE embedding IS NULL")).scalar() == 0
+
+    again = client.post("/api/embeddings/generate").json()
+    assert (again["requests_generated"], again["requests_skipped"], again["rules_skipped"]) == (0, 5, 5)
+
+
+def test_cache_embeds_each_distinct_text_once(recording, db):
+    batch = texts(3) + texts(2)
+    stats: dict = {}
+    vectors = embedding_service.embed_batch(batch, db, stats)
+    assert vectors == StructuralEncoder().embed_batch(batch)
+    assert recording.batches == [texts(3)]
+    assert stats == {"cache_hits": 0, "cache_misses": 3, "duplicates": 2}
+    db.commit()
+
+    stats = {}
+    assert embedding_service.embed_batch(texts(4), db, stats) == StructuralEncoder().embed_batch(texts(4))
+    assert recording.batches == [texts(3), texts(4)[3:]]
+    assert stats == {"cache_hits": 3, "cache_misses": 1, "duplicates": 0}
+    rows = db.execute(text("SELECT model, count(*) FROM embedding_cache GROUP BY model")).all()
+    assert rows == [("recording", 4)]
+
+
+def test_cache_is_keyed_by_model(recording, db, monkeypatch):
+    embedding_service.embed_batch(texts(2), db)
+    monkeypatch.setattr(recording, "model", "other")
+    stats: dict = {}
+    embedding_service.embed_batch(texts(2), db, stats)
+    assert stats["cache_misses"] == 2
+    assert len(recording.batches) == 2
+
+
+def test_uncacheable_backends_bypass_the_cache(recording, db, monkeypatch):
+    monkeypatch.setattr(recording, "cacheable", False)
+    stats: dict = {}
+    embedding_service.embed_batch(texts(2) + texts(2), db, stats)
+    assert stats == {}
+    assert db.execute(text("SELECT count(*) FROM embedding_cache")).scalar() == 0
+
+
+def test_cached_vectors_skip_batched_embedding(recording, db):
+    embedding_service.embed_batch(texts(5), db)
+    stats: dict = {}
+    vectors, latencies = embedding_service.embed_in_batches(texts(6), batch_size=2, db=db, stats=stats)
+    assert vectors == StructuralEncoder().embed_batch(texts(6))
+    assert recording.batches[1:] == [texts(6)[5:]]
+    assert len(latencies) == 1
+    assert (stats["cache_hits"], stats["cache_misses"]) == (5, 1)
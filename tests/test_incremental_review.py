@@ -0,0 +1,65 @@
+from sqlalchemy import text
+
+# High enough that only exact matches count, so every other pair leaves a deficiency with a best match
+THRESHOLD = 0.99
+
+
+def rule(name, sources, destinations, ports):
+    return {"rule_name": name, "sources": sources, "destinations": destinations, "ports": ports}
+
+
+WEB = rule("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+DNS = rule("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+SSH = rule("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["22"])
+
+
+def semantic_rows(db):
+    return sorted(db.execute(text("""
+        SELECT type, rule_id, request_id, best_match_rule_id, best_match_request_id, round(similarity_score::numeric, 4)
+        FROM semantic_deficiencies
+    """)).all(), key=repr)
+
+
+def test_incremental_semantic_review_after_sync_deletes_rules(client, db, add_request, sync_rules, embed_all):
+    add_request("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    dns_like = add_request("dns-ish", ["10.0.0.0/24"], ["10.2.0.53"], ["53", "853"])
+    sync_rules("fw-1", [WEB, DNS, SSH])
+    embed_all()
+    response = client.post(f"/api/review/run-semantic?threshold={THRESHOLD}")
+    assert response.status_code == 200, response.text
+
+    ids = dict(db.execute(text("SELECT rule_name, rule_id FROM physical_rules")).all())
+    best = db.execute(text("SELECT best_match_rule_id FROM semantic_deficiencies WHERE request_id = :id"), {"id": dns_like}).scalar()
+    assert best == ids["dns"]
+    assert db.execute(text("SELECT count(*) FROM semantic_deficiencies WHERE rule_id = :id"), {"id": ids["ssh"]}).scalar() == 1
+
+    # dns was the best match of a request and ssh has its own deficiency row
+    assert sync_rules("fw-1", [WEB])["deleted"] == 2
+    db.expire_all()
+    response = client.post(f"/api/review/run-semantic-incremental?threshold={THRESHOLD}")
+    assert response.status_code == 200, response.text
+    incremental = semantic_rows(db)
+
+    assert ids["ssh"] not in [r.rule_id for r in incremental]
+    assert all(r.rule_id is not None for r in incremental if r.type == "no_matching_request")
+    assert all(r.best_match_rule_id is not None for r in incremental if r.type == "no_matching_rule")
+    client.post(f"/api/review/run-semantic?threshold={THRESHOLD}")
+    assert incremental == semantic_rows(db)
+
+
+def test_incremental_semantic_review_after_sync_updates_rules(client, db, add_request, sync_rules, embed_all):
+    add_request("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+    add_request("ssh-ish", ["192.168.7.0/24"], ["10.3.0.22"], ["2222"])
+    sync_rules("fw-1", [WEB, DNS, SSH])
+    embed_all()
+    client.post(f"/api/review/run-semantic?threshold={THRESHOLD}")
+
+    # dns drifts away from its request, ssh now matches its request exactly
+    sync_rules("fw-1", [WEB, {**DNS, "ports": ["5353"]}, {**SSH, "ports": ["2222"]}])
+    embed_all()
+    run = client.post(f"/api/review/run-semantic-incremental?threshold={THRESHOLD}").json()
+    assert run["mode"] == "incremental"
+    incremental = semantic_rows(db)
+
+    client.post(f"/api/review/run-semantic?threshold={THRESHOLD}")
+    assert incremental == semantic_rows(db)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from sqlalchemy import select, text
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.services import local_ann_index
+
+
+def rule(name, sources, destinations, ports):
+    return {"rule_name": name, "sources": sources, "destinations": destinations, "ports": ports}
+
+
+WEB = rule("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+DNS = rule("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+SSH = rule("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["22"])
+NTP = rule("ntp", ["10.0.0.0/24"], ["10.4.0.123"], ["123"])
+
+
+@pytest.fixture
+def local_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_ANN_DIR", str(tmp_path))
+    # Every list is probed, so a local search is exact
+    monkeypatch.setattr(settings, "LOCAL_ANN_PROBES", 1000)
+    return tmp_path
+
+
+def embedded(db) -> dict[int, np.ndarray]:
+    rows = db.execute(select(PhysicalRule.rule_id, PhysicalRule.embedding).where(PhysicalRule.embedding.isnot(None)))
+    vectors = {rule_id: np.asarray(embedding, np.float32) for rule_id, embedding in rows}
+    # The outbox only claims entries queued before the transaction began
+    db.rollback()
+    return vectors
+
+
+def assert_matches_table(db, index):
+    current = embedded(db)
+    state = index.refresh()
+    indexed = state.snapshot.ids[state.alive].tolist() + state.delta_ids.tolist()
+    assert sorted(indexed) == sorted(current)
+    for rule_id, vector in current.items():
+        hits = index.search(vector, len(current))
+        assert [row_id for row_id, _ in hits][:1] == [rule_id]
+        assert hits[0][1] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_refresh_applies_changes_since_the_build(db, local_dir, sync_rules, embed_all):
+    sync_rules("fw-1", [WEB, DNS, SSH])
+    embed_all()
+    local_ann_index.build(db, PhysicalRule)
+    index = local_ann_index.LocalIndex(PhysicalRule)
+    assert index.stats()["generation"] is None
+    assert_matches_table(db, index)
+    assert index.stats()["delta"] == 0
+
+    # ssh is deleted, dns re-embedded, ntp new
+    sync_rules("fw-1", [WEB, {**DNS, "ports": ["5353"]}, NTP])
+    embed_all()
+    assert_matches_table(db, index)
+    assert index.stats() == {"table": "physical_rules", "generation": 1, "rows": 3, "alive": 1, "delta": 2}
+
+    # A cleared embedding leaves a tombstone
+    db.execute(text("UPDATE physical_rules SET embedding = NULL WHERE rule_name = 'ntp'"))
+    db.commit()
+    assert_matches_table(db, index)
+    assert index.stats()["delta"] == 1
+
+
+def test_rebuild_folds_the_delta_and_prunes_tombstones(db, local_dir, sync_rules, embed_all):
+    sync_rules("fw-1", [WEB, DNS, SSH])
+    embed_all()
+    local_ann_index.build(db, PhysicalRule)
+    sync_rules("fw-1", [WEB, DNS])
+    embed_all()
+    local_ann_index.build(db, PhysicalRule)
+    local_ann_index.build(db, PhysicalRule)
+    assert db.execute(text("SELECT count(*) FROM embedding_tombstones")).scalar() == 0
+
+    index = local_ann_index.LocalIndex(PhysicalRule)
+    assert_matches_table(db, index)
+    assert index.stats() == {"table": "physical_rules", "generation": 3, "rows": 2, "alive": 2, "delta": 0}
+
+
+def test_due_refresh_runs_in_the_background(db, local_dir, monkeypatch, sync_rules, embed_all):
+    sync_rules("fw-1", [WEB])
+    embed_all()
+    local_ann_index.build(db, PhysicalRule)
+    index = local_ann_index.LocalIndex(PhysicalRule)
+    loaded = index.current()
+    sync_rules("fw-1", [WEB, DNS])
+    embed_all()
+
+    monkeypatch.setattr(settings, "LOCAL_ANN_REFRESH_SECONDS", 0.0)
+    assert index.current() is loaded
+    # Released by the background thread once it is done
+    with index._refreshing:
+        pass
+    assert index.stats()["delta"] == 1
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import select, text
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import vector_search
+
+LIMIT = 5
+
+
+@pytest.fixture
+def embedded(db, sync_rules, add_request, embed_all):
+    sync_rules("fw-1", [
+        {"rule_name": f"r{i}", "sources": [f"10.{i % 5}.{i}.0/24"], "destinations": [f"10.1.0.{i % 30}"],
+         "ports": [str(1000 + i % 11)]}
+        for i in range(120)
+    ])
+    request_ids = [
+        add_request(f"q{i}", [f"10.{i % 5}.{3 * i}.0/24"], [f"10.1.0.{i}"], [str(1000 + i)]) for i in range(8)
+    ]
+    # One request without an embedding
+    request_ids.append(add_request("unembedded", ["10.9.0.0/24"], ["10.1.0.1"], ["22"]))
+    embed_all()
+    db.execute(text("UPDATE requests SET embedding = NULL, embedding_short = NULL WHERE name = 'unembedded'"))
+    db.commit()
+    return request_ids
+
+
+@pytest.mark.parametrize("mode", vector_search.SEARCH_MODES)
+def test_nearest_batch_matches_nearest(db, embedded, mode):
+    rows = vector_search.nearest_batch(db, Request, PhysicalRule, embedded, LIMIT, mode, columns=(PhysicalRule.rule_name,))
+    batched: dict[int, list] = {}
+    for query_id, rule_id, distance, rule_name in rows:
+        batched.setdefault(query_id, []).append((rule_id, distance, rule_name))
+    db.rollback()
+
+    single_mode = vector_search.LOCAL_FALLBACK_MODE if mode == "local" else mode
+    embeddings = dict(db.execute(select(Request.request_id, Request.embedding).where(Request.request_id.in_(embedded))).all())
+    assert set(batched) == {request_id for request_id, embedding in embeddings.items() if embedding is not None}
+    for request_id, hits in batched.items():
+        expected = vector_search.nearest(db, PhysicalRule, list(embeddings[request_id]), LIMIT, single_mode)
+        db.rollback()
+        assert [distance for _, distance, _ in hits] == pytest.approx([distance for _, distance in expected], abs=1e-6)
+        # Ties may come back in either order
+        assert {rule_id for rule_id, _, _ in hits} == {rule.rule_id for rule, _ in expected}
+        assert {name for _, _, name in hits} == {rule.rule_name for rule, _ in expected}
+
+
+def test_nearest_batch_tunes_the_index_scan(db, embedded, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_EF_SEARCH", 123)
+    vector_search.nearest_batch(db, Request, PhysicalRule, embedded, LIMIT, "halfvec")
+    assert db.scalar(text("SHOW hnsw.ef_search")) == "123"
+    assert db.scalar(text("SHOW hnsw.iterative_scan")) == "relaxed_order"
+    db.rollback()
+    assert db.scalar(text("SHOW hnsw.ef_search")) == "40"
+
+
+def test_nearest_batch_without_ids(db):
+    assert vector_search.nearest_batch(db, Request, PhysicalRule, [], LIMIT) == []
@@ -0,0 +1,92 @@
+import pytest
+
+from app.models.deficiency import Deficiency
+from app.models.semantic_deficiency import SemanticDeficiency
+from app.services.pagination import NEXT_CURSOR_HEADER
+
+
+def read_all(client, url: str, key: str, cursor_param: str) -> list[list[int]]:
+    """Follow X-Next-Cursor from the first page to the last; returns the ids of every page."""
+    pages = []
+    response = client.get(url)
+    while True:
+        assert response.status_code == 200, response.text
+        pages.append([row[key] for row in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+        assert int(cursor) == pages[-1][-1]
+        response = client.get(f"{url}&{cursor_param}={cursor}")
+
+
+@pytest.mark.parametrize("count, limit, expected", [
+    (5, 2, [[1, 2], [3, 4], [5]]),
+    (4, 2, [[1, 2], [3, 4]]),  # a full last page has no cursor
+    (2, 5, [[1, 2]]),
+    (0, 3, [[]]),
+])
+def test_request_pages(client, add_request, count, limit, expected):
+    for i in range(count):
+        add_request(f"request-{i}", ["10.0.0.1"], ["10.0.1.1"], ["443"])
+    assert read_all(client, f"/api/requests?limit={limit}", "request_id", "since_request_id") == expected
+
+
+def test_request_page_after_last_key_is_empty(client, add_request):
+    add_request("only", ["10.0.0.1"], ["10.0.1.1"], ["443"])
+    response = client.get("/api/requests?since_request_id=1")
+    assert response.json() == []
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_rule_pages_filtered_by_device(client, add_rule):
+    for i in range(5):
+        add_rule(f"rule-{i}", ["10.0.0.1"], ["10.0.1.1"], ["443"], firewall_device="fw-a" if i % 2 else "fw-b")
+    first = client.get("/api/physical-rules?firewall_device=fw-b&limit=2")
+    assert [r["rule_id"] for r in first.json()] == [1, 3]
+    assert first.headers[NEXT_CURSOR_HEADER] == "3"
+    last = client.get("/api/physical-rules?firewall_device=fw-b&limit=2&since_rule_id=3")
+    assert [r["rule_id"] for r in last.json()] == [5]
+    assert NEXT_CURSOR_HEADER not in last.headers
+
+
+def test_deficiency_pages_filtered_by_type(client, db):
+    db.add_all([
+        Deficiency(type="no_matching_request" if i % 2 else "no_matching_rule") for i in range(6)
+    ])
+    db.commit()
+    ids = [d.deficiency_id for d in db.query(Deficiency).filter(Deficiency.type == "no_matching_request")]
+    first = client.get("/api/deficiencies?type=no_matching_request&limit=2")
+    assert [d["deficiency_id"] for d in first.json()] == ids[:2]
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+    second = client.get(f"/api/deficiencies?type=no_matching_request&limit=2&since_deficiency_id={cursor}")
+    assert [d["deficiency_id"] for d in second.json()] == ids[2:]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+
+@pytest.fixture
+def semantic_deficiencies(db):
+    scores = [0.2, None, 0.5, 0.65, 0.8]
+    db.add_all([
+        SemanticDeficiency(type="no_matching_rule", similarity_score=score, threshold_used=0.9) for score in scores
+    ])
+    db.commit()
+    return [d.id for d in db.query(SemanticDeficiency).order_by(SemanticDeficiency.id)]
+
+
+def test_semantic_deficiencies_newest_first_by_default(client, semantic_deficiencies):
+    ids = semantic_deficiencies
+    assert read_all(client, "/api/semantic-deficiencies?limit=2", "id", "since_id") == [ids[:2:-1], ids[2:0:-1], ids[:1]]
+
+
+def test_semantic_deficiencies_oldest_first(client, semantic_deficiencies):
+    ids = semantic_deficiencies
+    assert read_all(client, "/api/semantic-deficiencies?order=asc&limit=3", "id", "since_id") == [ids[:3], ids[3:]]
+
+
+def test_semantic_deficiencies_score_range_is_inclusive(client, semantic_deficiencies):
+    response = client.get("/api/semantic-deficiencies?min_score=0.5&max_score=0.8&order=asc")
+    assert [d["similarity_score"] for d in response.json()] == [0.5, 0.65, 0.8]
+
+
+def test_semantic_deficiencies_rejects_unknown_order(client):
+    assert client.get("/api/semantic-deficiencies?order=sideways").status_code == 422
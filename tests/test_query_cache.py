@@ -0,0 +1,87 @@
+import pytest
+
+from app.services import embedding_service, query_cache
+from app.services.query_cache import QueryEmbeddingCache, normalize_query
+from app.services.structural_encoder import StructuralEncoder
+
+
+class CountingEncoder(StructuralEncoder):
+    def __init__(self):
+        super().__init__()
+        self.texts: list[str] = []
+
+    def embed_batch(self, texts):
+        self.texts.extend(texts)
+        return super().embed_batch(texts)
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    encoder = CountingEncoder()
+    monkeypatch.setattr(embedding_service, "get_client", lambda: encoder)
+    # The worker's cache instance, as the search router holds it
+    cache = query_cache.query_cache
+    cache.clear()
+    for counter in ("hits", "misses", "evictions", "expirations"):
+        monkeypatch.setattr(cache, counter, 0)
+    yield encoder
+    cache.clear()
+
+
+def test_queries_are_normalized():
+    assert normalize_query("  Allow 10.0.0.1\n to   10.1.0.1 ") == "allow 10.0.0.1 to 10.1.0.1"
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60)
+    cache.put(("m", "a"), [1.0])
+    cache.put(("m", "b"), [2.0])
+    assert cache.get(("m", "a")) == [1.0]
+    cache.put(("m", "c"), [3.0])
+    assert cache.get(("m", "b")) is None
+    assert cache.get(("m", "a")) == [1.0] and cache.get(("m", "c")) == [3.0]
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 3, 1, 1)
+    assert stats["hit_rate"] == 0.75
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=10)
+    cache.put(("m", "a"), [0.5, 0.25])
+    now[0] += 10
+    assert cache.get(("m", "a")) == [0.5, 0.25]
+    now[0] += 1
+    assert cache.get(("m", "a")) is None
+    assert (cache.stats()["expirations"], cache.stats()["entries"]) == (1, 0)
+
+
+def test_vectors_are_stored_as_float32():
+    cache = QueryEmbeddingCache(max_entries=1, ttl_seconds=60)
+    cache.put(("m", "a"), [0.1, 1 / 3])
+    assert cache.get(("m", "a")) == pytest.approx([0.1, 1 / 3], rel=1e-6)
+    assert cache.stats()["memory_bytes"] > 0
+
+
+def test_repeated_queries_are_embedded_once(db, encoder):
+    first = query_cache.embed_query("allow 10.0.0.0/24 to 10.1.0.1 on port 443", db)
+    again = query_cache.embed_query("  ALLOW 10.0.0.0/24 to 10.1.0.1   on port 443", db)
+    assert again == pytest.approx(first, abs=1e-7)
+    assert encoder.texts == ["allow 10.0.0.0/24 to 10.1.0.1 on port 443"]
+
+
+def test_cache_is_keyed_by_model(db, encoder, monkeypatch):
+    query_cache.embed_query("web servers", db)
+    monkeypatch.setattr(encoder, "model", "another-model")
+    query_cache.embed_query("web servers", db)
+    assert len(encoder.texts) == 2
+
+
+def test_search_endpoint_reports_cache_hits(client, encoder):
+    body = {"query": "allow 10.0.0.0/24 to 10.1.0.1 on port 443", "search_in": "rules", "threshold": 0.0}
+    for _ in range(3):
+        assert client.post("/api/semantic-search/by-text", json=body).status_code == 200
+    stats = client.get("/api/semantic-search/query-cache").json()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+    assert len(encoder.texts) == 1
@@ -0,0 +1,130 @@
+import itertools
+import json
+
+import pytest
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services import review_service
+
+
+@pytest.fixture
+def reviewed(add_request, add_rule, embed_all):
+    add_request("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    add_request("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53", "853"])
+    add_request("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["2222"])
+    add_rule("web", ["10.0.0.0-10.0.0.255"], ["10.1.0.10"], ["tcp/443"])
+    add_rule("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+    add_rule("ntp", ["10.0.0.0/24"], ["10.4.0.123"], ["123"])
+    embed_all()
+
+
+def stored(db, table, pk, *columns):
+    rows = db.execute(text(f"SELECT {pk}, {', '.join(columns)} FROM {table} ORDER BY {pk}")).all()
+    db.rollback()
+    return [tuple(row) for row in rows]
+
+
+def last_run(db, review_type):
+    run = db.execute(text(
+        "SELECT deficiencies_added, deficiencies_retired, deficiency_count FROM review_runs"
+        " WHERE review_type = :t ORDER BY run_id DESC LIMIT 1"
+    ), {"t": review_type}).one()
+    db.rollback()
+    return tuple(run)
+
+
+def test_review_replaces_the_deficiencies_with_its_own(client, db, reviewed):
+    first = client.post("/api/review/run").json()
+    assert first["summary"]["matched_count"] == 1
+    second = client.post("/api/review/run").json()
+
+    items = [(d["deficiency_id"], "no_matching_request", d["rule_id"], None) for d in second["unmatched_physical_rules"]]
+    items += [(d["deficiency_id"], "no_matching_rule", None, d["request_id"]) for d in second["unmatched_requests"]]
+    # The IDs handed back are those of the stored rows, and only the last run's rows are left
+    assert stored(db, "deficiencies", "deficiency_id", "type", "rule_id", "request_id") == sorted(items)
+    assert {d["deficiency_id"] for d in first["unmatched_requests"]}.isdisjoint(i[0] for i in items)
+    assert last_run(db, "exact") == (4, 4, 4)
+
+
+def test_sql_review_retires_the_previous_deficiencies(client, db, reviewed):
+    client.post("/api/review/run")
+    expected = stored(db, "deficiencies", "type", "rule_id", "request_id")
+    result = client.post("/api/review/run-sql")
+    assert result.status_code == 200, result.text
+    assert result.json()["summary"]["unmatched_rules_count"] == 2
+    assert sorted(stored(db, "deficiencies", "type", "rule_id", "request_id")) == sorted(expected)
+    assert last_run(db, "exact") == (4, 4, 4)
+
+
+def test_semantic_review_replaces_deficiencies_and_matches(client, db, reviewed):
+    client.post("/api/review/run-semantic?threshold=0.99")
+    result = client.post("/api/review/run-semantic?threshold=0.99").json()
+
+    rules = [(d["semantic_deficiency_id"], d["rule_id"], d["best_match_request_id"]) for d in result["unmatched_physical_rules"]]
+    requests = [(d["semantic_deficiency_id"], d["request_id"], d["best_match_rule_id"]) for d in result["unmatched_requests"]]
+    deficiencies = stored(db, "semantic_deficiencies", "id", "rule_id", "request_id")
+    assert deficiencies == sorted([(i, rule, None) for i, rule, _ in rules] + [(i, None, request) for i, request, _ in requests])
+    matches = sorted((m["rule_id"], m["request_id"]) for m in result["matched"])
+    assert stored(db, "semantic_matches", "rule_id", "request_id") == matches
+    added, retired, count = last_run(db, "semantic")
+    assert added == retired == count == len(deficiencies)
+
+
+def ndjson_records(client, path):
+    response = client.post(path)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.parametrize("path, keys", [
+    ("/api/review/run", ("matched", "unmatched_physical_rules", "unmatched_requests")),
+    ("/api/review/run-semantic?threshold=0.99", ("matched", "unmatched_physical_rules", "unmatched_requests")),
+    ("/api/review/run-coverage?include_covered=true", ("requests", "physical_rules")),
+])
+def test_ndjson_streams_the_json_result_with_the_summary_last(client, monkeypatch, reviewed, path, keys):
+    monkeypatch.setattr(settings, "REVIEW_STREAM_BATCH_SIZE", 1)
+    document = client.post(path).json()
+    records = ndjson_records(client, path + ("&" if "?" in path else "?") + "format=ndjson")
+
+    assert [r["record"] for r in records].count("summary") == 1
+    summary = {k: v for k, v in records[-1].items() if k != "elapsed_ms"}
+    assert summary == {"record": "summary", **{k: v for k, v in document["summary"].items() if k != "elapsed_ms"}}
+
+    def without_ids(items):
+        drop = ("record", "deficiency_id", "semantic_deficiency_id")
+        return sorted(json.dumps({k: v for k, v in item.items() if k not in drop}, sort_keys=True) for item in items)
+
+    streamed = without_ids(records[:-1])
+    assert streamed == without_ids(item for key in keys for item in document[key])
+
+
+def test_streamed_deficiency_ids_are_the_stored_ones(client, db, monkeypatch, reviewed):
+    monkeypatch.setattr(settings, "REVIEW_STREAM_BATCH_SIZE", 1)
+    records = ndjson_records(client, "/api/review/run?format=ndjson")
+    streamed = sorted(
+        (r["deficiency_id"], r.get("rule_id"), r.get("request_id")) for r in records if "deficiency_id" in r
+    )
+    assert stored(db, "deficiencies", "deficiency_id", "rule_id", "request_id") == streamed
+
+
+def test_a_consumer_that_stops_early_leaves_the_previous_results(client, db, reviewed):
+    client.post("/api/review/run")
+    expected = stored(db, "deficiencies", "deficiency_id", "type", "rule_id", "request_id")
+    runs = stored(db, "review_runs", "run_id", "review_type")
+
+    session = SessionLocal()
+    try:
+        records = review_service.iter_review(session, batch_size=1)
+        assert [kind for kind, _ in itertools.islice(records, 2)] == ["matched", "unmatched_rule"]
+        records.close()
+    finally:
+        session.close()
+    assert stored(db, "deficiencies", "deficiency_id", "type", "rule_id", "request_id") == expected
+    assert stored(db, "review_runs", "run_id", "review_type") == runs
+
+
+def test_unknown_format_is_rejected(client):
+    assert client.post("/api/review/run?format=csv").status_code == 422
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+from sqlalchemy import select
+
+from app.models.physical_rule import PhysicalRule
+from app.services import rule_import_service
+from app.services.rule_import_service import RuleImportError
+
+CSV = """Rule,Device,Action,Src,Dst,Port
+web,fw-1,allow,10.0.0.0/24;10.0.1.5,any,443
+dns,fw-1,ALLOW,any,10.2.0.53,udp/53 tcp/53
+range,fw-2,deny,10.0.0.1-10.0.0.9,*,any
+named,fw-1,allow,web-servers,10.1.0.1,443
+bad,fw-1,allow,10.0.0.300,10.1.0.1,443
+"""
+
+
+@pytest.mark.parametrize("address", ["any", "ALL", "*", "0.0.0.0/0", "10.0.0.1", "10.0.0.0/24", "10.0.0.1-10.0.0.9"])
+def test_map_record_accepts_every_parsed_notation(address):
+    rule = rule_import_service.map_record({"name": "r", "src": address, "dst": "10.1.0.1", "port": "443"}, "fw-1")
+    assert rule.sources == [address]
+    assert rule.firewall_device == "fw-1"
+
+
+@pytest.mark.parametrize("address", ["10.0.0.300", "10.0.0.0/33", "10.0.0.9-10.0.0.1", "web-servers"])
+def test_map_record_rejects_unparsed_addresses(address):
+    with pytest.raises(RuleImportError, match="invalid address"):
+        rule_import_service.map_record({"name": "r", "src": "10.0.0.1", "dst": address}, "fw-1")
+
+
+def test_map_record_requires_name_device_and_addresses():
+    with pytest.raises(RuleImportError, match="rule_name"):
+        rule_import_service.map_record({"src": "any", "dst": "any"}, "fw-1")
+    with pytest.raises(RuleImportError, match="firewall_device"):
+        rule_import_service.map_record({"name": "r", "src": "any", "dst": "any"})
+    with pytest.raises(RuleImportError, match="source"):
+        rule_import_service.map_record({"name": "r", "dst": "any"}, "fw-1")
+
+
+def test_iter_records_reports_bad_json_lines():
+    stream = io.StringIO('{"name": "a"}\n\nnot json\n[1]\n')
+    records = list(rule_import_service.iter_records(stream, "jsonl"))
+    assert records[0] == {"name": "a"}
+    assert [type(r) for r in records[1:]] == [RuleImportError, RuleImportError]
+
+
+def test_csv_import_skips_and_reports_invalid_rows(client, db):
+    response = client.post("/api/physical-rules/import", content=CSV, headers={"content-type": "text/csv"})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["rows_read"], result["rows_imported"], result["rows_rejected"]) == (5, 3, 2)
+    assert result["errors"] == ["Row 4: invalid address: 'web-servers'", "Row 5: invalid address: '10.0.0.300'"]
+    rules = {rule.rule_name: rule for rule in db.scalars(select(PhysicalRule))}
+    assert sorted(rules) == ["dns", "range", "web"]
+    assert sorted(a.address for a in rules["web"].sources) == ["10.0.0.0/24", "10.0.1.5"]
+    assert [a.address for a in rules["dns"].sources] == ["any"]
+    assert rules["dns"].ports == ["udp/53", "tcp/53"] and rules["dns"].action == "allow"
+    assert rules["range"].firewall_device == "fw-2" and rules["range"].ports == ["any"]
+
+
+def test_strict_jsonl_import_aborts_on_the_first_invalid_row(client, db):
+    body = (
+        '{"name": "a", "src": ["any"], "dst": "10.1.0.1", "port": 443}\n'
+        '{"name": "b", "src": ["db-servers"], "dst": "10.1.0.1", "port": 443}\n'
+    )
+    response = client.post(
+        "/api/physical-rules/import?format=jsonl&firewall_device=fw-1&strict=true", content=body,
+    )
+    assert response.status_code == 422
+    assert "Row 2: invalid address" in response.json()["detail"]
+    assert db.scalars(select(PhysicalRule)).all() == []
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+from sqlalchemy import select, text
+
+from app.models.physical_rule import PhysicalRule
+from app.services import bulk_ingest_service
+
+
+def rule(name, sources, destinations, ports, action="allow"):
+    return {"rule_name": name, "sources": sources, "destinations": destinations, "ports": ports, "action": action}
+
+
+WEB = rule("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+DNS = rule("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+SSH = rule("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["22"])
+
+
+def changes(client, sync_id):
+    response = client.get(f"/api/rule-syncs/changes?sync_id={sync_id}")
+    assert response.status_code == 200, response.text
+    return sorted((c["rule_name"], c["change_type"]) for c in response.json())
+
+
+def stored(db):
+    rules = {r.rule_name: r for r in db.scalars(select(PhysicalRule))}
+    return {
+        name: (r.action, r.ports, sorted(a.address for a in r.sources), sorted(a.address for a in r.destinations))
+        for name, r in rules.items()
+    }
+
+
+@pytest.mark.parametrize("a, b", [
+    (["10.0.0.0/24"], ["10.0.0.0-10.0.0.255"]),
+    (["10.0.0.0/25", "10.0.0.128/25"], ["10.0.0.0/24"]),
+    (["10.0.1.1", "10.0.0.0/24"], ["10.0.0.0/24", "10.0.1.1"]),
+])
+def test_content_hash_ignores_notation(a, b):
+    assert bulk_ingest_service.rule_content_hash("allow", a, ["any"], ["443"]) == bulk_ingest_service.rule_content_hash(
+        "ALLOW", b, ["0.0.0.0/0"], ["tcp/443"]
+    )
+
+
+def test_content_hash_sees_changes():
+    base = bulk_ingest_service.rule_content_hash("allow", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    assert base != bulk_ingest_service.rule_content_hash("deny", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    assert base != bulk_ingest_service.rule_content_hash("allow", ["10.1.0.1"], ["10.0.0.0/24"], ["443"])
+    assert base != bulk_ingest_service.rule_content_hash("allow", ["10.0.0.0/24"], ["10.1.0.1"], ["443", "80"])
+
+
+def test_sync_inserts_updates_and_deletes(client, db, sync_rules, embed_all):
+    first = sync_rules("fw-1", [WEB, DNS, SSH])
+    assert (first["inserted"], first["updated"], first["deleted"], first["unchanged"]) == (3, 0, 0, 0)
+    assert changes(client, first["sync_id"]) == [("dns", "insert"), ("ssh", "insert"), ("web", "insert")]
+    embed_all()
+    web_id = db.scalar(select(PhysicalRule.rule_id).where(PhysicalRule.rule_name == "web"))
+    db.rollback()
+
+    # web in another notation, dns changed, ssh gone, ntp new
+    second = sync_rules("fw-1", [
+        {**WEB, "sources": ["10.0.0.0-10.0.0.255"], "ports": ["tcp/443"]},
+        {**DNS, "ports": ["53", "853"]},
+        rule("ntp", ["10.0.0.0/24"], ["10.4.0.123"], ["123"]),
+    ])
+    assert (second["inserted"], second["updated"], second["deleted"], second["unchanged"]) == (1, 1, 1, 1)
+    assert changes(client, second["sync_id"]) == [("dns", "update"), ("ntp", "insert"), ("ssh", "delete")]
+
+    assert stored(db) == {
+        "web": ("allow", ["443"], ["10.0.0.0/24"], ["10.1.0.10"]),
+        "dns": ("allow", ["53", "853"], ["10.0.0.0/24"], ["10.2.0.53"]),
+        "ntp": ("allow", ["123"], ["10.0.0.0/24"], ["10.4.0.123"]),
+    }
+    embedded = dict(db.execute(text("SELECT rule_name, embedding IS NOT NULL FROM physical_rules")).all())
+    assert embedded == {"web": True, "dns": False, "ntp": False}
+    queued = db.execute(text("SELECT entity_id FROM embedding_outbox WHERE entity_type = 'rule'")).scalars().all()
+    assert web_id not in queued and len(queued) == 2
+
+
+def test_sync_leaves_other_devices_alone(client, db, sync_rules):
+    sync_rules("fw-1", [WEB])
+    sync_rules("fw-2", [DNS])
+    result = sync_rules("fw-1", [])
+    assert (result["deleted"], result["firewall_devices"]) == (1, ["fw-1"])
+    assert list(stored(db)) == ["dns"]
+
+
+def test_sync_backfills_missing_hashes(client, db, add_rule, sync_rules):
+    add_rule("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    db.execute(text("UPDATE physical_rules SET content_hash = NULL"))
+    db.commit()
+    result = sync_rules("fw-1", [WEB])
+    assert (result["updated"], result["unchanged"]) == (0, 1)
+
+
+def test_sync_rejects_values_postgres_cannot_store(client, db, sync_rules):
+    sync_rules("fw-1", [WEB])
+    body = json.dumps(rule("bad\u0000name", ["10.0.0.1"], ["10.1.0.1"], ["443"])) + "\n"
+    response = client.post(
+        "/api/rule-syncs?format=jsonl&firewall_device=fw-1", content=body, headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422, response.text
+    assert "Rows 1-1" in response.json()["detail"]
+    assert list(stored(db)) == ["web"]
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import select
+
+from app.models.physical_rule import PhysicalRule
+from app.models.request import Request
+from app.services import vector_search
+
+RULE_PORTS = {
+    "any": ["any"],
+    "well-known": ["1-1024"],
+    "tcp": ["tcp/443"],
+    "https": ["443"],
+    "alt": ["8443", "8000-9000"],
+    "named": ["http"],
+}
+
+
+@pytest.fixture
+def rules(add_rule, embed_all):
+    ids = {
+        name: add_rule(
+            name, ["10.0.0.0/24"], ["10.1.0.10"], ports,
+            action="deny" if name in ("tcp", "alt") else "allow",
+            firewall_device="fw-edge" if name in ("any", "alt") else "fw-core",
+        )
+        for name, ports in RULE_PORTS.items()
+    }
+    embed_all()
+    return ids
+
+
+def matching(db, model, filters) -> set[int]:
+    pk = model.__mapper__.primary_key[0]
+    return set(db.scalars(select(pk).where(*filters)))
+
+
+@pytest.mark.parametrize("port, expected", [
+    ("443", {"any", "well-known", "tcp", "https"}),
+    ("tcp/443", {"any", "well-known", "tcp", "https"}),
+    ("8080", {"any", "alt"}),
+    ("8000-8080", {"any", "alt"}),
+    ("1000-2000", {"any"}),
+    ("any", {"any"}),
+])
+def test_rule_port_filter_is_range_containment(db, rules, port, expected):
+    assert matching(db, PhysicalRule, vector_search.rule_filters(port=port)) == {rules[n] for n in expected}
+
+
+def test_rule_filters_combine(db, rules):
+    filters = vector_search.rule_filters(firewall_device="fw-core", action="deny", port="443")
+    assert matching(db, PhysicalRule, filters) == {rules["tcp"]}
+
+
+def test_unparseable_port_filter_is_rejected():
+    with pytest.raises(ValueError):
+        vector_search.rule_filters(port="http")
+
+
+def test_request_filters(db, add_request):
+    web = add_request("web", ["10.0.0.1"], ["10.1.0.10"], ["80", "443"])
+    add_request("dns", ["10.0.0.1"], ["10.2.0.53"], ["udp/53"])
+    wide = add_request("wide", ["10.0.0.1"], ["10.3.0.0/16"], ["1-65535"])
+    assert matching(db, Request, vector_search.request_filters(port="443")) == {web, wide}
+    assert matching(db, Request, vector_search.request_filters(status="pending", port="53")) == matching(
+        db, Request, vector_search.request_filters(port="udp/53")
+    )
+    assert matching(db, Request, vector_search.request_filters(status="completed")) == set()
+
+
+@pytest.mark.parametrize("mode", ["exact", "halfvec", "binary", "matryoshka"])
+def test_filtered_nearest_returns_only_matching_rows(db, rules, mode):
+    query = db.get(PhysicalRule, rules["named"]).embedding
+    filters = vector_search.rule_filters(port="443")
+    rows = vector_search.nearest(db, PhysicalRule, list(query), 10, mode, threshold=0.0, filters=filters)
+    assert {rule.rule_id for rule, _ in rows} == {rules[n] for n in ("any", "well-known", "tcp", "https")}
+    distances = [distance for _, distance in rows]
+    assert distances == sorted(distances)
+
+
+def test_search_endpoint_applies_port_filter(client, rules):
+    response = client.post("/api/semantic-search/by-text", json={
+        "query": "allow 10.0.0.0/24 to 10.1.0.10 on 8080", "search_in": "rules", "threshold": 0.0, "port": "8080",
+    })
+    assert response.status_code == 200, response.text
+    assert {m["rule_id"] for m in response.json()["matches"]} == {rules["any"], rules["alt"]}
+
+
+def test_search_endpoint_rejects_unparseable_port(client):
+    response = client.post("/api/semantic-search/by-text", json={"query": "web", "port": "https"})
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import text
+
+from app.services import review_state, sharded_review_service
+
+
+@pytest.fixture
+def reviewed(add_request, add_rule, embed_all):
+    add_request("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    add_request("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+    add_request("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["2222"])
+    add_request("dup", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    add_rule("web", ["10.0.0.0/25", "10.0.0.128/25"], ["10.1.0.10"], ["tcp/443"], firewall_device="fw-1")
+    add_rule("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53", "853"], firewall_device="fw-2")
+    add_rule("ntp", ["10.0.0.0/24"], ["10.4.0.123"], ["123"], firewall_device="fw-2")
+    add_rule("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["2222"], firewall_device="fw-3")
+    embed_all()
+
+
+def results(db, table, columns):
+    rows = sorted(db.execute(text(f"SELECT {columns} FROM {table}")).all(), key=repr)
+    db.rollback()
+    return rows
+
+
+@pytest.mark.parametrize("shard_by", sharded_review_service.SHARD_BY)
+def test_sharded_exact_review_matches_run_review(client, db, reviewed, shard_by):
+    response = client.post("/api/review/run")
+    assert response.status_code == 200, response.text
+    expected = results(db, "deficiencies", "type, rule_id, request_id")
+    db.execute(text("UPDATE physical_rules SET reviewed_fingerprint = NULL"))
+    db.commit()
+
+    result = sharded_review_service.run_sharded_review(workers=2, shards=3, shard_by=shard_by)
+    assert results(db, "deficiencies", "type, rule_id, request_id") == expected
+    summary = response.json()["summary"]
+    assert {k: result["summary"][k] for k in summary} == summary
+    assert sum(shard["rows"] for shard in result["shards"]) == 4
+    stale = db.scalar(text("""
+        SELECT count(*) FROM physical_rules p JOIN physical_rules_view v USING (rule_id)
+        WHERE p.reviewed_fingerprint IS DISTINCT FROM v.fingerprint
+    """))
+    assert stale == 0
+    run = db.execute(text("SELECT review_type, mode, deficiencies_retired FROM review_runs ORDER BY run_id DESC")).first()
+    assert tuple(run) == (review_state.REVIEW_EXACT, review_state.MODE_FULL, len(expected))
+
+
+def test_sharded_semantic_review_matches_run_semantic_review(client, db, reviewed):
+    response = client.post("/api/review/run-semantic?threshold=0.9")
+    assert response.status_code == 200, response.text
+    columns = "type, rule_id, request_id, best_match_rule_id, best_match_request_id, round(similarity_score::numeric, 4)"
+    expected = results(db, "semantic_deficiencies", columns)
+    expected_matches = results(db, "semantic_matches", "rule_id, request_id, match_type, threshold_used")
+
+    result = sharded_review_service.run_sharded_review(review_state.REVIEW_SEMANTIC, workers=2, shards=2, threshold=0.9)
+    assert results(db, "semantic_deficiencies", columns) == expected
+    assert results(db, "semantic_matches", "rule_id, request_id, match_type, threshold_used") == expected_matches
+    summary = response.json()["summary"]
+    assert {k: result["summary"][k] for k in summary} == summary
+    assert expected and expected_matches
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import select, text
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.services import similarity_engine
+
+
+def unit_rows(rng, count, dims=16):
+    rows = rng.standard_normal((count, dims)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("queries, targets, k, block_size, threads", [
+    (37, 53, 1, 8, 1),
+    (37, 53, 5, 8, 3),
+    (37, 53, 5, 1000, 1),
+    (10, 3, 5, 2, 2),
+    (64, 64, 64, 16, 4),
+])
+def test_top_k_matches_brute_force(queries, targets, k, block_size, threads):
+    rng = np.random.default_rng(queries * targets + k)
+    q, t = unit_rows(rng, queries), unit_rows(rng, targets)
+    idx, scores = similarity_engine.top_k(q, t, k, block_size=block_size, threads=threads)
+
+    sims = q @ t.T
+    expected = np.argsort(-sims, axis=1, kind="stable")[:, :min(k, targets)]
+    assert idx.shape == scores.shape == expected.shape
+    np.testing.assert_array_equal(idx, expected)
+    np.testing.assert_allclose(scores, np.take_along_axis(sims, expected, axis=1), rtol=1e-6, atol=1e-6)
+
+
+def test_top_k_without_targets():
+    idx, scores = similarity_engine.top_k(unit_rows(np.random.default_rng(0), 4), np.empty((0, 16), np.float32), 3)
+    assert idx.shape == scores.shape == (4, 0)
+
+
+def test_copy_embeddings_reads_the_normalized_table(db, add_rule, embed_all):
+    for i in range(5):
+        add_rule(f"r{i}", [f"10.0.{i}.0/24"], ["10.1.0.1"], [str(1000 + i)])
+    add_rule("unembedded", ["10.9.0.0/24"], ["10.1.0.1"], ["22"])
+    embed_all()
+    db.execute(text("UPDATE physical_rules SET embedding = NULL WHERE rule_name = 'unembedded'"))
+    db.commit()
+
+    matrix = similarity_engine.copy_embeddings(db, PhysicalRule, None)
+    rows = db.execute(
+        select(PhysicalRule.rule_id, PhysicalRule.embedding)
+        .where(PhysicalRule.embedding.isnot(None)).order_by(PhysicalRule.rule_id)
+    ).all()
+    assert matrix.ids.tolist() == [rule_id for rule_id, _ in rows]
+    expected = np.array([embedding for _, embedding in rows], np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(matrix.vectors, expected, rtol=1e-6, atol=1e-6)
+
+
+def test_matrix_cache_follows_embedding_writes(db, tmp_path, monkeypatch, add_rule, embed_all):
+    monkeypatch.setattr(settings, "SIMILARITY_CACHE_DIR", str(tmp_path))
+    add_rule("a", ["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    embed_all()
+    first = similarity_engine.load_embeddings(db, PhysicalRule)
+    cached = sorted(os.listdir(tmp_path))
+    assert len(cached) == 2
+    assert similarity_engine.load_embeddings(db, PhysicalRule).ids.tolist() == first.ids.tolist()
+    assert sorted(os.listdir(tmp_path)) == cached
+    db.rollback()
+
+    add_rule("b", ["10.0.1.0/24"], ["10.1.0.1"], ["443"])
+    embed_all()
+    second = similarity_engine.load_embeddings(db, PhysicalRule)
+    assert len(second.ids) == 2
+    assert sorted(os.listdir(tmp_path)) != cached
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_numpy_engine_records_the_pgvector_deficiencies(client, db, add_request, add_rule, embed_all):
+    add_request("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    add_request("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53", "853"])
+    add_request("ssh", ["192.168.7.0/24"], ["10.3.0.22"], ["2222"])
+    add_rule("web", ["10.0.0.0/24"], ["10.1.0.10"], ["443"])
+    add_rule("dns", ["10.0.0.0/24"], ["10.2.0.53"], ["53"])
+    add_rule("ntp", ["10.0.0.0/24"], ["10.4.0.123"], ["123"])
+    embed_all()
+
+    def rows():
+        result = db.execute(text("""
+            SELECT type, rule_id, request_id, best_match_rule_id, best_match_request_id,
+                   round(similarity_score::numeric, 4)
+            FROM semantic_deficiencies
+        """)).all()
+        db.rollback()
+        return sorted(result, key=repr)
+
+    assert client.post("/api/review/run-semantic?threshold=0.99&engine=pgvector").status_code == 200
+    expected = rows()
+    assert client.post("/api/review/run-semantic?threshold=0.99&engine=numpy").status_code == 200
+    assert rows() == expected
+    assert expected
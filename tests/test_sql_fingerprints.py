@@ -0,0 +1,87 @@
+import hashlib
+import json
+
+import pytest
+from sqlalchemy import text
+
+from app.services import address_canon
+
+ADDRESS_LISTS = [
+    [],
+    ["10.0.10.0/24"],
+    ["10.0.10.0-10.0.10.255"],
+    ["10.0.10.0/25", "10.0.10.128/25"],
+    ["10.0.10.77/24", "10.0.11.0"],
+    [" 10.0.0.1 - 10.0.0.9 ", "10.0.0.10"],
+    ["any"],
+    [" ALL ", "10.0.0.1"],
+    ["0.0.0.0/0"],
+    ["10.0.0.0/024"],
+    ["10.0.0.256", "10.0.0.0/33", "10.0.0.9-10.0.0.1"],
+    ["Web-Servers", "db", "web-servers", "10.0.0.1"],
+]
+PORT_LISTS = [
+    [],
+    ["443"],
+    ["tcp/443", "UDP/443"],
+    ["80", "81", "82"],
+    ["8000 - 9000", "8500"],
+    ["any"],
+    ["0", "65535"],
+    ["65536", "90-80", "http", "HTTPS"],
+]
+
+
+def sql_canon(canonical: address_canon.Canonical) -> str:
+    """The text address_set_canon / port_set_canon return for a Python canonical form."""
+    intervals, tokens = canonical
+    return "{" + ",".join(f"[{lo},{hi + 1})" for lo, hi in intervals) + "}|" + ",".join(tokens)
+
+
+@pytest.mark.parametrize("addresses", ADDRESS_LISTS)
+def test_address_canon_matches_python(db, addresses):
+    value = db.execute(text("SELECT address_set_canon(CAST(:a AS text[]))"), {"a": addresses}).scalar()
+    assert value == sql_canon(address_canon.canonical_addresses(addresses))
+
+
+@pytest.mark.parametrize("ports", PORT_LISTS)
+def test_port_canon_matches_python(db, ports):
+    value = db.execute(text("SELECT port_set_canon(CAST(:p AS text[]))"), {"p": ports}).scalar()
+    assert value == sql_canon(address_canon.canonical_ports(ports))
+
+
+def test_request_fingerprint_matches_access_fingerprint(db):
+    sources, destinations, ports = ["10.0.10.0/24", "db"], ["10.1.0.1"], ["tcp/443", "80-81"]
+    canonical = address_canon.fingerprint(sources, destinations, ports)
+    expected = hashlib.md5("/".join(sql_canon(part) for part in canonical).encode()).hexdigest()
+    assert db.execute(
+        text("SELECT access_fingerprint(CAST(:s AS text[]), CAST(:d AS text[]), CAST(:p AS text[]))"),
+        {"s": sources, "d": destinations, "p": ports},
+    ).scalar() == expected
+    assert db.execute(
+        text("SELECT request_fingerprint(CAST(:r AS jsonb))"),
+        {"r": json.dumps({"sources": sources, "destinations": destinations, "ports": ports})},
+    ).scalar() == expected
+
+
+def test_sql_review_records_the_python_review_deficiencies(client, db, add_request, add_rule):
+    add_request("net", ["10.0.10.0/24"], ["10.1.0.1"], ["443"])
+    add_request("range", ["10.0.20.0-10.0.20.255"], ["10.1.0.1"], ["80", "81", "82"])
+    add_request("named", ["web"], ["10.1.0.1"], ["http"])
+    add_request("unmatched", ["10.9.0.0/16"], ["10.1.0.1"], ["22"])
+    add_rule("halves", ["10.0.10.0/25", "10.0.10.128/25"], ["10.1.0.1/32"], ["tcp/443"])
+    add_rule("cidr", ["10.0.20.0/24"], ["10.1.0.1"], ["80-82"])
+    add_rule("named", ["WEB"], ["10.1.0.1"], ["HTTP"])
+    add_rule("wider", ["10.0.0.0/8"], ["10.1.0.1"], ["22"])
+
+    def deficiencies():
+        return sorted(db.execute(text("SELECT type, rule_id, request_id FROM deficiencies")).all(), key=repr)
+
+    python = client.post("/api/review/run")
+    assert python.status_code == 200, python.text
+    expected = deficiencies()
+    db.rollback()
+    sql = client.post("/api/review/run-sql")
+    assert sql.status_code == 200, sql.text
+    assert deficiencies() == expected
+    assert [row.type for row in expected] == ["no_matching_request", "no_matching_rule"]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import embedding_service
+from app.services.structural_encoder import ROLE_DESTINATION, ROLE_SOURCE, StructuralEncoder, parse_text
+
+
+def rule_text(sources, destinations, ports, name="r"):
+    return embedding_service.build_rule_text(name, "allow", sources, destinations, ports)
+
+
+def similarity(a: str, b: str) -> float:
+    vectors = StructuralEncoder().encode([a, b])
+    return float(vectors[0] @ vectors[1])
+
+
+def test_vectors_are_deterministic_unit_vectors():
+    texts = [rule_text(["10.0.0.0/24"], ["10.1.0.1"], ["443"]), "anything at all", ""]
+    first = StructuralEncoder().encode(texts)
+    assert first.shape == (3, settings.EMBEDDING_DIMENSIONS)
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, rtol=1e-6)
+    np.testing.assert_array_equal(first, StructuralEncoder().encode(texts))
+    # A batch encodes each text as on its own
+    np.testing.assert_allclose(first[0], StructuralEncoder().encode(texts[:1])[0], rtol=1e-6)
+
+
+def test_rule_texts_are_split_by_role():
+    addresses, ports = parse_text(rule_text(["10.0.0.0/31"], ["10.1.0.1"], ["80", "8000-8001"]))
+    assert sorted(addresses) == [(ROLE_SOURCE, 0x0A000000, 0x0A000001), (ROLE_DESTINATION, 0x0A010001, 0x0A010001)]
+    assert ports == {(80, 80), (8000, 8001)}
+
+
+def test_free_text_addresses_have_no_role():
+    addresses, ports = parse_text("allow 10.0.0.0/24 to 10.1.0.10 on ports 443 and 8080")
+    assert {role for role, _, _ in addresses} == {0}
+    assert ports == {(443, 443), (8080, 8080)}
+
+
+def test_equivalent_notations_embed_identically():
+    a = rule_text(["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    b = rule_text(["10.0.0.0-10.0.0.255"], ["10.1.0.1/32"], ["443"])
+    assert similarity(a, b) == pytest.approx(1.0, abs=1e-6)
+
+
+def test_nearby_space_is_more_similar_than_unrelated_space():
+    base = rule_text(["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    assert similarity(base, rule_text(["10.0.0.0/25"], ["10.1.0.1"], ["443"])) > similarity(
+        base, rule_text(["192.168.5.0/24"], ["10.1.0.1"], ["443"])
+    )
+    assert similarity(base, rule_text(["10.0.0.0/24"], ["10.1.0.1"], ["443", "444"])) > similarity(
+        base, rule_text(["10.0.0.0/24"], ["10.1.0.1"], ["22"])
+    )
+    # Swapping source and destination changes the rule
+    assert similarity(base, rule_text(["10.1.0.1"], ["10.0.0.0/24"], ["443"])) < 0.9
+
+
+def test_truncated_vectors_keep_the_neighbourhood():
+    base = rule_text(["10.0.0.0/24"], ["10.1.0.1"], ["443"])
+    near = rule_text(["10.0.0.0/25"], ["10.1.0.1"], ["443"])
+    far = rule_text(["192.168.5.0/24"], ["172.16.0.1"], ["22"])
+    short = [np.array(embedding_service.truncate_embedding(v)) for v in StructuralEncoder().encode([base, near, far])]
+    assert short[0] @ short[1] > short[0] @ short[2]
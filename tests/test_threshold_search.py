@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.models.physical_rule import PhysicalRule
+from app.services import local_ann_index, vector_search
+
+LIMIT = 20
+
+
+@pytest.fixture
+def rules(db, sync_rules, embed_all):
+    # 240 rules, 25 of them on a small device
+    for device, indices in (("fw-big", range(215)), ("fw-small", range(215, 240))):
+        sync_rules(device, [
+            {"rule_name": f"r{i}", "sources": [f"10.{i % 7}.{i}.0/24"], "destinations": [f"10.1.0.{i % 50}"],
+             "ports": [str(1000 + i % 13)]}
+            for i in indices
+        ])
+    embed_all()
+    rows = db.execute(
+        select(PhysicalRule.rule_id, PhysicalRule.firewall_device, PhysicalRule.embedding).order_by(PhysicalRule.rule_id)
+    ).all()
+    db.rollback()
+    return rows
+
+
+@pytest.fixture
+def local_index(db, rules, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_ANN_DIR", str(tmp_path))
+    # One list of a few rows per search unless the threshold asks for more
+    monkeypatch.setattr(settings, "LOCAL_ANN_PROBES", 1)
+    monkeypatch.setattr(local_ann_index, "_indexes", {})
+    local_ann_index.build(db, PhysicalRule)
+
+
+def similarities(rules, query) -> dict[int, float]:
+    vectors = np.array([embedding for _, _, embedding in rules], np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return dict(zip([rule_id for rule_id, _, _ in rules], (vectors @ (query / np.linalg.norm(query))).tolist()))
+
+
+def threshold_admitting(sims: dict[int, float], count: int) -> float:
+    """A threshold exactly `count` rows reach."""
+    ranked = sorted(sims.values(), reverse=True)
+    return (ranked[count - 1] + ranked[count]) / 2
+
+
+@pytest.mark.parametrize("mode", vector_search.SEARCH_MODES)
+def test_thresholded_search_fills_the_limit(db, rules, local_index, mode):
+    query = np.asarray(rules[0][2], np.float32)
+    sims = similarities(rules, query)
+    threshold = threshold_admitting(sims, 30)
+    rows = vector_search.nearest(db, PhysicalRule, list(query), LIMIT, mode, threshold=threshold)
+    assert len(rows) == LIMIT
+    assert all(1.0 - distance >= threshold for _, distance in rows)
+    if mode == "exact":
+        # Compared by score: structurally similar rules tie
+        expected = sorted(sims.values(), reverse=True)[:LIMIT]
+        assert [1.0 - distance for _, distance in rows] == pytest.approx(expected, abs=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["exact", "local"])
+def test_thresholded_search_returns_every_qualifying_row(db, rules, local_index, mode):
+    query = np.asarray(rules[0][2], np.float32)
+    sims = similarities(rules, query)
+    threshold = threshold_admitting(sims, 12)
+    rows = vector_search.nearest(db, PhysicalRule, list(query), LIMIT, mode, threshold=threshold)
+    assert {rule.rule_id for rule, _ in rows} == {rule_id for rule_id, sim in sims.items() if sim >= threshold}
+
+
+@pytest.mark.parametrize("mode", vector_search.SEARCH_MODES)
+def test_filtered_search_is_not_short(db, rules, local_index, mode):
+    query = np.asarray(rules[0][2], np.float32)
+    small = [rule for rule in rules if rule[1] == "fw-small"]
+    sims = similarities(small, query)
+    filters = vector_search.rule_filters(firewall_device="fw-small")
+    rows = vector_search.nearest(db, PhysicalRule, list(query), LIMIT, mode, threshold=-1.0, filters=filters)
+    assert len(rows) == LIMIT
+    assert {rule.firewall_device for rule, _ in rows} == {"fw-small"}
+    if mode == "exact":
+        expected = sorted(sims.values(), reverse=True)[:LIMIT]
+        assert [1.0 - distance for _, distance in rows] == pytest.approx(expected, abs=1e-5)